@@ -0,0 +1,58 @@
+"""
+apps/core/cache.py · поколения кэшей и их сброс по сигналам моделей
+
+Ключ записи кэша включает «поколение» данных. Сигналы сохранения/удаления
+и bulk_changed (invalidate_on_change) сдвигают поколение после коммита,
+поэтому старые записи становятся недостижимы сразу после записи в
+источники — без перебора ключей. Поколение инициализируется
+time.time_ns(): если счётчик вытеснен из кэша, новое значение не совпадёт
+ни с одним из прежних.
+
+Работает с любым бэкендом Django (LocMemCache, FileBasedCache, …). Для
+нескольких процессов WSGI нужен общий бэкенд (FileBasedCache), иначе
+у каждого процесса будет своё поколение.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .signals import bulk_changed
+
+
+def incr(key: str, initial: int) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:                 # ключа ещё нет (или вытеснен)
+        cache.add(key, initial, None)
+
+
+def generation(key: str) -> int:
+    gen = cache.get(key)
+    if gen is None:
+        cache.add(key, time.time_ns(), None)
+        gen = cache.get(key)
+    return gen
+
+
+def bump(key: str) -> None:
+    """Сдвигает поколение key — записи под прежним поколением недостижимы."""
+    incr(key, time.time_ns())
+
+
+def invalidate_on_change(callback, models, uid: str) -> None:
+    """
+    Вызывает callback() после коммита любого save()/delete() или
+    bulk_changed моделей models. uid — префикс dispatch_uid подписки.
+    """
+    def receiver(sender, **kwargs):
+        # после коммита: иначе параллельный запрос успеет закэшировать
+        # ещё не зафиксированное состояние под новым поколением
+        transaction.on_commit(callback)
+
+    for model in models:
+        label = model._meta.label_lower
+        post_save.connect(receiver, sender=model, weak=False, dispatch_uid=f"{uid}-save-{label}")
+        post_delete.connect(receiver, sender=model, weak=False, dispatch_uid=f"{uid}-delete-{label}")
+        bulk_changed.connect(receiver, sender=model, weak=False, dispatch_uid=f"{uid}-bulk-{label}")
@@ -0,0 +1,174 @@
+"""
+Замер времени ответа и числа SQL-запросов ключевых эндпоинтов:
+
+    python manage.py generate_fleet
+    python manage.py benchmark_api --runs 5 --output bench-v1.json
+    ... (новая версия) ...
+    python manage.py benchmark_api --runs 5 --output bench-v2.json --compare bench-v1.json
+
+Запросы выполняются через APIClient внутри процесса (без сети); запись
+(создание ремонта) откатывается. Результат — JSON, пригодный для сравнения.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.deviations.models import Deviation
+from apps.refdata.models import DredgerTypePart
+from apps.repairs.models import ComponentInstance, Dredger, Repair, RepairItem
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Измеряет задержку и число SQL-запросов API (результат в JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--output", help="файл для JSON (по умолчанию stdout)")
+        parser.add_argument("--compare", help="JSON предыдущего замера для сравнения")
+        parser.add_argument("--only", nargs="*", help="имена сценариев")
+
+    def handle(self, *args, runs, output, compare, only, **options):
+        dredger = (Dredger.objects.filter(components__isnull=False)
+                   .order_by("-id").first())
+        if dredger is None:
+            raise CommandError("Нет землесосов с агрегатами — сначала manage.py generate_fleet")
+        user, _ = User.objects.get_or_create(username="benchmark", defaults={"is_staff": True})
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        results = {}
+        for name, method, url, payload in self.scenarios(dredger):
+            if only and name not in only:
+                continue
+            results[name] = self.measure(name, method, url, payload, runs)
+            r = results[name]
+            self.stderr.write(f"{name:28} {r['median_ms']:9.1f} ms  {r['queries']:5} q  {r['status']}")
+
+        report = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "git_rev":   self.git_rev(),
+                "python":    platform.python_version(),
+                "django":    django.get_version(),
+                "runs":      runs,
+                "dataset": {
+                    "dredgers":     Dredger.objects.count(),
+                    "components":   ComponentInstance.objects.count(),
+                    "repairs":      Repair.objects.count(),
+                    "repair_items": RepairItem.objects.count(),
+                    "deviations":   Deviation.objects.count(),
+                },
+            },
+            "results": results,
+        }
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if output:
+            with open(output, "w", encoding="utf-8") as fh:
+                fh.write(text)
+        else:
+            self.stdout.write(text)
+        if compare:
+            self.print_comparison(compare, results)
+
+    # ───────────────────────── сценарии ─────────────────────────
+    def scenarios(self, dredger):
+        part_ids = list(DredgerTypePart.objects.filter(dredger_type=dredger.type)
+                        .values_list("part_id", flat=True))
+        spare = (ComponentInstance.objects
+                 .filter(current_dredger__isnull=True, part_id__in=part_ids)
+                 .values_list("id", flat=True)[:40])
+        repair = {
+            "dredger_id": dredger.id,
+            "start_date": "2024-01-01",
+            "end_date":   "2024-01-05",
+            "notes":      "benchmark",
+            "items":      [{"component": c, "hours": 100} for c in spare],
+        }
+        ids = ",".join(map(str, part_ids))
+        return [
+            ("dashboard",            "get",  "/api/reports/dashboard/", None),
+            ("dashboard_cached",     "get",  "/api/reports/dashboard/", None),
+            ("repairs_excel",        "get",  "/api/reports/repairs_excel/", None),
+            ("deviations_excel",     "get",  "/api/reports/deviations_excel/", None),
+            ("repairs_list",         "get",  "/api/repairs/", None),
+            ("deviations_list",      "get",  "/api/deviations/", None),
+            ("template",             "get",  f"/api/dredgers/{dredger.id}/template/", None),
+            ("available_components", "get",  f"/api/available-components/?part_ids={ids}", None),
+            ("repair_create",        "post", "/api/repairs/", repair),
+        ]
+
+    def measure(self, name, method, url, payload, runs):
+        timings, queries, status, size = [], 0, None, 0
+        for _ in range(runs):
+            if name != "dashboard_cached":
+                cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                status, size = self.request(method, url, payload)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = len(ctx.captured_queries)
+        timings.sort()
+        return {
+            "url":       url,
+            "status":    status,
+            "bytes":     size,
+            "queries":   queries,
+            "min_ms":    round(timings[0], 2),
+            "median_ms": round(statistics.median(timings), 2),
+            "p95_ms":    round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+            "max_ms":    round(timings[-1], 2),
+        }
+
+    def request(self, method, url, payload):
+        if method == "get":
+            resp = self.client.get(url)
+            body = b"".join(resp.streaming_content) if resp.streaming else resp.content
+            return resp.status_code, len(body)
+        # запись выполняется и откатывается
+        result = None
+        try:
+            with transaction.atomic():
+                resp = self.client.post(url, payload, format="json")
+                result = (resp.status_code, len(resp.content))
+                raise _Rollback
+        except _Rollback:
+            pass
+        return result
+
+    # ───────────────────────── служебное ─────────────────────────
+    @staticmethod
+    def git_rev():
+        try:
+            return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def print_comparison(self, path, results):
+        with open(path, encoding="utf-8") as fh:
+            before = json.load(fh)["results"]
+        self.stderr.write(f"\n{'сценарий':28} {'было, ms':>10} {'стало, ms':>10} {'×':>6} {'запросы':>12}")
+        for name, now in results.items():
+            old = before.get(name)
+            if not old:
+                continue
+            ratio = now["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+            self.stderr.write(
+                f"{name:28} {old['median_ms']:10.1f} {now['median_ms']:10.1f} {ratio:6.2f} "
+                f"{old['queries']:>5} → {now['queries']:<5}"
+            )
@@ -0,0 +1,224 @@
+"""
+Синтетический парк для нагрузочных замеров:
+
+    python manage.py generate_fleet --dredgers 200 --deviations 200000
+    python manage.py generate_fleet --clear        # удалить ранее сгенерированное
+
+Все записи помечаются префиксом SYN- (коды, номера), чтобы их можно было
+удалить, не трогая настоящие данные. Вставка — bulk_create пачками,
+удаление журналов — DELETE без выборки строк; сигналы в обоих случаях не
+срабатывают, поэтому производные данные (wear_pct, свёртка отклонений,
+кэши дашборда и состава типов) обновляются явно в конце: rollup.rebuild()
+и по одному bulk_changed на модель.
+
+Ремонты — только нагрузка на журнал: позиции ссылаются на уже
+установленные агрегаты, замены не моделируются, поэтому записей
+ComponentHistory (source=repair) и интервалов ComponentInstallation по
+ремонтам нет. Журнал наработки и интервалы пишутся для самих агрегатов
+(установлены с начала периода), так что history, components?as_of и
+телеметрия согласованы с current_dredger и total_hours.
+"""
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.core.signals import bulk_changed
+from apps.deviations import rollup
+from apps.deviations.models import Deviation
+from apps.refdata.models import DredgerType, DredgerTypePart, SparePart
+from apps.repairs.models import (
+    ComponentHistory, ComponentInstallation, ComponentInstance, Dredger, Repair, RepairItem, wear_percent,
+)
+
+PREFIX = "SYN-"
+BATCH = 5000
+# модели, о массовом изменении которых сообщается подписчикам bulk_changed
+CHANGED = (DredgerType, SparePart, DredgerTypePart, Dredger, ComponentInstance, Repair, RepairItem, Deviation)
+
+
+def raw_delete(queryset) -> int:
+    """
+    DELETE … WHERE pk IN (<запрос>) одним запросом, без выборки строк, каскада
+    и сигналов pre/post_delete (QuerySet.delete() при подписчиках грузит и
+    обходит каждую строку). Зависимые записи удаляются вызывающим заранее.
+    """
+    meta = queryset.model._meta
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {qn(meta.db_table)} WHERE {qn(meta.pk.column)} IN ({sql})", params)
+        return cursor.rowcount
+
+
+class Command(BaseCommand):
+    help = "Генерирует синтетический парк землесосов (для бенчмарков)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--types", type=int, default=5)
+        parser.add_argument("--parts", type=int, default=200)
+        parser.add_argument("--parts-per-type", type=int, default=30)
+        parser.add_argument("--dredgers", type=int, default=200)
+        parser.add_argument("--components", type=int, default=10000,
+                            help="всего экземпляров (сначала комплектуются землесосы, остаток — склад)")
+        parser.add_argument("--history-per-component", type=int, default=3)
+        parser.add_argument("--repairs", type=int, default=10000)
+        parser.add_argument("--items-per-repair", type=int, default=3)
+        parser.add_argument("--deviations", type=int, default=100000)
+        parser.add_argument("--years", type=int, default=5, help="глубина журнала, лет")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--clear", action="store_true", help="удалить сгенерированные данные и выйти")
+
+    def handle(self, *args, **opts):
+        rnd = random.Random(opts["seed"])
+        with transaction.atomic():
+            self.clear()
+            if opts["clear"]:
+                message = "Синтетические данные удалены"
+            else:
+                user, _ = User.objects.get_or_create(username=f"{PREFIX.lower()}generator")
+                types, parts, bom = self.make_refdata(rnd, opts)
+                dredgers = Dredger.objects.bulk_create(
+                    [Dredger(inv_number=f"{PREFIX}{i:05}", type=rnd.choice(types))
+                     for i in range(opts["dredgers"])], batch_size=BATCH)
+                installed = self.make_components(rnd, opts, parts, bom, dredgers)
+                self.make_repairs(rnd, opts, user, dredgers, installed)
+                self.make_deviations(rnd, opts, user, dredgers)
+                message = (
+                    f"Создано: типов {len(types)}, запчастей {len(parts)}, землесосов {len(dredgers)}, "
+                    f"агрегатов {ComponentInstance.objects.filter(serial_number__startswith=PREFIX).count()}, "
+                    f"ремонтов {opts['repairs']}, отклонений {opts['deviations']}"
+                )
+
+        self.refresh_derived()
+        self.stdout.write(self.style.SUCCESS(message))
+
+    # ───────────────────────── шаги ─────────────────────────
+    def refresh_derived(self):
+        rollup.rebuild()
+        for model in CHANGED:
+            bulk_changed.send(sender=model)
+
+    def clear(self):
+        # журналы — без сигналов, от зависимых к главным; справочники и
+        # землесосы (сотни строк) — обычным delete() с каскадом
+        dredgers = Dredger.objects.filter(inv_number__startswith=PREFIX)
+        comps = ComponentInstance.objects.filter(serial_number__startswith=PREFIX)
+        repairs = Repair.objects.filter(dredger__in=dredgers)
+        raw_delete(Deviation.objects.filter(dredger__in=dredgers))
+        raw_delete(RepairItem.objects.filter(Q(component__in=comps) | Q(repair__in=repairs)))
+        raw_delete(ComponentHistory.objects.filter(Q(component__in=comps) | Q(repair__in=repairs)))
+        raw_delete(ComponentInstallation.objects.filter(Q(component__in=comps) | Q(repair__in=repairs)))
+        raw_delete(repairs)
+        raw_delete(comps)
+        dredgers.delete()
+        SparePart.objects.filter(code__startswith=PREFIX).delete()
+        DredgerType.objects.filter(code__startswith=PREFIX).delete()
+
+    def make_refdata(self, rnd, opts):
+        types = DredgerType.objects.bulk_create(
+            [DredgerType(name=f"{PREFIX}Тип {i}", code=f"{PREFIX}T{i}") for i in range(opts["types"])])
+        parts = SparePart.objects.bulk_create(
+            [SparePart(code=f"{PREFIX}P{i:05}", name=f"Агрегат {i}", manufacturer=f"Завод {i % 7}",
+                       norm_hours=rnd.choice([2000, 4000, 6000, 8000, 12000]))
+             for i in range(opts["parts"])], batch_size=BATCH)
+        bom = {t.id: rnd.sample(parts, min(opts["parts_per_type"], len(parts))) for t in types}
+        DredgerTypePart.objects.bulk_create(
+            [DredgerTypePart(dredger_type_id=t, part=p) for t, ps in bom.items() for p in ps],
+            batch_size=BATCH)
+        return types, parts, bom
+
+    def make_components(self, rnd, opts, parts, bom, dredgers):
+        comps = []
+        for d in dredgers:
+            for p in bom[d.type_id]:
+                if len(comps) >= opts["components"]:
+                    break
+                hours = rnd.randint(0, int(p.norm_hours * 1.1))
+                comps.append(ComponentInstance(
+                    part=p, current_dredger=d, total_hours=hours,
+                    wear_pct=wear_percent(hours, p.norm_hours),
+                    serial_number=f"{PREFIX}{len(comps):07}"))
+        while len(comps) < opts["components"]:
+            p = rnd.choice(parts)
+            hours = rnd.randint(0, p.norm_hours)
+            comps.append(ComponentInstance(
+                part=p, total_hours=hours, wear_pct=wear_percent(hours, p.norm_hours),
+                serial_number=f"{PREFIX}{len(comps):07}"))
+        comps = ComponentInstance.objects.bulk_create(comps, batch_size=BATCH)
+
+        # журнал наработки: равные шаги за --years лет, последний итог = total_hours
+        history = []
+        now = timezone.now()
+        span = timedelta(days=365 * opts["years"])
+        for c in comps:
+            steps = opts["history_per_component"] if c.current_dredger_id else 1
+            prev = 0
+            for k in range(1, steps + 1):
+                total = c.total_hours * k // steps
+                history.append(ComponentHistory(
+                    component=c, hours_delta=total - prev, total_hours=total,
+                    source=ComponentHistory.INITIAL if k == 1 else ComponentHistory.TELEMETRY,
+                    created_at=now - span * (steps - k) / steps))
+                prev = total
+        ComponentHistory.objects.bulk_create(history, batch_size=BATCH)
+        # установлены с начала периода (первой записи журнала)
+        ComponentInstallation.objects.bulk_create(
+            [ComponentInstallation(component=c, dredger_id=c.current_dredger_id, installed_at=now - span,
+                                   hours_installed=c.total_hours // opts["history_per_component"])
+             for c in comps if c.current_dredger_id],
+            batch_size=BATCH)
+
+        installed = {}
+        for c in comps:
+            if c.current_dredger_id:
+                installed.setdefault(c.current_dredger_id, []).append(c)
+        return installed
+
+    def make_repairs(self, rnd, opts, user, dredgers, installed):
+        start = date.today() - timedelta(days=365 * opts["years"])
+        span = 365 * opts["years"]
+        repairs = []
+        for _ in range(opts["repairs"]):
+            begin = start + timedelta(days=rnd.randint(0, span))
+            repairs.append(Repair(dredger=rnd.choice(dredgers), start_date=begin,
+                                  end_date=begin + timedelta(days=rnd.randint(0, 14)),
+                                  notes=rnd.choice(["", "плановый ремонт", "замена подшипника",
+                                                    "аварийный ремонт"]),
+                                  created_by=user, updated_by=user))
+        repairs = Repair.objects.bulk_create(repairs, batch_size=BATCH)
+
+        items = []
+        for r in repairs:
+            comps = installed.get(r.dredger_id)
+            if not comps:
+                continue
+            for c in rnd.sample(comps, min(opts["items_per_repair"], len(comps))):
+                items.append(RepairItem(repair=r, component=c, hours=rnd.randint(0, 5000)))
+        RepairItem.objects.bulk_create(items, batch_size=BATCH)
+
+    def make_deviations(self, rnd, opts, user, dredgers):
+        start = date.today() - timedelta(days=365 * opts["years"])
+        span = 365 * opts["years"]
+        types = [t for t, _ in Deviation.TYPE_CHOICES]
+        locations = [loc for loc, _ in Deviation.LOC_CHOICES]
+        batch = []
+        for i in range(opts["deviations"]):
+            day = start + timedelta(days=rnd.randint(0, span))
+            batch.append(Deviation(
+                dredger=rnd.choice(dredgers), date=day, type=rnd.choice(types),
+                location=rnd.choice(locations), last_ppr_date=day - timedelta(days=rnd.randint(1, 90)),
+                hours_at_deviation=rnd.randint(0, 50000),
+                description=rnd.choice(["подшипник перегрев", "течь сальника", "отключение питания",
+                                        "забивка всаса", "вибрация насоса"]),
+                shift_leader="Иванов", mechanic="Петров", electrician="Сидоров",
+                created_by=user, updated_by=user,
+            ))
+            if len(batch) >= BATCH:
+                Deviation.objects.bulk_create(batch)
+                batch = []
+        Deviation.objects.bulk_create(batch)
@@ -0,0 +1,36 @@
+"""
+Пересоздаёт полнотекстовые индексы журналов (FTS5) и заполняет их заново:
+
+    python manage.py rebuild_search_index
+    python manage.py rebuild_search_index deviations_deviation_fts
+
+Нужна после восстановления БД из копии без индексов и после миграций,
+пересоздающих таблицы журналов. См. apps/core/search.py.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.module_loading import autodiscover_modules
+
+from apps.core.search import SEARCH_INDEXES
+
+
+class Command(BaseCommand):
+    help = "Пересобирает полнотекстовые индексы журналов (SQLite FTS5)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("tables", nargs="*", help="таблицы индексов (по умолчанию — все)")
+
+    def handle(self, *args, tables, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Full-text indexes are only used with SQLite")
+        autodiscover_modules("search")            # индексы объявлены в <app>/search.py
+        unknown = set(tables) - SEARCH_INDEXES.keys()
+        if unknown:
+            raise CommandError(f"Unknown index: {', '.join(sorted(unknown))}")
+
+        for table in tables or sorted(SEARCH_INDEXES):
+            index = SEARCH_INDEXES[table]
+            with transaction.atomic():
+                index.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f"{table}: {index.model.objects.count()} записей"))
@@ -0,0 +1,217 @@
+"""
+apps/core/pagination.py · пагинация журналов
+
+Два режима на одном эндпоинте:
+    • по номерам страниц (по умолчанию, ?page=N) — прежний формат
+      {count, next, previous, results}; COUNT(*) берётся из кэша;
+    • по курсору (keyset) — включается явно: ?mode=cursor для первой
+      страницы, дальше ссылки next/previous несут ?cursor=…. Страница
+      выбирается условием WHERE (дата, id) < (последняя дата, последний id)
+      по составному индексу, без OFFSET и без COUNT(*). Общее число
+      записей — только по запросу (?count=1) и из кэша.
+
+У view задаётся keyset_fields = ("<поле даты>", "id"). Курсор работает для
+сортировки по этому полю (?ordering=<поле> / -<поле>, по умолчанию по
+убыванию); при другой ?ordering используются номера страниц.
+
+Кэш COUNT(*) сбрасывается записью в журналы: ключ включает поколение
+(apps/core/cache.py), которое сдвигают сигналы моделей из COUNTED_MODELS
+(track_counts(), вызывается из CoreConfig.ready).
+"""
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import cache as generations
+
+MAX_PAGE_SIZE = 200
+COUNT_GENERATION_KEY = "pagination:count:generation"
+# журналы и то, что пишет в них пакетами (запись в журнал наработки всегда
+# сопровождается сигналом агрегата или ремонта)
+COUNTED_MODELS = ("deviations.Deviation", "repairs.Repair", "repairs.RepairItem",
+                  "repairs.ComponentInstance", "repairs.ComponentHistory")
+
+
+def count_timeout() -> int:
+    return getattr(settings, "PAGINATION_COUNT_TIMEOUT", 60)
+
+
+def invalidate_counts() -> None:
+    generations.bump(COUNT_GENERATION_KEY)
+
+
+def track_counts() -> None:
+    models = [apps.get_model(label) for label in COUNTED_MODELS]
+    generations.invalidate_on_change(invalidate_counts, models, "pagination-count")
+
+
+def cached_count(queryset) -> int:
+    """
+    COUNT(*) с кэшированием по тексту SQL-запроса — до записи в журналы
+    (поколение) и не дольше count_timeout() секунд.
+    """
+    qs = queryset.order_by()
+    sql, params = qs.query.sql_with_params()
+    digest = hashlib.sha1(f"{sql}|{params!r}".encode()).hexdigest()
+    gen = generations.generation(COUNT_GENERATION_KEY)
+    key = f"pagination:count:{gen}:{qs.model._meta.label_lower}:{digest}"
+    count = cache.get(key)
+    if count is None:
+        count = qs.count()
+        cache.set(key, count, count_timeout())
+    return count
+
+
+class CachedCountPaginator(DjangoPaginator):
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list)
+
+
+class JournalPageNumberPagination(PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
+    page_size_query_param = "page_size"
+    max_page_size = MAX_PAGE_SIZE
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self):
+        self.page_size = settings.REST_FRAMEWORK.get("PAGE_SIZE", 25)
+
+    # ── курсор: base64(json([значение поля, id, назад?])) ──
+    @staticmethod
+    def encode_cursor(values, reverse: bool) -> str:
+        payload = json.dumps([*(str(v) for v in values), int(reverse)])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request, fields):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None, False
+        try:
+            *values, reverse = json.loads(base64.urlsafe_b64decode(raw.encode()).decode())
+            if len(values) != len(fields):
+                raise ValueError
+            model_fields = [self.model._meta.get_field(f) for f in fields]
+            return [f.to_python(v) for f, v in zip(model_fields, values)], bool(reverse)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), MAX_PAGE_SIZE)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        self.fields = view.keyset_fields
+        self.descending = request.query_params.get("ordering", f"-{self.fields[0]}").startswith("-")
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, self.fields)
+
+        # при движении назад — обратный порядок, потом разворачиваем страницу
+        ascending = self.descending == reverse
+        qs = queryset.order_by(*(("" if ascending else "-") + f for f in self.fields))
+        if position is not None:
+            qs = qs.filter(self.after(position, "gt" if ascending else "lt"))
+        self.total = None
+        if request.query_params.get(self.count_query_param) in ("1", "true"):
+            self.total = cached_count(queryset)
+
+        rows = list(qs[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = rows
+        return rows
+
+    def after(self, position, op: str) -> Q:
+        """(f1, f2, …) op (v1, v2, …) — построчное сравнение кортежей через OR/AND."""
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            step = Q(**{f"{field}__{op}": position[i]})
+            for prev, value in zip(self.fields[:i], position):
+                step &= Q(**{prev: value})
+            condition |= step
+        return condition
+
+    def key(self, obj):
+        return [getattr(obj, f) for f in self.fields]
+
+    def link(self, obj, reverse: bool) -> str:
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, "page")
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(self.key(obj), reverse))
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return self.link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        return self.link(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        body = OrderedDict()
+        if self.total is not None:
+            body["count"] = self.total
+        body["next"] = self.get_next_link()
+        body["previous"] = self.get_previous_link()
+        body["results"] = data
+        return Response(body)
+
+
+class JournalPagination(BasePagination):
+    """
+    Номера страниц по умолчанию (JournalPageNumberPagination); курсор —
+    только по явному ?mode=cursor или ?cursor=…, если сортировка по
+    keyset-полю и нет поиска (?search= без ?ordering упорядочен по
+    релевантности, курсор по дате его сломал бы).
+    """
+    mode_query_param = "mode"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        ordering = params.get("ordering")
+        keyset_field = view.keyset_fields[0]
+        ranked = ordering is None and bool(params.get(api_settings.SEARCH_PARAM))
+        cursor = (params.get(self.mode_query_param) == "cursor"
+                  or KeysetPagination.cursor_query_param in params)
+        if (cursor and "page" not in params and not ranked
+                and ordering in (None, keyset_field, f"-{keyset_field}")):
+            self.delegate = KeysetPagination()
+        else:
+            self.delegate = JournalPageNumberPagination()
+        return self.delegate.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
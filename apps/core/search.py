@@ -0,0 +1,119 @@
+"""
+apps/core/search.py · полнотекстовый поиск по журналам (SQLite FTS5)
+
+Индекс — виртуальная таблица FTS5 с внешним содержимым (content=<таблица
+модели>): текст хранится только в самой модели, FTS5 держит инвертированный
+индекс. Синхронизацию выполняют триггеры AFTER INSERT/UPDATE/DELETE на
+таблице модели (fts_create_sql), поэтому индекс обновляется и при
+bulk_create / update(), которые идут в обход сигналов.
+
+Вьюха подключает индекс атрибутом search_index = SearchIndex(…);
+FullTextSearchFilter (вместо SearchFilter в DEFAULT_FILTER_BACKENDS)
+превращает ?search= в MATCH и упорядочивает результат по релевантности
+(bm25). Для вьюх без индекса и на других СУБД — обычный SearchFilter
+(LIKE по search_fields).
+
+Русская морфология: встроенных стеммеров для русского в FTS5 нет, поэтому
+у слов запроса отрезается окончание и ищется префикс —
+«подшипники» → подшипник* (найдёт «подшипника», «подшипником» …).
+
+Пересборка индексов: python manage.py rebuild_search_index
+"""
+import re
+
+from django.db import connection
+from rest_framework.filters import SearchFilter
+
+# индексы всех приложений: имя таблицы FTS → SearchIndex
+SEARCH_INDEXES: dict[str, "SearchIndex"] = {}
+
+# окончания — от длинных к коротким; отрезается одно, если остаётся ≥ MIN_STEM букв
+ENDINGS = sorted("""
+    иями ями ами ией ого его ому ему ыми ими ая яя ое ее ие ые ой ей ий ый ую юю
+    ов ев ам ям ах ях ом ем ию ью ия ья а я о е ы и у ю ь й
+""".split(), key=len, reverse=True)
+MIN_STEM = 4
+
+
+def fts_create_sql(table: str, content: str, columns: list[str]) -> list[str]:
+    """DDL индекса: виртуальная таблица, триггеры синхронизации и начальное заполнение."""
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    delete = f"INSERT INTO {table}({table}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    insert = f"INSERT INTO {table}(rowid, {cols}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE {table} USING fts5({cols}, content='{content}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER {table}_ai AFTER INSERT ON {content} BEGIN {insert} END",
+        f"CREATE TRIGGER {table}_ad AFTER DELETE ON {content} BEGIN {delete} END",
+        f"CREATE TRIGGER {table}_au AFTER UPDATE OF {cols} ON {content} BEGIN {delete} {insert} END",
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+    ]
+
+
+def fts_drop_sql(table: str) -> list[str]:
+    return [f"DROP TRIGGER IF EXISTS {table}_{suffix}" for suffix in ("ai", "ad", "au")] + [
+        f"DROP TABLE IF EXISTS {table}"]
+
+
+def stem(word: str) -> str:
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def match_query(terms: list[str]) -> str:
+    """Строка запроса FTS5: все слова обязательны, каждое — префикс основы."""
+    words = [w for term in terms for w in re.findall(r"\w+", term.lower())]
+    # кавычки — чтобы слова не разбирались как синтаксис FTS5 (AND, NEAR, «-» …)
+    return " ".join(f'"{stem(w)}"*' for w in words)
+
+
+class SearchIndex:
+    def __init__(self, table: str, model, columns: list[str]):
+        self.table = table
+        self.model = model
+        self.columns = columns
+        SEARCH_INDEXES[table] = self
+
+    def rebuild(self) -> None:
+        """
+        Пересоздаёт таблицу и триггеры и заполняет индекс заново. Нужна и после
+        миграций, пересоздающих таблицу модели (ALTER в SQLite — копия таблицы,
+        триггеры старой таблицы при этом теряются).
+        """
+        with connection.cursor() as cursor:
+            for sql in fts_drop_sql(self.table) + fts_create_sql(
+                    self.table, self.model._meta.db_table, self.columns):
+                cursor.execute(sql)
+
+    def search(self, queryset, terms: list[str]):
+        """
+        queryset, отфильтрованный MATCH и упорядоченный по релевантности
+        (search_rank — bm25, меньше = лучше); None — в запросе нет слов.
+        """
+        query = match_query(terms)
+        if not query:
+            return None
+        content = self.model._meta.db_table
+        return (queryset
+                .extra(tables=[self.table],
+                       where=[f"{self.table}.rowid = {content}.id", f"{self.table} MATCH %s"],
+                       params=[query],
+                       select={"search_rank": f"{self.table}.rank"})
+                .order_by("search_rank", "-pk"))
+
+
+class FullTextSearchFilter(SearchFilter):
+    """SearchFilter c FTS5: для вьюх с search_index на SQLite — MATCH и сортировка по рангу."""
+
+    def filter_queryset(self, request, queryset, view):
+        index = getattr(view, "search_index", None)
+        terms = self.get_search_terms(request)
+        if terms and index is not None and connection.vendor == "sqlite":
+            found = index.search(queryset, terms)
+            if found is not None:
+                return found
+        return super().filter_queryset(request, queryset, view)
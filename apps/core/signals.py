@@ -0,0 +1,9 @@
+"""
+Общие сигналы проекта.
+"""
+from django.dispatch import Signal
+
+# Массовая запись в обход save()/delete() (bulk_create, bulk_update, update()).
+# sender — класс модели. Отправляется теми, кто пишет пакетами, чтобы
+# подписчики post_save (кэши, сводки) не пропустили изменения.
+bulk_changed = Signal()
@@ -1,3 +1,201 @@
+import io
+import json
+from datetime import date, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.core.signals import bulk_changed
+from apps.deviations.models import Deviation, DeviationDailyCount
+from apps.refdata.models import DredgerType
+from apps.repairs.models import ComponentInstance, Dredger, Repair
+
+
+class SyntheticFleetCommandsTests(TestCase):
+    def generate(self, **opts):
+        defaults = dict(types=2, parts=10, parts_per_type=4, dredgers=3, components=20,
+                        repairs=5, deviations=30, stdout=io.StringIO())
+        call_command("generate_fleet", **{**defaults, **opts})
+
+    def test_generate_fleet_counts(self):
+        self.generate()
+        self.assertEqual(Dredger.objects.count(), 3)
+        self.assertEqual(ComponentInstance.objects.count(), 20)
+        self.assertEqual(ComponentInstance.objects.filter(current_dredger__isnull=False).count(), 12)
+        self.assertEqual(Repair.objects.count(), 5)
+        self.assertEqual(Deviation.objects.count(), 30)
+        self.assertEqual(sum(DeviationDailyCount.objects.values_list("count", flat=True)), 30)
+
+        # повторный запуск заменяет, а не дублирует синтетические данные
+        self.generate()
+        self.assertEqual(Dredger.objects.count(), 3)
+
+    def test_clear_deletes_without_per_row_signals(self):
+        self.generate(deviations=200, repairs=40)
+        real = Dredger.objects.create(inv_number="D-1", type=DredgerType.objects.create(name="ЗГМ", code="Z"))
+        with mock.patch("apps.deviations.rollup.bump") as bump, \
+                CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            self.generate(clear=True)
+        bump.assert_not_called()
+        # число запросов не растёт с объёмом журналов
+        self.assertLess(len(ctx.captured_queries), 40)
+        self.assertEqual(list(Dredger.objects.all()), [real])
+        self.assertFalse(Deviation.objects.exists() or Repair.objects.exists()
+                         or ComponentInstance.objects.exists() or DeviationDailyCount.objects.exists())
+
+    def test_benchmark_outputs_json(self):
+        self.generate()
+        out = io.StringIO()
+        call_command("benchmark_api", runs=1, only=["dashboard", "template", "repair_create"],
+                     stdout=out, stderr=io.StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report["results"]), {"dashboard", "template", "repair_create"})
+        self.assertEqual(report["results"]["template"]["status"], 200)
+        self.assertEqual(report["results"]["repair_create"]["status"], 201)
+        # созданный при замере ремонт откатывается
+        self.assertEqual(Repair.objects.count(), 5)
+
+
+class JournalPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer", is_staff=True)
+        dredger = Dredger.objects.create(inv_number="D-1", type=DredgerType.objects.create(name="ЗГМ", code="Z"))
+        # по несколько отклонений на дату — курсор должен различать их по id
+        Deviation.objects.bulk_create([
+            Deviation(dredger=dredger, date=date(2024, 1, 1) + timedelta(days=i // 3), type="mechanical",
+                      location="ПНС", last_ppr_date=date(2024, 1, 1), hours_at_deviation=i,
+                      description=f"#{i}", shift_leader="", mechanic="", electrician="",
+                      created_by=cls.user, updated_by=cls.user)
+            for i in range(23)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, key="next"):
+        seen, queries = [], []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            queries.append(len(ctx.captured_queries))
+            seen += [row["id"] for row in resp.data["results"]]
+            url = resp.data[key]
+        return seen, queries
+
+    def test_cursor_walks_journal_in_both_directions(self):
+        expected = list(Deviation.objects.order_by("-date", "-id").values_list("id", flat=True))
+        seen, queries = self.walk("/api/deviations/?mode=cursor&page_size=5")
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(set(queries)), 1)          # последняя страница не дороже первой
+
+        last = self.client.get("/api/deviations/", {"mode": "cursor", "page_size": 5, "ordering": "date"}).data
+        self.assertNotIn("count", last)
+        seen, _ = self.walk("/api/deviations/?mode=cursor&page_size=5&ordering=date")
+        self.assertEqual(seen, expected[::-1])
+
+        # назад от последней страницы
+        url, pages = "/api/deviations/?mode=cursor&page_size=5", []
+        while url:
+            resp = self.client.get(url).data
+            pages.append(resp)
+            url = resp["next"]
+        back, _ = self.walk(pages[-1]["previous"], key="previous")
+        self.assertEqual(back, [i for p in pages[-2::-1] for i in [r["id"] for r in p["results"]]])
+
+    def test_page_number_mode_and_cached_count(self):
+        resp = self.client.get("/api/deviations/", {"page": 3, "page_size": 10, "ordering": "-date"})
+        self.assertEqual((resp.data["count"], len(resp.data["results"])), (23, 3))
+        self.assertIn("page=2", resp.data["previous"])
+        resp = self.client.get("/api/deviations/", {"mode": "cursor", "count": 1})
+        self.assertEqual(resp.data["count"], 23)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/api/deviations/", {"mode": "cursor", "count": 1})
+        self.assertFalse(any("COUNT(" in q["sql"] for q in ctx.captured_queries))
+
+    def test_page_number_is_default(self):
+        resp = self.client.get("/api/deviations/", {"page_size": 10})
+        self.assertEqual((resp.data["count"], len(resp.data["results"])), (23, 10))
+        self.assertIn("page=2", resp.data["next"])
+        self.assertNotIn("cursor=", resp.data["next"])
+
+    def test_count_follows_writes(self):
+        self.assertEqual(self.client.get("/api/deviations/").data["count"], 23)
+        first = Deviation.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.client.get("/api/deviations/").data["count"], 22)
+        with self.captureOnCommitCallbacks(execute=True):
+            Deviation.objects.filter(description="#0").update(description="#0")
+            bulk_changed.send(sender=Deviation)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get("/api/deviations/").data["count"], 22)
+        self.assertTrue(any("COUNT(" in q["sql"] for q in ctx.captured_queries))
+
+
+class FullTextSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer", is_staff=True)
+        cls.dredger = Dredger.objects.create(inv_number="D-1", type=DredgerType.objects.create(name="ЗГМ", code="Z"))
+        texts = [("Перегрев подшипника насоса, замена подшипников", "Иванов"),
+                 ("Течь сальника", "Петров"),
+                 ("Подшипник шумит", "Сидоров"),
+                 ("Отключение питания", "Подшипникова")]
+        Deviation.objects.bulk_create([
+            Deviation(dredger=cls.dredger, date=date(2024, 1, 1), type="mechanical", location="ПНС",
+                      last_ppr_date=date(2024, 1, 1), hours_at_deviation=0, description=text,
+                      shift_leader=leader, mechanic="", electrician="",
+                      created_by=cls.user, updated_by=cls.user)
+            for text, leader in texts
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, url, term):
+        resp = self.client.get(url, {"search": term})
+        self.assertEqual(resp.status_code, 200)
+        return [row.get("description", row.get("notes")) for row in resp.data["results"]]
+
+    def test_stemmed_ranked_search_kept_in_sync_by_triggers(self):
+        found = self.search("/api/deviations/", "подшипники")
+        # два совпадения в одном описании ранжируются выше; ФИО тоже в индексе
+        self.assertEqual(found[0], "Перегрев подшипника насоса, замена подшипников")
+        self.assertEqual(len(found), 3)
+        self.assertEqual(self.search("/api/deviations/", "подшипник насоса"), [found[0]])
+        self.assertEqual(self.search("/api/deviations/", 'AND "NEAR'), [])
+
+        # update() и delete() в обход сигналов — индекс обновляют триггеры
+        Deviation.objects.filter(description="Течь сальника").update(description="Течь подшипника")
+        Deviation.objects.filter(description="Подшипник шумит").delete()
+        self.assertIn("Течь подшипника", self.search("/api/deviations/", "подшипник"))
+        self.assertNotIn("Подшипник шумит", self.search("/api/deviations/", "подшипник"))
+
+        Repair.objects.create(dredger=self.dredger, start_date=date(2024, 2, 1), end_date=date(2024, 2, 2),
+                              notes="замена подшипника", created_by=self.user, updated_by=self.user)
+        self.assertEqual(self.search("/api/repairs/", "подшипники"), ["замена подшипника"])
 
-# Create your tests here.
+    def test_rebuild_command(self):
+        # как после миграции, пересоздавшей таблицу: триггер потерян, индекс устарел
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER deviations_deviation_fts_au")
+        Deviation.objects.filter(shift_leader="Петров").update(description="Вибрация")
+        self.assertEqual(self.search("/api/deviations/", "вибрация"), [])
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        cache.clear()                  # COUNT(*) страницы закэширован пагинацией
+        self.assertEqual(self.search("/api/deviations/", "вибрация"), ["Вибрация"])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM sqlite_master WHERE name = 'deviations_deviation_fts_au'")
+            self.assertEqual(cursor.fetchone()[0], 1)
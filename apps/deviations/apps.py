@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DeviationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.deviations'
+
+    def ready(self):
+        from . import rollup  # noqa: F401  (сигналы свёртки)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.deviations.rollup import rebuild
+
+
+class Command(BaseCommand):
+    help = "Пересобирает дневную свёртку отклонений (DeviationDailyCount) из журнала"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, batch_size, **options):
+        rows = rebuild(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Строк свёртки: {rows}"))
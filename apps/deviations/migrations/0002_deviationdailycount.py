@@ -0,0 +1,56 @@
+# Generated by Django 4.2.9 on 2026-10-18 13:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_rollup(apps, schema_editor):
+    Deviation = apps.get_model("deviations", "Deviation")
+    DeviationDailyCount = apps.get_model("deviations", "DeviationDailyCount")
+    grouped = (Deviation.objects.order_by()
+               .values("date", "dredger_id", "type", "location")
+               .annotate(n=models.Count("id")))
+    DeviationDailyCount.objects.bulk_create(
+        [DeviationDailyCount(day=g["date"], dredger_id=g["dredger_id"], type=g["type"],
+                             location=g["location"], count=g["n"]) for g in grouped],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repairs', '0003_componentinstance_wear_pct'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('deviations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deviation',
+            name='created_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='%(class)s_created', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='deviation',
+            name='updated_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='%(class)s_updated', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='DeviationDailyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('type', models.CharField(choices=[('mechanical', 'механический'), ('electrical', 'электрический'), ('technological', 'технологический')], max_length=20)),
+                ('location', models.CharField(choices=[('ПНС', 'ПНС'), ('ТВС', 'ТВС'), ('ШХ', 'ШХ')], max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('dredger', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='repairs.dredger')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dredger', 'day'], name='deviations__dredger_7ca66f_idx'), models.Index(fields=['type', 'day'], name='deviations__type_bad90e_idx')],
+                'unique_together': {('day', 'dredger', 'type', 'location')},
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
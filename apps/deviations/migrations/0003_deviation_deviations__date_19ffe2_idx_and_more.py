@@ -0,0 +1,21 @@
+# Generated by Django 4.2.9 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviations', '0002_deviationdailycount'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deviation',
+            index=models.Index(fields=['date', 'id'], name='deviations__date_19ffe2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deviation',
+            index=models.Index(fields=['dredger', 'date', 'id'], name='deviations__dredger_afa357_idx'),
+        ),
+    ]
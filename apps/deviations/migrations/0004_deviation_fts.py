@@ -0,0 +1,31 @@
+from django.db import migrations
+
+from apps.core.search import fts_create_sql, fts_drop_sql
+
+TABLE = "deviations_deviation_fts"
+COLUMNS = ["description", "shift_leader", "mechanic", "electrician"]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in fts_create_sql(TABLE, "deviations_deviation", COLUMNS):
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in fts_drop_sql(TABLE):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviations', '0003_deviation_deviations__date_19ffe2_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
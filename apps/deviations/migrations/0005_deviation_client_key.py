@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-18 13:53
+
+from django.db import migrations, models
+
+from apps.core.search import fts_create_sql, fts_drop_sql
+
+FTS_TABLE = "deviations_deviation_fts"
+FTS_COLUMNS = ["description", "shift_leader", "mechanic", "electrician"]
+
+
+def recreate_search_index(apps, schema_editor):
+    # SQLite добавляет уникальное поле пересозданием таблицы — триггеры FTS теряются
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in fts_drop_sql(FTS_TABLE) + fts_create_sql(FTS_TABLE, "deviations_deviation", FTS_COLUMNS):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviations', '0004_deviation_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deviation',
+            name='client_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(recreate_search_index, migrations.RunPython.noop),
+    ]
@@ -29,6 +29,38 @@ class Deviation(AuditMixin):
     shift_leader = models.CharField(max_length=120)
     mechanic = models.CharField(max_length=120)
     electrician = models.CharField(max_length=120)
+    # ключ идемпотентности, сгенерированный клиентом (офлайн-ввод, /deviations/sync/)
+    client_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
+    class Meta(AuditMixin.Meta):
+        indexes = [
+            # курсорная пагинация журнала: (date, id), в т.ч. с фильтром по землесосу
+            models.Index(fields=["date", "id"]),
+            models.Index(fields=["dredger", "date", "id"]),
+        ]
 
     def __str__(self):
         return f"{self.get_type_display()} простой {self.dredger.inv_number} · {self.date}"
+
+
+class DeviationDailyCount(models.Model):
+    """
+    Свёртка журнала: число отклонений за день по землесосу/виду/участку.
+    Поддерживается сигналами Deviation (apps/deviations/rollup.py),
+    полностью пересобирается командой rebuild_deviation_rollup.
+    """
+    day = models.DateField()
+    dredger = models.ForeignKey(Dredger, on_delete=models.CASCADE, related_name="+")
+    type = models.CharField(max_length=20, choices=Deviation.TYPE_CHOICES)
+    location = models.CharField(max_length=10, choices=Deviation.LOC_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("day", "dredger", "type", "location")
+        indexes = [
+            models.Index(fields=["dredger", "day"]),
+            models.Index(fields=["type", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.day} · {self.dredger_id} · {self.type}/{self.location}: {self.count}"
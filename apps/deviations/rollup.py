@@ -0,0 +1,120 @@
+"""
+apps/deviations/rollup.py · инкрементальная поддержка DeviationDailyCount
+
+Сигналы отслеживают одиночные save()/delete(). Массовые пути
+(bulk_create, update) должны вызывать add_deviations()/bump() сами.
+"""
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_
+from typing import Iterable
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Deviation, DeviationDailyCount
+
+KEY_FIELDS = ("date", "dredger_id", "type", "location")
+ROLLUP_FIELDS = ("day", "dredger_id", "type", "location")      # те же поля в DeviationDailyCount
+# пар (землесос, день) в одном запросе existing (лимит параметров SQLite)
+LOOKUP_CHUNK = 500
+
+
+def rollup_key(dev) -> tuple:
+    return tuple(getattr(dev, f) for f in KEY_FIELDS)
+
+
+def bump(key: tuple, delta: int) -> None:
+    day, dredger_id, type_, location = key
+    lookup = dict(day=day, dredger_id=dredger_id, type=type_, location=location)
+    rows = DeviationDailyCount.objects.filter(**lookup)
+    if delta > 0:
+        if not rows.update(count=F("count") + delta):
+            try:
+                with transaction.atomic():
+                    DeviationDailyCount.objects.create(**lookup, count=delta)
+            except IntegrityError:
+                # строку между UPDATE и INSERT создал параллельный запрос
+                rows.update(count=F("count") + delta)
+    elif delta < 0:
+        rows.update(count=F("count") + delta)
+        rows.filter(count__lte=0).delete()
+
+
+def add_deviations(deviations: Iterable[Deviation]) -> None:
+    """
+    Учитывает пачку новых отклонений (после bulk_create): существующие строки
+    читаются только по затронутым парам (землесос, день) — по запросу на
+    LOOKUP_CHUNK пар, — обновляются одним bulk_update с count = count + n,
+    новые ключи — один bulk_create.
+    """
+    counts = Counter(rollup_key(d) for d in deviations)
+    if not counts:
+        return
+    days = defaultdict(set)                 # землесос → дни
+    for day, dredger_id, *_ in counts:
+        days[dredger_id].add(day)
+    pairs = sorted((dredger_id, day) for dredger_id, ds in days.items() for day in ds)
+    existing = []
+    for i in range(0, len(pairs), LOOKUP_CHUNK):
+        chunk = defaultdict(list)
+        for dredger_id, day in pairs[i:i + LOOKUP_CHUNK]:
+            chunk[dredger_id].append(day)
+        existing += (DeviationDailyCount.objects
+                     .filter(reduce(or_, (Q(dredger_id=pk, day__in=ds) for pk, ds in chunk.items())))
+                     .only("id", *ROLLUP_FIELDS))
+    updated = []
+    for row in existing:
+        n = counts.pop((row.day, row.dredger_id, row.type, row.location), None)
+        if n:
+            row.count = F("count") + n
+            updated.append(row)
+    DeviationDailyCount.objects.bulk_update(updated, ["count"], batch_size=500)
+    DeviationDailyCount.objects.bulk_create([
+        DeviationDailyCount(day=day, dredger_id=dredger_id, type=type_, location=location, count=n)
+        for (day, dredger_id, type_, location), n in counts.items()
+    ], batch_size=5000)
+
+
+def rebuild(batch_size: int = 5000) -> int:
+    """Полная пересборка свёртки одним GROUP BY. Возвращает число строк."""
+    grouped = (Deviation.objects
+               .order_by()
+               .values("date", "dredger_id", "type", "location")
+               .annotate(n=Count("id")))
+    with transaction.atomic():
+        DeviationDailyCount.objects.all().delete()
+        rows = [DeviationDailyCount(day=g["date"], dredger_id=g["dredger_id"], type=g["type"],
+                                    location=g["location"], count=g["n"])
+                for g in grouped.iterator(chunk_size=batch_size)]
+        DeviationDailyCount.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+# ───────────────────────── сигналы ─────────────────────────
+@receiver(pre_save, sender=Deviation, dispatch_uid="deviation-rollup-pre-save")
+def remember_old_key(sender, instance, raw=False, **kwargs):
+    instance._rollup_old_key = None
+    if instance.pk and not raw:
+        instance._rollup_old_key = (Deviation.objects.filter(pk=instance.pk)
+                                    .values_list(*KEY_FIELDS).first())
+
+
+@receiver(post_save, sender=Deviation, dispatch_uid="deviation-rollup-post-save")
+def count_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_key = rollup_key(instance)
+    old_key = getattr(instance, "_rollup_old_key", None)
+    if created or old_key is None:
+        bump(new_key, 1)
+    elif old_key != new_key:
+        bump(old_key, -1)
+        bump(new_key, 1)
+
+
+@receiver(post_delete, sender=Deviation, dispatch_uid="deviation-rollup-post-delete")
+def count_deleted(sender, instance, **kwargs):
+    bump(rollup_key(instance), -1)
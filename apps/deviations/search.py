@@ -0,0 +1,8 @@
+"""Полнотекстовый индекс журнала отклонений (apps/core/search.py)."""
+from apps.core.search import SearchIndex
+from .models import Deviation
+
+deviation_index = SearchIndex(
+    "deviations_deviation_fts", Deviation,
+    ["description", "shift_leader", "mechanic", "electrician"],
+)
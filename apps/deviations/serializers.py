@@ -1,4 +1,7 @@
 from rest_framework import serializers
+
+from apps.repairs.models import Dredger
+from apps.repairs.serializers import PrefetchedPrimaryKeyRelatedField
 from .models import Deviation
 
 
@@ -11,3 +14,13 @@ class DeviationSerializer(serializers.ModelSerializer):
         model = Deviation
         fields = "__all__"
         read_only_fields = ("created_by", "created_at", "updated_by", "updated_at")
+
+
+class DeviationSyncSerializer(DeviationSerializer):
+    """
+    Запись офлайн-пакета (/deviations/sync/): обязательный client_key, землесос —
+    из заранее загруженного словаря (context["prefetched"]), без запроса на запись.
+    Уникальность client_key проверяет сам sync одним запросом на пакет.
+    """
+    dredger = PrefetchedPrimaryKeyRelatedField(queryset=Dredger.objects.all())
+    client_key = serializers.CharField(max_length=64)
@@ -1,3 +1,171 @@
+import io
+from datetime import date
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.refdata.models import DredgerType
+from apps.repairs.models import Dredger
+from . import rollup
+from .models import Deviation, DeviationDailyCount
+
+
+class DeviationSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer", is_staff=True)
+        dtype = DredgerType.objects.create(name="ЗГМ", code="ZGM")
+        cls.dredgers = [Dredger.objects.create(inv_number=f"D-{i}", type=dtype) for i in range(3)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def entry(self, key, dredger=None, **extra):
+        return {"client_key": key, "dredger": (dredger or self.dredgers[0]).id, "date": "2024-05-01",
+                "type": "mechanical", "location": "ПНС", "last_ppr_date": "2024-04-01",
+                "hours_at_deviation": 10, "description": "течь сальника",
+                "shift_leader": "Иванов", "mechanic": "Петров", "electrician": "Сидоров", **extra}
+
+    def sync(self, entries):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post("/api/deviations/sync/", entries, format="json")
+        return resp, len(ctx.captured_queries)
+
+    def test_resubmitted_batch_is_deduplicated(self):
+        batch = [self.entry(f"k-{i}", self.dredgers[i % 3]) for i in range(6)]
+        resp, _ = self.sync(batch + [self.entry("k-0"), self.entry("bad", type="unknown")])
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual((resp.data["created"], resp.data["duplicates"], resp.data["failed"]), (6, 1, 1))
+        ids = [r["id"] for r in resp.data["results"][:6]]
+        self.assertEqual(resp.data["results"][6]["id"], ids[0])
+        self.assertEqual(sum(DeviationDailyCount.objects.values_list("count", flat=True)), 6)
+
+        # повтор после обрыва связи: ничего не создаётся, возвращаются те же id
+        resp, _ = self.sync({"deviations": batch})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([r["id"] for r in resp.data["results"]], ids)
+        self.assertEqual(Deviation.objects.count(), 6)
+        self.assertEqual(Deviation.objects.get(id=ids[0]).client_key, "k-0")
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        _, small = self.sync([self.entry(f"a-{i}") for i in range(2)])
+        _, large = self.sync([self.entry(f"b-{i}", self.dredgers[i % 3], date=f"2024-06-{i % 28 + 1:02}")
+                              for i in range(60)])
+        self.assertEqual(small, large)
+        self.assertEqual(self.sync([{"client_key": ["x"]}])[0].status_code, 400)
+
+    def test_numeric_and_missing_keys(self):
+        keyless = self.entry(None)
+        del keyless["client_key"]
+        resp, _ = self.sync([self.entry(123), keyless])
+        self.assertEqual(resp.status_code, 201)
+        created, missing = resp.data["results"]
+        self.assertEqual((created["status"], created["client_key"]), ("created", "123"))
+        self.assertEqual((missing["status"], missing["client_key"]), ("error", None))
+        self.assertIn("client_key", missing["errors"])
+
+        # повтор с тем же числовым ключом — duplicate, а не 500
+        resp, _ = self.sync([self.entry(123)])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.data["results"][0]["status"], resp.data["results"][0]["id"]),
+                         ("duplicate", created["id"]))
+        self.assertEqual(Deviation.objects.count(), 1)
+
+
+class DeviationRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer", is_staff=True)
+        dtype = DredgerType.objects.create(name="ЗГМ", code="ZGM")
+        cls.d1 = Dredger.objects.create(inv_number="D-1", type=dtype)
+        cls.d2 = Dredger.objects.create(inv_number="D-2", type=dtype)
+
+    def make(self, dredger, day, type="mechanical", save=True):
+        dev = Deviation(dredger=dredger, date=day, type=type, location="ПНС", last_ppr_date=date(2024, 1, 1),
+                        hours_at_deviation=10, description="—", shift_leader="—", mechanic="—",
+                        electrician="—", created_by=self.user, updated_by=self.user)
+        if save:
+            dev.save()
+        return dev
+
+    def rollup(self) -> dict:
+        return {(r.day, r.dredger_id, r.type): r.count for r in DeviationDailyCount.objects.all()}
+
+    def test_save_move_and_delete(self):
+        day = date(2024, 5, 1)
+        first = self.make(self.d1, day)
+        self.make(self.d1, day)
+        self.assertEqual(self.rollup(), {(day, self.d1.id, "mechanical"): 2})
+
+        # перенос на другой землесос и дату: старый ключ уменьшается, новый появляется
+        first.dredger, first.date = self.d2, date(2024, 5, 2)
+        first.save()
+        self.assertEqual(self.rollup(), {(day, self.d1.id, "mechanical"): 1,
+                                         (date(2024, 5, 2), self.d2.id, "mechanical"): 1})
+        # правка без смены ключа свёртку не трогает
+        first.description = "уточнено"
+        first.save()
+        self.assertEqual(sum(self.rollup().values()), 2)
+
+        first.delete()
+        self.assertEqual(self.rollup(), {(day, self.d1.id, "mechanical"): 1})   # пустая строка удалена
+
+    def test_add_deviations_for_bulk_paths(self):
+        self.make(self.d1, date(2024, 5, 1))
+        batch = [self.make(self.d1, date(2024, 5, 1), save=False),
+                 self.make(self.d1, date(2024, 5, 1), save=False),
+                 self.make(self.d2, date(2024, 5, 3), type="electrical", save=False)]
+        Deviation.objects.bulk_create(batch)
+        rollup.add_deviations(batch)
+        self.assertEqual(self.rollup(), {(date(2024, 5, 1), self.d1.id, "mechanical"): 3,
+                                         (date(2024, 5, 3), self.d2.id, "electrical"): 1})
+        with self.assertNumQueries(0):                     # пустая пачка — без запросов
+            rollup.add_deviations([])
+
+    def test_add_deviations_reads_only_touched_days(self):
+        for day in (date(2024, 1, 1), date(2024, 6, 1)):
+            self.make(self.d1, day)
+        batch = [self.make(self.d1, date(2024, 12, 31), save=False),
+                 self.make(self.d1, date(2024, 1, 1), save=False)]
+        Deviation.objects.bulk_create(batch)
+        with CaptureQueriesContext(connection) as ctx:
+            rollup.add_deviations(batch)
+        select = next(q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT"))
+        self.assertNotIn("BETWEEN", select)               # не весь диапазон min..max дней
+        self.assertEqual(self.rollup(), {(date(2024, 1, 1), self.d1.id, "mechanical"): 2,
+                                         (date(2024, 6, 1), self.d1.id, "mechanical"): 1,
+                                         (date(2024, 12, 31), self.d1.id, "mechanical"): 1})
+
+    def test_bump_survives_concurrent_insert(self):
+        day = date(2024, 5, 1)
+        self.make(self.d1, day)
+        update, calls = QuerySet.update, []
+
+        def racing_update(qs, **kwargs):
+            # первый UPDATE «не видит» строку, которую успел вставить другой запрос
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(qs, **kwargs)
+
+        with mock.patch.object(QuerySet, "update", racing_update):
+            rollup.bump((day, self.d1.id, "mechanical", "ПНС"), 2)
+        self.assertEqual(self.rollup(), {(day, self.d1.id, "mechanical"): 3})
 
-# Create your tests here.
+    def test_rebuild_command_restores_rollup(self):
+        self.make(self.d1, date(2024, 5, 1))
+        self.make(self.d1, date(2024, 5, 1))
+        self.make(self.d2, date(2024, 6, 1), type="electrical")
+        expected = self.rollup()
+        DeviationDailyCount.objects.update(count=99)
+        DeviationDailyCount.objects.create(day=date(2020, 1, 1), dredger=self.d1, type="mechanical",
+                                           location="ПНС", count=5)
+        out = io.StringIO()
+        call_command("rebuild_deviation_rollup", stdout=out)
+        self.assertEqual(self.rollup(), expected)
+        self.assertIn("Строк свёртки: 2", out.getvalue())
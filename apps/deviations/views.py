@@ -1,8 +1,19 @@
+from datetime import date
+
+from django.db import IntegrityError, transaction
 from django_filters.rest_framework import FilterSet, DateFilter
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from apps.core.pagination import JournalPagination
 from apps.core.permissions import ReadOnlyOrOperatorEngineer
+from apps.core.signals import bulk_changed
+from apps.repairs.models import Dredger
+from apps.repairs.serializers import installed_as_of, prefetch_into
+from . import rollup
 from .models import Deviation
-from .serializers import DeviationSerializer
+from .search import deviation_index
+from .serializers import DeviationSerializer, DeviationSyncSerializer
 
 class DeviationFilter(FilterSet):
     date_after = DateFilter(field_name="date", lookup_expr="gte")
@@ -16,10 +27,114 @@ class DeviationViewSet(viewsets.ModelViewSet):
     queryset = Deviation.objects.select_related("dredger")
     serializer_class = DeviationSerializer
     permission_classes = [ReadOnlyOrOperatorEngineer]
+    # ?page=N (по умолчанию); курсор по (date, id) — по ?mode=cursor
+    pagination_class = JournalPagination
+    keyset_fields = ("date", "id")
     filterset_class = DeviationFilter
-    search_fields = ("description",)
+    # ?search= — полнотекстовый индекс, по релевантности; search_fields — запасной LIKE
+    search_index = deviation_index
+    search_fields = ("description", "shift_leader", "mechanic", "electrician")
     ordering_fields = ("date", "-date", "dredger")
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        ?as_of — + components: комплектация землесоса на дату отклонения
+        (?as_of без значения) или на указанную дату (?as_of=YYYY-MM-DD).
+        """
+        deviation = self.get_object()
+        data = self.get_serializer(deviation).data
+        if "as_of" in request.query_params:
+            moment = deviation.date
+            if request.query_params["as_of"]:
+                try:
+                    moment = date.fromisoformat(request.query_params["as_of"])
+                except ValueError:
+                    return Response({"error": "as_of must be YYYY-MM-DD"}, status=400)
+            data["components_as_of"] = moment
+            data["components"] = installed_as_of(deviation.dredger_id, moment)
+        return Response(data)
+
+    sync_max_size = 1000         # записей в одном запросе
+
+    @action(detail=False, methods=["post"])
+    def sync(self, request):
+        """
+        Офлайн-синхронизация: список отклонений в формате create, у каждого —
+        client_key (ключ, сгенерированный клиентом; или {"deviations": [...]}).
+
+        Записи сначала проверяются сериализатором (без запросов — землесосы
+        загружены заранее), client_key берётся из проверенных данных.
+        Уже загруженные ключи находятся одним запросом по уникальному индексу
+        и возвращаются как duplicate с серверным id — повтор пакета после
+        обрыва связи безопасен. Новые записи сохраняются одним bulk_create
+        в одной транзакции, свёртка дашборда — rollup.add_deviations().
+        Ответ: {"created", "duplicates", "failed",
+                "results": [{"index", "client_key", "status", "id" | "errors"}]}.
+        """
+        entries = request.data.get("deviations") if isinstance(request.data, dict) else request.data
+        if not isinstance(entries, list) or not entries:
+            return Response({"error": "A non-empty list of deviations is required"}, status=400)
+        if len(entries) > self.sync_max_size:
+            return Response({"error": f"At most {self.sync_max_size} deviations per batch"}, status=400)
+
+        context = self.get_serializer_context()
+        dredger_ids = set()
+        for entry in entries:
+            try:
+                dredger_ids.add(int(entry["dredger"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+        prefetch_into(context, Dredger, dredger_ids)
+        try:
+            results, created = self.sync_entries(entries, context)
+        except IntegrityError:
+            # тот же ключ параллельно записал другой запрос — теперь он найдётся как duplicate
+            results, created = self.sync_entries(entries, context)
+        if created:
+            bulk_changed.send(sender=Deviation)
+
+        counts = {status: sum(r["status"] == status for r in results)
+                  for status in ("created", "duplicate", "error")}
+        return Response({"created": counts["created"], "duplicates": counts["duplicate"],
+                         "failed": counts["error"], "results": results},
+                        status=201 if created else (400 if counts["error"] == len(entries) else 200))
+
+    def sync_entries(self, entries, context):
+        # ключ — только из проверенных данных (CharField приводит 123 к "123"):
+        # у записи с ошибкой ключа нет, и дубликатом она быть не может
+        checked = [DeviationSyncSerializer(data=entry, context=context) for entry in entries]
+        keys = [serializer.validated_data["client_key"] if serializer.is_valid() else None
+                for serializer in checked]
+        results, new, first = [], [], {}
+        with transaction.atomic():
+            known = dict(Deviation.objects.filter(client_key__in=set(keys) - {None})
+                         .values_list("client_key", "id"))
+            for index, (serializer, key) in enumerate(zip(checked, keys)):
+                if key is None:
+                    data = serializer.initial_data
+                    raw = data.get("client_key") if isinstance(data, dict) else None
+                    results.append({"index": index, "client_key": raw if isinstance(raw, str) else None,
+                                    "status": "error", "errors": serializer.errors})
+                    continue
+                result = {"index": index, "client_key": key}
+                results.append(result)
+                if key in known or key in first:
+                    result["status"] = "duplicate"
+                    continue
+                first[key] = Deviation(**serializer.validated_data,
+                                       created_by=self.request.user, updated_by=self.request.user)
+                new.append(first[key])
+                result["status"] = "created"
+            Deviation.objects.bulk_create(new)
+            rollup.add_deviations(new)
+        for result in results:
+            if result["status"] == "duplicate":
+                key = result["client_key"]
+                result["id"] = known[key] if key in known else first[key].id
+            elif result["status"] == "created":
+                result["id"] = first[result["client_key"]].id
+        return results, new
+
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
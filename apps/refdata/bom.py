@@ -0,0 +1,81 @@
+"""
+apps/refdata/bom.py · состав (BOM) типов землесосов, кэш в памяти процесса
+
+Состав типа меняется редко, а нужен при каждом открытии карточки
+землесоса (template) и при установке агрегата (add_component).
+Кэш сбрасывается сигналами DredgerTypePart / SparePart (signals.py) после
+коммита. Сигналы срабатывают только в процессе, который изменил данные,
+поэтому у записи есть срок жизни BOM_CACHE_TIMEOUT — в остальных
+процессах WSGI состав обновится не позже чем через него.
+invalidate() увеличивает версию кэша; загрузка, начатая до сброса,
+результат не сохраняет — иначе устаревший состав прожил бы весь срок.
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .models import DredgerTypePart
+
+
+@dataclass(frozen=True)
+class BOM:
+    parts: tuple[dict, ...]          # по названию: id, name, code, manufacturer, norm_hours
+    part_ids: frozenset[int]
+
+
+_lock = threading.Lock()
+_cache: dict[int, tuple[float, BOM]] = {}
+_version = 0
+
+
+def _timeout() -> int:
+    return getattr(settings, "BOM_CACHE_TIMEOUT", 10 * 60)
+
+
+def load(dredger_type_ids) -> dict[int, BOM]:
+    """Составы нескольких типов одним запросом."""
+    parts = {type_id: [] for type_id in dredger_type_ids}
+    rows = (DredgerTypePart.objects
+            .filter(dredger_type_id__in=parts.keys())
+            .order_by("part__name", "part_id")
+            .values_list("dredger_type_id", "part_id", "part__name", "part__code",
+                         "part__manufacturer", "part__norm_hours"))
+    for type_id, pk, name, code, manufacturer, norm in rows:
+        parts[type_id].append(
+            {"id": pk, "name": name, "code": code, "manufacturer": manufacturer, "norm_hours": norm})
+    return {type_id: BOM(parts=tuple(p), part_ids=frozenset(x["id"] for x in p))
+            for type_id, p in parts.items()}
+
+
+def get_boms(dredger_type_ids) -> dict[int, BOM]:
+    """Составы типов: из кэша, недостающие — одним запросом."""
+    now = time.monotonic()
+    result, missing = {}, set()
+    for type_id in set(dredger_type_ids):
+        entry = _cache.get(type_id)
+        if entry is not None and entry[0] > now:
+            result[type_id] = entry[1]
+        else:
+            missing.add(type_id)
+    if missing:
+        version = _version
+        loaded = load(missing)
+        with _lock:
+            if version == _version:
+                for type_id, bom in loaded.items():
+                    _cache[type_id] = (now + _timeout(), bom)
+        result.update(loaded)
+    return result
+
+
+def get_bom(dredger_type_id: int) -> BOM:
+    return get_boms([dredger_type_id])[dredger_type_id]
+
+
+def invalidate() -> None:
+    global _version
+    with _lock:
+        _version += 1
+        _cache.clear()
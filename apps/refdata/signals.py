@@ -0,0 +1,8 @@
+"""
+Сброс кэша состава типов (bom.py) при изменении справочников.
+"""
+from apps.core.cache import invalidate_on_change
+from . import bom
+from .models import DredgerTypePart, SparePart
+
+invalidate_on_change(bom.invalidate, (DredgerTypePart, SparePart), "bom")
@@ -0,0 +1,34 @@
+"""
+Загрузка показаний счётчиков моточасов (NDJSON) с начислением наработки:
+
+    python manage.py ingest_hours shift_2024-03-01.ndjson
+    python manage.py ingest_hours a.ndjson b.ndjson      # каждый файл — отдельный пакет
+
+Формат строк — см. apps/repairs/telemetry.py. Повторная загрузка того же
+файла ничего не меняет.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.repairs.telemetry import HoursIngest, read_lines
+
+
+class Command(BaseCommand):
+    help = "Загружает показания счётчиков моточасов (NDJSON) и начисляет наработку агрегатам"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+")
+
+    def handle(self, *args, paths, **options):
+        for path in paths:
+            try:
+                with open(path, "rb") as fh:
+                    report = HoursIngest().run(read_lines(fh))
+            except (OSError, UnicodeDecodeError) as exc:
+                raise CommandError(f"{path}: {exc}")
+
+            for err in report["errors"][:20]:
+                self.stderr.write(f"{path}:{err['line']}: {err['error']}")
+            self.stdout.write(self.style.SUCCESS(
+                f"{path}: показаний {report['applied']} из {report['total']}, "
+                f"повторов {report['duplicates']}, с ошибками {report['failed']}, "
+                f"обновлено агрегатов {report['components']}"))
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.9 on 2026-10-18 13:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('repairs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='repair',
+            name='created_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='%(class)s_created', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='repair',
+            name='updated_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='%(class)s_updated', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='ComponentHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hours_delta', models.IntegerField()),
+                ('total_hours', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history', to='repairs.componentinstance')),
+                ('repair', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='repairs.repair')),
+            ],
+            options={
+                'verbose_name_plural': 'Component histories',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-18 13:08
+
+from django.db import migrations, models
+from django.db.models.functions import NullIf
+
+
+def fill_wear_pct(apps, schema_editor):
+    ComponentInstance = apps.get_model("repairs", "ComponentInstance")
+    SparePart = apps.get_model("refdata", "SparePart")
+    norm = SparePart.objects.filter(pk=models.OuterRef("part_id")).values("norm_hours")[:1]
+    ComponentInstance.objects.update(
+        wear_pct=models.F("total_hours") * 100.0 / NullIf(models.Subquery(norm), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repairs', '0002_alter_repair_created_by_alter_repair_updated_by_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='componentinstance',
+            name='wear_pct',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='componentinstance',
+            index=models.Index(fields=['current_dredger', 'wear_pct'], name='repairs_com_current_991e52_idx'),
+        ),
+        migrations.RunPython(fill_wear_pct, migrations.RunPython.noop),
+    ]
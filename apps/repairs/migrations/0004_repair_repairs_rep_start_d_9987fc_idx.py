@@ -0,0 +1,17 @@
+# Generated by Django 4.2.9 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repairs', '0003_componentinstance_wear_pct'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='repair',
+            index=models.Index(fields=['start_date', 'id'], name='repairs_rep_start_d_9987fc_idx'),
+        ),
+    ]
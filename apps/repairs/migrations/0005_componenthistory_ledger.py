@@ -0,0 +1,96 @@
+# Generated by Django 4.2.9 on 2026-10-18 13:40
+
+from collections import defaultdict
+from datetime import datetime, time
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+
+def open_ledger(apps, schema_editor):
+    """
+    Журнал для уже существующих агрегатов. Прежняя история (/history/)
+    строилась по позициям ремонтов, поэтому на каждую RepairItem пишется
+    запись «repair» датой начала ремонта, а перед ними — «initial» с
+    остатком наработки, не объяснённым ремонтами. Если позиции дают больше
+    текущей наработки, расхождение записывается в конце (отрицательное
+    «initial»). Агрегаты, у которых журнал уже есть, только сверяются:
+    расхождение записывается как начальный остаток.
+    """
+    ComponentInstance = apps.get_model("repairs", "ComponentInstance")
+    ComponentHistory = apps.get_model("repairs", "ComponentHistory")
+    RepairItem = apps.get_model("repairs", "RepairItem")
+    now = django.utils.timezone.now()
+
+    def start_of_day(day):
+        return django.utils.timezone.make_aware(datetime.combine(day, time.min))
+
+    with_ledger = set(ComponentHistory.objects.values_list("component_id", flat=True).distinct())
+    items = defaultdict(list)
+    for comp_id, repair_id, hours, day in (RepairItem.objects
+                                           .order_by("repair__start_date", "repair_id", "id")
+                                           .values_list("component_id", "repair_id", "hours",
+                                                        "repair__start_date")
+                                           .iterator(chunk_size=5000)):
+        if comp_id not in with_ledger:
+            items[comp_id].append((repair_id, hours, start_of_day(day)))
+
+    rows = []
+    for pk, total in ComponentInstance.objects.values_list("id", "total_hours").iterator(chunk_size=5000):
+        if pk in with_ledger:
+            continue
+        entries = items.get(pk, [])
+        leftover = total - sum(hours for _, hours, _ in entries)
+        running = max(leftover, 0)
+        if running:
+            rows.append(ComponentHistory(component_id=pk, source="initial", hours_delta=running,
+                                         total_hours=running, created_at=entries[0][2] if entries else now))
+        for repair_id, hours, moment in entries:
+            running += hours
+            rows.append(ComponentHistory(component_id=pk, repair_id=repair_id, source="repair",
+                                         hours_delta=hours, total_hours=running, created_at=moment))
+        if leftover < 0:
+            rows.append(ComponentHistory(component_id=pk, source="initial", hours_delta=leftover,
+                                         total_hours=total, created_at=now))
+
+    last = (ComponentHistory.objects.filter(component=models.OuterRef("pk"))
+            .order_by("-created_at", "-id").values("total_hours")[:1])
+    reconcile = (ComponentInstance.objects
+                 .filter(models.Exists(ComponentHistory.objects.filter(component=models.OuterRef("pk"))))
+                 .annotate(ledger=Coalesce(models.Subquery(last), 0))
+                 .exclude(total_hours=models.F("ledger"))
+                 .values_list("id", "total_hours", "ledger"))
+    rows += [ComponentHistory(component_id=pk, source="initial", hours_delta=total - ledger,
+                              total_hours=total, created_at=now)
+             for pk, total, ledger in reconcile.iterator(chunk_size=5000)]
+    ComponentHistory.objects.bulk_create(rows, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repairs', '0004_repair_repairs_rep_start_d_9987fc_idx'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='componenthistory',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name_plural': 'Component histories'},
+        ),
+        migrations.AddField(
+            model_name='componenthistory',
+            name='source',
+            field=models.CharField(choices=[('initial', 'начальный остаток'), ('repair', 'ремонт'), ('manual', 'ручная правка'), ('telemetry', 'телеметрия')], default='manual', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='componenthistory',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='componenthistory',
+            index=models.Index(fields=['component', 'created_at'], name='repairs_com_compone_ee69e6_idx'),
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
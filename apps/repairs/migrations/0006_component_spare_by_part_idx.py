@@ -0,0 +1,17 @@
+# Generated by Django 4.2.9 on 2026-10-18 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repairs', '0005_componenthistory_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='componentinstance',
+            index=models.Index(condition=models.Q(('current_dredger__isnull', True)), fields=['part', 'total_hours'], name='component_spare_by_part_idx'),
+        ),
+    ]
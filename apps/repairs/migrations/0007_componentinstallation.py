@@ -0,0 +1,62 @@
+# Generated by Django 4.2.9 on 2026-10-18 13:46
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def open_installations(apps, schema_editor):
+    """
+    Открытые интервалы для уже установленных агрегатов. Прежняя история
+    перемещений не сохранялась, поэтому начало интервала — первая запись
+    журнала наработки агрегата (или момент миграции).
+    """
+    ComponentInstance = apps.get_model("repairs", "ComponentInstance")
+    ComponentHistory = apps.get_model("repairs", "ComponentHistory")
+    ComponentInstallation = apps.get_model("repairs", "ComponentInstallation")
+    first = ComponentHistory.objects.filter(component=models.OuterRef("pk")).order_by("created_at", "id")
+    now = django.utils.timezone.now()
+    rows = (ComponentInstance.objects
+            .filter(current_dredger__isnull=False)
+            .annotate(since=models.Subquery(first.values("created_at")[:1]),
+                      since_hours=Coalesce(models.Subquery(first.values("total_hours")[:1]), 0))
+            .values_list("id", "current_dredger_id", "since", "since_hours"))
+    ComponentInstallation.objects.bulk_create(
+        [ComponentInstallation(component_id=pk, dredger_id=dredger_id,
+                               installed_at=since or now, hours_installed=hours)
+         for pk, dredger_id, since, hours in rows.iterator(chunk_size=5000)],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repairs', '0006_component_spare_by_part_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComponentInstallation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('installed_at', models.DateTimeField()),
+                ('removed_at', models.DateTimeField(blank=True, null=True)),
+                ('hours_installed', models.PositiveIntegerField(default=0)),
+                ('hours_removed', models.PositiveIntegerField(blank=True, null=True)),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installations', to='repairs.componentinstance')),
+                ('dredger', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installations', to='repairs.dredger')),
+                ('repair', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='repairs.repair')),
+            ],
+            options={
+                'ordering': ['-installed_at', '-id'],
+                'indexes': [models.Index(fields=['dredger', 'installed_at', 'removed_at'], name='repairs_com_dredger_1610a4_idx'), models.Index(fields=['component', 'installed_at'], name='repairs_com_compone_8cd54f_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='componentinstallation',
+            constraint=models.UniqueConstraint(condition=models.Q(('removed_at__isnull', True)), fields=('component',), name='component_single_open_installation'),
+        ),
+        migrations.RunPython(open_installations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.9 on 2026-10-18 13:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repairs', '0007_componentinstallation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourMeterReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_at', models.DateTimeField()),
+                ('hours', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dredger', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hour_readings', to='repairs.dredger')),
+            ],
+            options={
+                'ordering': ['-read_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='hourmeterreading',
+            constraint=models.UniqueConstraint(fields=('dredger', 'read_at'), name='hour_reading_unique'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+from apps.core.search import fts_create_sql, fts_drop_sql
+
+TABLE = "repairs_repair_fts"
+COLUMNS = ["notes"]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in fts_create_sql(TABLE, "repairs_repair", COLUMNS):
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in fts_drop_sql(TABLE):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repairs', '0008_hourmeterreading'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.9 on 2026-10-18 14:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repairs', '0009_repair_fts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='componenthistory',
+            name='repair',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='repairs.repair'),
+        ),
+    ]
@@ -1,9 +1,13 @@
 # apps/repairs/models.py
+from datetime import date, datetime, time
+
 from django.db import models
 from apps.core.models import AuditMixin
 from apps.refdata.models import DredgerType, SparePart
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
 
 class Dredger(models.Model):
     """Конкретная машина в парке"""
@@ -14,6 +18,37 @@ class Dredger(models.Model):
         return f"{self.inv_number} ({self.type.code})"
 
 
+def wear_percent(total_hours: int, norm_hours: int) -> float | None:
+    """Износ агрегата в % от нормы (None — норма не задана)."""
+    return total_hours * 100.0 / norm_hours if norm_hours else None
+
+
+def end_of_day(moment):
+    """date → конец этого дня (aware datetime); datetime — без изменений."""
+    if not isinstance(moment, datetime):
+        moment = timezone.make_aware(datetime.combine(moment, time.max))
+    return moment
+
+
+def start_of_day(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+_UNKNOWN = object()
+
+
+class ComponentInstanceQuerySet(models.QuerySet):
+    def refresh_wear(self) -> int:
+        """
+        Пересчитывает wear_pct одним UPDATE — для update()/bulk_update(),
+        которые идут в обход save().
+        """
+        norm = SparePart.objects.filter(pk=models.OuterRef("part_id")).values("norm_hours")[:1]
+        return self.update(
+            wear_pct=models.F("total_hours") * 100.0 / NullIf(models.Subquery(norm), 0)
+        )
+
+
 class ComponentInstance(models.Model):
     """Физический экземпляр агрегата"""
     part = models.ForeignKey(SparePart, on_delete=models.PROTECT)
@@ -26,40 +61,250 @@ class ComponentInstance(models.Model):
         related_name="components",
     )
     total_hours = models.PositiveIntegerField(default=0)
+    # денормализованный % износа (total_hours / part.norm_hours) — для сортировки
+    # и фильтрации по индексу; поддерживается save(), refresh_wear() и сигналом SparePart
+    wear_pct = models.FloatField(null=True, blank=True, editable=False, db_index=True)
+
+    objects = ComponentInstanceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["current_dredger", "wear_pct"]),
+            # склад: свободные агрегаты по запчасти (available-components)
+            models.Index(fields=["part", "total_hours"], condition=models.Q(current_dredger__isnull=True),
+                         name="component_spare_by_part_idx"),
+        ]
+
+    # наработка на момент последней записи в журнал (ComponentHistory)
+    _ledger_hours = 0
+    # землесос по открытому интервалу установки (ComponentInstallation)
+    _installed_on = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        obj = super().from_db(db, field_names, values)
+        obj._ledger_hours = obj.__dict__.get("total_hours")     # None — поле отложено (.only/.defer)
+        obj._installed_on = obj.__dict__.get("current_dredger_id", _UNKNOWN)
+        return obj
+
+    def save(self, *args, ledger_source: str = None, ledger_repair: 'Repair' = None, **kwargs):
+        """ledger_source / ledger_repair — чем объяснить изменение наработки в журнале."""
+        self.wear_pct = wear_percent(self.total_hours, self.part.norm_hours)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"total_hours", "part"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "wear_pct"}
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if self._ledger_hours is not None and self.total_hours != self._ledger_hours:
+            default = ComponentHistory.INITIAL if adding else ComponentHistory.MANUAL
+            self.record_hours(ledger_source or default, ledger_repair)
+        if self._installed_on is not _UNKNOWN and self.current_dredger_id != self._installed_on:
+            ComponentInstallation.objects.move([
+                (self.id, self.current_dredger_id, timezone.now(), self.total_hours, None)])
+        self._installed_on = self.current_dredger_id
+
+    def record_hours(self, source: str, repair: 'Repair' = None) -> 'ComponentHistory':
+        """Записывает в журнал изменение наработки с момента предыдущей записи."""
+        entry = ComponentHistory.objects.create(
+            component=self,
+            source=source,
+            repair=repair,
+            hours_delta=self.total_hours - (self._ledger_hours or 0),
+            total_hours=self.total_hours,
+        )
+        self._ledger_hours = self.total_hours
+        return entry
 
     def update_hours(self, new_hours: int, repair: 'Repair' = None) -> None:
         """Обновляет наработку компонента и создает запись в истории"""
         if new_hours < self.total_hours:
             raise ValueError("New hours cannot be less than current total hours")
-        
-        hours_delta = new_hours - self.total_hours
+
         self.total_hours = new_hours
-        self.save()
-        
-        if repair:
-            ComponentHistory.objects.create(
-                component=self,
-                repair=repair,
-                hours_delta=hours_delta,
-                total_hours=new_hours
-            )
+        self.save(ledger_source=ComponentHistory.REPAIR if repair else ComponentHistory.MANUAL,
+                  ledger_repair=repair)
 
     def __str__(self):
         where = self.current_dredger.inv_number if self.current_dredger else "склад/снят"
         return f"{self.part.name} SN:{self.serial_number or '—'} [{where}]"
 
 
+class ComponentHistoryQuerySet(models.QuerySet):
+    def hours_at(self, component_id: int, moment) -> int:
+        """
+        Наработка агрегата на момент moment (date или datetime) — сумма
+        приращений по индексу (component, created_at). 0, если записей раньше нет.
+        """
+        return (self.filter(component_id=component_id, created_at__lte=end_of_day(moment))
+                .aggregate(total=Coalesce(models.Sum("hours_delta"), 0))["total"])
+
+    def with_running_total(self):
+        """
+        + running_total — наработка после записи: сумма приращений агрегата
+        в порядке (created_at, id), подзапрос по индексу. В отличие от
+        total_hours (итог в порядке вставки) не зависит от того, что ремонт
+        записан задним числом после более поздних показаний телеметрии.
+        """
+        earlier = (ComponentHistory.objects
+                   .filter(models.Q(created_at__lt=models.OuterRef("created_at"))
+                           | models.Q(created_at=models.OuterRef("created_at"), id__lte=models.OuterRef("id")),
+                           component=models.OuterRef("component_id"))
+                   .order_by()
+                   .values("component")
+                   .annotate(total=models.Sum("hours_delta"))
+                   .values("total"))
+        return self.annotate(running_total=models.Subquery(earlier))
+
+
 class ComponentHistory(models.Model):
-    """История изменений наработки компонента"""
+    """
+    Журнал наработки агрегата — только дополняется. Каждая запись — изменение
+    наработки (hours_delta) и нарастающий итог после него в момент вставки
+    (total_hours). Пишется при каждом изменении ComponentInstance.total_hours:
+    ремонты (в т.ч. пакетные), ручная правка, телеметрия.
+    Ремонт датируется началом ремонта и может лечь раньше уже записанных
+    показаний, поэтому наработка на дату и итоги в истории считаются по
+    сумме hours_delta в порядке (created_at, id) — hours_at(),
+    with_running_total().
+    """
+    INITIAL = "initial"
+    REPAIR = "repair"
+    MANUAL = "manual"
+    TELEMETRY = "telemetry"
+    SOURCE_CHOICES = [
+        (INITIAL, "начальный остаток"),
+        (REPAIR, "ремонт"),
+        (MANUAL, "ручная правка"),
+        (TELEMETRY, "телеметрия"),
+    ]
+
     component = models.ForeignKey(ComponentInstance, on_delete=models.CASCADE, related_name='history')
-    repair = models.ForeignKey('Repair', on_delete=models.CASCADE, null=True, blank=True)
+    # ремонт удаляют — история наработки агрегата остаётся (как у ComponentInstallation)
+    repair = models.ForeignKey('Repair', on_delete=models.SET_NULL, null=True, blank=True)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default=MANUAL)
     hours_delta = models.IntegerField()
     total_hours = models.PositiveIntegerField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = ComponentHistoryQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
         verbose_name_plural = "Component histories"
+        indexes = [
+            models.Index(fields=["component", "created_at"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None and not self._state.adding:
+            raise ValueError("ComponentHistory is append-only")
+        super().save(*args, **kwargs)
+
+
+class ComponentInstallationQuerySet(models.QuerySet):
+    def at(self, moment):
+        """Интервалы, открытые в момент moment (date — на конец дня)."""
+        moment = end_of_day(moment)
+        return self.filter(models.Q(removed_at__isnull=True) | models.Q(removed_at__gt=moment),
+                           installed_at__lte=moment)
+
+    def with_hours_at(self, moment):
+        """+ hours_at — наработка агрегата на moment по журналу (подзапрос по индексу)."""
+        upto = (ComponentHistory.objects
+                .filter(component=models.OuterRef("component_id"), created_at__lte=end_of_day(moment))
+                .order_by()
+                .values("component")
+                .annotate(total=models.Sum("hours_delta"))
+                .values("total"))
+        return self.annotate(hours_at=Coalesce(models.Subquery(upto), 0))
+
+    def move(self, moves) -> None:
+        """
+        Применяет перемещения агрегатов:
+            moves — [(component_id, dredger_id | None, момент, наработка, repair_id | None), …]
+        в порядке событий. Открытый интервал агрегата закрывается, при
+        установке открывается новый. Один SELECT открытых интервалов,
+        bulk_update закрытых и bulk_create новых — независимо от числа агрегатов.
+        """
+        opened = {i.component_id: i for i in
+                  self.filter(component_id__in={m[0] for m in moves}, removed_at__isnull=True)}
+        closed, created = {}, []
+        for comp_id, dredger_id, moment, hours, repair_id in moves:
+            current = opened.pop(comp_id, None)
+            if current is not None:
+                if current.dredger_id == dredger_id:
+                    opened[comp_id] = current
+                    continue
+                # записи задним числом не дают интервалов с концом раньше начала
+                current.removed_at = max(moment, current.installed_at)
+                current.hours_removed = hours
+                if current.pk is not None:
+                    closed[current.pk] = current
+            if dredger_id is not None:
+                opened[comp_id] = ComponentInstallation(
+                    component_id=comp_id, dredger_id=dredger_id, repair_id=repair_id,
+                    installed_at=moment, hours_installed=hours)
+                created.append(opened[comp_id])
+        # сначала закрываем: открытый интервал у агрегата может быть только один
+        self.bulk_update(closed.values(), ["removed_at", "hours_removed"])
+        self.bulk_create(created)
+
+
+class ComponentInstallation(models.Model):
+    """
+    Интервал установки агрегата на землесос: [installed_at, removed_at),
+    removed_at = NULL — стоит сейчас. Пишется при каждой смене
+    ComponentInstance.current_dredger (save(), ремонты, swap), поэтому
+    комплектация на любую дату — один запрос по индексу, а не разбор
+    истории ремонтов.
+    """
+    component = models.ForeignKey(ComponentInstance, on_delete=models.CASCADE, related_name="installations")
+    dredger = models.ForeignKey(Dredger, on_delete=models.CASCADE, related_name="installations")
+    # ремонт, по которому агрегат установлен (если через ремонт)
+    repair = models.ForeignKey('Repair', on_delete=models.SET_NULL, null=True, blank=True)
+    installed_at = models.DateTimeField()
+    removed_at = models.DateTimeField(null=True, blank=True)
+    hours_installed = models.PositiveIntegerField(default=0)
+    hours_removed = models.PositiveIntegerField(null=True, blank=True)
+
+    objects = ComponentInstallationQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["-installed_at", "-id"]
+        indexes = [
+            # комплектация землесоса на дату: dredger = ? AND installed_at <= t AND (removed_at > t OR NULL)
+            models.Index(fields=["dredger", "installed_at", "removed_at"]),
+            models.Index(fields=["component", "installed_at"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["component"], condition=models.Q(removed_at__isnull=True),
+                                    name="component_single_open_installation"),
+        ]
+
+    def __str__(self):
+        return f"{self.component_id} на {self.dredger_id}: {self.installed_at} → {self.removed_at or '…'}"
+
+
+class HourMeterReading(models.Model):
+    """
+    Показание счётчика моточасов землесоса (телеметрия контроллера).
+    Разность соседних показаний начисляется установленным агрегатам —
+    см. apps/repairs/telemetry.py. Ключ (dredger, read_at) делает
+    повторную загрузку тех же показаний безопасной.
+    """
+    dredger = models.ForeignKey(Dredger, on_delete=models.CASCADE, related_name="hour_readings")
+    read_at = models.DateTimeField()
+    hours = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-read_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["dredger", "read_at"], name="hour_reading_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.dredger_id} · {self.read_at}: {self.hours} ч"
 
 
 class Repair(AuditMixin):
@@ -68,6 +313,12 @@ class Repair(AuditMixin):
     end_date = models.DateField()
     notes = models.TextField(blank=True)
 
+    class Meta(AuditMixin.Meta):
+        indexes = [
+            # курсорная пагинация журнала: (start_date, id)
+            models.Index(fields=["start_date", "id"]),
+        ]
+
     def clean(self):
         if self.end_date and self.start_date and self.end_date < self.start_date:
             raise ValidationError({
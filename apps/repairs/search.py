@@ -0,0 +1,5 @@
+"""Полнотекстовый индекс журнала ремонтов (apps/core/search.py)."""
+from apps.core.search import SearchIndex
+from .models import Repair
+
+repair_index = SearchIndex("repairs_repair_fts", Repair, ["notes"])
@@ -1,6 +1,16 @@
+from bisect import insort
+from collections import defaultdict
+from datetime import date
+
 from django.db import transaction
+from django.db.models import Min, Q
 from rest_framework import serializers
-from .models import Dredger, ComponentInstance, Repair, RepairItem
+
+from apps.core.signals import bulk_changed
+from .models import (
+    ComponentHistory, ComponentInstallation, Dredger, ComponentInstance, HourMeterReading, Repair,
+    RepairItem, start_of_day, wear_percent,
+)
 from apps.refdata.serializers import SparePartSerializer
 
 class DredgerSerializer(serializers.ModelSerializer):
@@ -16,17 +26,95 @@ class ComponentInstanceSerializer(serializers.ModelSerializer):
     class Meta:
         model = ComponentInstance
         fields = "__all__"
-        read_only_fields = ("part",)  # все поля только для чтения в этом представлении
+        read_only_fields = ("part", "wear_pct")  # все поля только для чтения в этом представлении
 
 class ComponentInstanceWriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = ComponentInstance
         fields = ("id", "part", "serial_number", "current_dredger", "total_hours")
 
+class ComponentInstallationSerializer(serializers.ModelSerializer):
+    """Агрегат на землесосе на дату (as_of): интервал установки + наработка на эту дату."""
+    component_id = serializers.IntegerField(read_only=True)
+    part_id = serializers.IntegerField(source="component.part_id", read_only=True)
+    part_name = serializers.CharField(source="component.part.name", read_only=True)
+    serial_number = serializers.CharField(source="component.serial_number", read_only=True)
+    hours_at = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ComponentInstallation
+        fields = ("id", "component_id", "part_id", "part_name", "serial_number", "dredger",
+                  "repair", "installed_at", "removed_at", "hours_installed", "hours_removed", "hours_at")
+
+
+def installed_as_of(dredger_id: int, moment) -> list[dict]:
+    """Комплектация землесоса на момент moment (date — на конец дня) — один запрос."""
+    rows = (ComponentInstallation.objects
+            .at(moment)
+            .filter(dredger_id=dredger_id)
+            .with_hours_at(moment)
+            .select_related("component__part")
+            .order_by("component__part__name", "component_id"))
+    return ComponentInstallationSerializer(rows, many=True).data
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PK-поле, которое берёт объекты из заранее загруженного словаря {pk: obj}:
+    собственного (prefetched) или общего для всего запроса
+    (context["prefetched"][модель]).
+    """
+    prefetched: dict | None = None
+
+    def to_internal_value(self, data):
+        cache = self.prefetched
+        if cache is None:
+            cache = self.context.get("prefetched", {}).get(self.get_queryset().model)
+        if cache is not None:
+            try:
+                return cache[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass                      # стандартная ошибка «объект не существует»
+        return super().to_internal_value(data)
+
+
+def prefetch_into(context: dict, model, pks) -> None:
+    """Догружает в context["prefetched"][model] объекты с недостающими pk."""
+    cache = context.setdefault("prefetched", {}).setdefault(model, {})
+    qs = model.objects.all()
+    if model is ComponentInstance:
+        qs = qs.select_related("part")
+    missing = set(pks) - cache.keys()
+    if missing:
+        cache.update(qs.in_bulk(missing))
+
+
+def _int_values(rows, key):
+    result = set()
+    for row in rows if isinstance(rows, list) else ():
+        try:
+            result.add(int(row[key]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return result
+
+
+class RepairItemListSerializer(serializers.ListSerializer):
+    """Загружает агрегаты всех позиций одним запросом вместо get() на каждую."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            prefetch_into(self.context, ComponentInstance, _int_values(data, "component"))
+        return super().to_internal_value(data)
+
+
 class RepairItemWriteSerializer(serializers.ModelSerializer):
+    component = PrefetchedPrimaryKeyRelatedField(queryset=ComponentInstance.objects.all())
+
     class Meta:
         model = RepairItem
         fields = ("component", "hours", "note")
+        list_serializer_class = RepairItemListSerializer
 
 class RepairItemReadSerializer(serializers.ModelSerializer):
     component = ComponentInstanceSerializer(read_only=True)
@@ -35,15 +123,48 @@ class RepairItemReadSerializer(serializers.ModelSerializer):
         model = RepairItem
         fields = ("id", "component", "hours", "note")
 
+class RepairListSerializer(serializers.ModelSerializer):
+    """
+    Компактное представление ремонта для журнала: без вложенных агрегатов и
+    карточек запчастей. Позиции должны быть загружены prefetch'ем
+    (items → component → part), иначе будут запросы на каждый ремонт.
+    """
+    dredger = DredgerSerializer(read_only=True)
+    status = serializers.SerializerMethodField()
+    component = serializers.SerializerMethodField()
+    items_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Repair
+        fields = ("id", "dredger", "start_date", "end_date", "notes",
+                  "status", "component", "items_count")
+
+    def get_status(self, obj):
+        # та же логика, что в RepairFilter.status_filter
+        today = date.today()
+        if obj.start_date > today:
+            return "planned"
+        if obj.end_date and obj.end_date < today:
+            return "completed"
+        return "in_progress"
+
+    def get_component(self, obj):
+        # названия заменённых запчастей, через запятую
+        return ", ".join(dict.fromkeys(item.component.part.name for item in obj.items.all()))
+
+    def get_items_count(self, obj):
+        return len(obj.items.all())
+
+
 class RepairSerializer(serializers.ModelSerializer):
     dredger = DredgerSerializer(read_only=True)
-    dredger_id = serializers.PrimaryKeyRelatedField(
+    dredger_id = PrefetchedPrimaryKeyRelatedField(
         queryset=Dredger.objects.all(),
         source='dredger',
         write_only=True
     )
     items = RepairItemWriteSerializer(many=True, write_only=True)
-    items_read = RepairItemReadSerializer(source="items", many=True, read_only=True)
+    items_read = serializers.SerializerMethodField()
 
     class Meta:
         model = Repair
@@ -63,6 +184,23 @@ class RepairSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ("created_by", "created_at", "updated_by", "updated_at")
 
+    def validate(self, attrs):
+        # та же проверка, что в Repair.clean(), но как ошибка 400, а не 500 из save()
+        start, end = attrs.get("start_date"), attrs.get("end_date")
+        if self.instance is not None:
+            start = start or self.instance.start_date
+            end = end or self.instance.end_date
+        if start and end and end < start:
+            raise serializers.ValidationError({"end_date": "End date must be after start date"})
+        return attrs
+
+    def get_items_read(self, obj):
+        # после create() позиции уже в памяти (applied_items) — без повторного запроса
+        items = getattr(obj, "applied_items", None)
+        if items is None:
+            items = obj.items.all()
+        return RepairItemReadSerializer(items, many=True, context=self.context).data
+
     def create(self, validated_data):
         items_data = validated_data.pop("items")
         user = validated_data.get("created_by")
@@ -71,19 +209,7 @@ class RepairSerializer(serializers.ModelSerializer):
                 **validated_data,
                 updated_by=user
             )
-            for item in items_data:
-                comp = item["component"]         # новый устанавливаемый агрегат (ComponentInstance)
-                hours = item.get("hours", 0)     # наработка старого агрегата до замены
-                # Отвязываем старый агрегат этого типа от землесоса (если есть) и обновляем его наработку
-                old_comp = repair.dredger.components.filter(part_id=comp.part_id).first()
-                if old_comp:
-                    old_comp.current_dredger = None
-                    old_comp.total_hours += hours
-                    old_comp.save()
-                # Привязываем новый агрегат к землесосу
-                comp.current_dredger = repair.dredger
-                comp.save()
-                RepairItem.objects.create(repair=repair, **item)
+            repair.applied_items = apply_repair_items([(repair, items_data)])[0]
         return repair
 
     def update(self, instance, validated_data):
@@ -91,3 +217,137 @@ class RepairSerializer(serializers.ModelSerializer):
         if "items" in validated_data:
             raise serializers.ValidationError({"items": "Нельзя редактировать состав ремонта через этот эндпоинт."})
         return super().update(instance, validated_data)
+
+
+def apply_repair_items(entries: list[tuple[Repair, list[dict]]]) -> list[list[RepairItem]]:
+    """
+    Применяет позиции уже сохранённых ремонтов: ставит новые агрегаты,
+    снимает старые того же типа и начисляет им наработку. Интервалы
+    установки (ComponentInstallation) меняются датой начала ремонта.
+    Если к началу ремонта у землесоса уже есть показания счётчика моточасов,
+    наработку снятому агрегату начислила телеметрия — RepairItem.hours
+    сохраняется, но не прибавляется повторно (см. telemetry).
+
+    entries — [(ремонт, validated items), …] в порядке применения; ремонты
+    могут относиться к разным землесосам. Состояние парка моделируется в
+    памяти, в БД уходят: один запрос за агрегатами, один — за началом
+    телеметрии землесосов, два bulk_update
+    (снятые / установленные), bulk_create позиций и записей журнала
+    наработки, перемещения одним ComponentInstallation.objects.move() —
+    число запросов не зависит ни от числа ремонтов, ни от
+    числа позиций.
+    Возвращает созданные позиции по каждому ремонту.
+    """
+    dredger_ids = {repair.dredger_id for repair, _ in entries}
+    item_ids = {item["component"].id for _, items in entries for item in items}
+    part_ids = {item["component"].part_id for _, items in entries for item in items}
+
+    # упомянутые агрегаты + установленные на этих землесосах агрегаты тех же типов,
+    # свежие из БД и по одному объекту на id
+    comps = {c.id: c for c in (ComponentInstance.objects
+                               .filter(Q(id__in=item_ids)
+                                       | Q(current_dredger__in=dredger_ids, part_id__in=part_ids))
+                               .select_related("part")
+                               .order_by("id"))}
+    # (землесос, запчасть) → установленные агрегаты по возрастанию id
+    # (так же, как .first() выбирал «старый» агрегат)
+    installed = defaultdict(list)
+    for comp in comps.values():
+        if comp.current_dredger_id in dredger_ids:
+            installed[(comp.current_dredger_id, comp.part_id)].append(comp)
+
+    # землесос → первое показание счётчика: с него наработку ведёт телеметрия
+    telemetry_since = dict(HourMeterReading.objects.filter(dredger__in=dredger_ids)
+                           .values("dredger").annotate(first=Min("read_at"))
+                           .values_list("dredger", "first"))
+
+    detached, attached, result, all_items, ledger, moves = {}, {}, [], [], [], []
+    for repair, items_data in entries:
+        items = []
+        moment = start_of_day(repair.start_date)
+        since = telemetry_since.get(repair.dredger_id)
+        metered = since is not None and since <= moment
+        for item in items_data:
+            comp = comps[item["component"].id]
+            # наработка старого агрегата до замены — если её не учла телеметрия
+            hours = 0 if metered else item.get("hours", 0)
+            # Отвязываем старый агрегат этого типа от землесоса (если есть) и обновляем его наработку
+            current = installed[(repair.dredger_id, comp.part_id)]
+            if current:
+                old_comp = current.pop(0)
+                old_comp.current_dredger = None
+                old_comp.total_hours += hours
+                old_comp.wear_pct = wear_percent(old_comp.total_hours, old_comp.part.norm_hours)
+                detached[old_comp.id] = old_comp
+                moves.append((old_comp.id, None, moment, old_comp.total_hours, None))
+                if hours:
+                    ledger.append(ComponentHistory(
+                        component=old_comp, repair=repair, source=ComponentHistory.REPAIR,
+                        hours_delta=hours, total_hours=old_comp.total_hours,
+                        created_at=moment))       # датой ремонта, а не записи — для hours_at()
+            # агрегат мог стоять на другом землесосе (или выше в этом же списке)
+            previous = installed.get((comp.current_dredger_id, comp.part_id))
+            if previous and comp in previous:
+                previous.remove(comp)
+            # Привязываем новый агрегат к землесосу
+            comp.current_dredger = repair.dredger
+            insort(current, comp, key=lambda c: c.id)
+            attached[comp.id] = comp
+            moves.append((comp.id, repair.dredger_id, moment, comp.total_hours, repair.id))
+            items.append(RepairItem(repair=repair, **{**item, "component": comp}))
+        result.append(items)
+        all_items.extend(items)
+
+    ComponentInstance.objects.bulk_update(
+        detached.values(), ["current_dredger", "total_hours", "wear_pct"])
+    ComponentInstance.objects.bulk_update(attached.values(), ["current_dredger"])
+    RepairItem.objects.bulk_create(all_items)
+    ComponentHistory.objects.bulk_create(ledger)
+    ComponentInstallation.objects.move(moves)
+    for comp in detached.values():
+        comp._ledger_hours = comp.total_hours
+    for comp in (*detached.values(), *attached.values()):
+        comp._installed_on = comp.current_dredger_id
+    bulk_changed.send(sender=ComponentInstance)
+    bulk_changed.send(sender=RepairItem)
+    return result
+
+
+def validate_repair_batch(entries: list, context: dict) -> tuple[list, dict]:
+    """
+    Проверяет пакет ремонтов. Землесосы и агрегаты всех записей загружаются
+    заранее двумя запросами, дальше каждая запись проверяется без обращений к БД.
+    Возвращает ([(индекс, validated_data), …], {индекс: ошибки}).
+    """
+    prefetch_into(context, Dredger, _int_values(entries, "dredger_id"))
+    prefetch_into(context, ComponentInstance, {
+        pk for entry in entries if isinstance(entry, dict)
+        for pk in _int_values(entry.get("items"), "component")
+    })
+    valid, errors = [], {}
+    for index, entry in enumerate(entries):
+        serializer = RepairSerializer(data=entry, context=context)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors[index] = serializer.errors
+    return valid, errors
+
+
+def create_repairs(validated: list[dict], user) -> list[Repair]:
+    """
+    Сохраняет проверенные ремонты пакетом: bulk_create ремонтов и один
+    apply_repair_items на все позиции. Вызывать внутри transaction.atomic().
+    """
+    repairs = Repair.objects.bulk_create([
+        Repair(**{k: v for k, v in data.items() if k != "items"},
+               created_by=user, updated_by=user)
+        for data in validated
+    ])
+    items = apply_repair_items([(repair, data["items"])
+                                for repair, data in zip(repairs, validated)])
+    for repair, repair_items in zip(repairs, items):
+        repair.applied_items = repair_items
+    # bulk_create не вызывает post_save
+    bulk_changed.send(sender=Repair)
+    return repairs
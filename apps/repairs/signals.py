@@ -0,0 +1,15 @@
+"""
+Поддержка денормализованных полей агрегатов.
+"""
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from apps.refdata.models import SparePart
+from .models import ComponentInstance
+
+
+@receiver(post_save, sender=SparePart, dispatch_uid="component-wear-on-norm-change")
+def refresh_wear_on_norm_change(sender, instance, created, **kwargs):
+    # норма могла измениться — пересчитываем износ всех экземпляров одним UPDATE
+    if not created:
+        ComponentInstance.objects.filter(part=instance).refresh_wear()
@@ -0,0 +1,233 @@
+"""
+apps/repairs/telemetry.py · загрузка показаний счётчиков моточасов
+
+    python manage.py ingest_hours shift.ndjson
+    POST /api/telemetry/hours/   (тело — NDJSON или multipart, поле file)
+
+Одна строка — одно показание:
+    {"dredger": "<хоз. номер>" | "dredger_id": <id>, "at": "<ISO дата-время>", "hours": <счётчик>}
+
+Схема:
+    1. Строки разбираются и проверяются без обращений к БД; землесосы
+       разрешаются одним запросом.
+    2. В одной транзакции: последнее сохранённое показание по каждому
+       землесосу и уже загруженные показания из окна времени пакета —
+       два запроса. Повтор (тот же землесос и момент, то же значение)
+       пропускается, поэтому файл можно загружать повторно.
+    3. Приращение каждой пары соседних показаний = разность их целых
+       часов (первое показание землесоса — только точка отсчёта). Оно
+       начисляется агрегатам, стоявшим на землесосе в момент второго
+       показания (по интервалам ComponentInstallation), — замена внутри
+       пакета делит часы между снятым и новым агрегатом. Итог по агрегату —
+       одним UPDATE … CASE id, износ пересчитывается refresh_wear(), в журнал
+       наработки (ComponentHistory, source=telemetry) — одна запись на
+       агрегат за пакет через bulk_create. save() не вызывается.
+
+Телеметрия — единственный источник наработки землесоса с момента его
+первого показания: RepairItem.hours ремонтов после этого момента
+сохраняется, но снятому агрегату не начисляется (apply_repair_items).
+"""
+import json
+import math
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.core.signals import bulk_changed
+from .models import ComponentHistory, ComponentInstallation, ComponentInstance, Dredger, HourMeterReading
+
+# землесосов в одном UPDATE … CASE (ограничение на число параметров SQLite)
+UPDATE_CHUNK = 500
+
+
+def read_lines(fh) -> Iterable[tuple[int, str]]:
+    """(номер строки, текст) из бинарного или текстового потока, без пустых строк."""
+    for line_no, raw in enumerate(fh, 1):
+        line = raw.decode("utf-8-sig") if isinstance(raw, bytes) else raw
+        if line.strip():
+            yield line_no, line
+
+
+def _parse(line: str) -> dict:
+    try:
+        data = json.loads(line)
+    except ValueError:
+        raise ValueError("Invalid JSON")
+    if not isinstance(data, dict):
+        raise ValueError("Reading must be a JSON object")
+
+    if data.get("dredger_id") is not None:
+        if not isinstance(data["dredger_id"], int):
+            raise ValueError("dredger_id must be an integer")
+        dredger = data["dredger_id"]
+    elif isinstance(data.get("dredger"), str) and data["dredger"].strip():
+        dredger = data["dredger"].strip()
+    else:
+        raise ValueError("dredger or dredger_id is required")
+
+    at = data.get("at")
+    moment = parse_datetime(at) if isinstance(at, str) else None
+    if moment is None:
+        raise ValueError("at must be an ISO datetime")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+
+    hours = data.get("hours")
+    if isinstance(hours, bool) or not isinstance(hours, (int, float)) or not math.isfinite(hours) or hours < 0:
+        raise ValueError("hours must be a non-negative number")
+    return {"dredger": dredger, "at": moment, "hours": float(hours)}
+
+
+class HoursIngest:
+    def __init__(self):
+        self.errors: list[dict] = []
+        self.total = 0
+        self.duplicates = 0
+        self.applied = 0
+        self.components = 0
+
+    def error(self, line_no: int, message: str) -> None:
+        self.errors.append({"line": line_no, "error": message})
+
+    def run(self, lines: Iterable[tuple[int, str]]) -> dict:
+        parsed = []
+        for line_no, line in lines:
+            self.total += 1
+            try:
+                parsed.append((line_no, _parse(line)))
+            except ValueError as exc:
+                self.error(line_no, str(exc))
+
+        readings = self.resolve(parsed)
+        if readings:
+            with transaction.atomic():
+                deltas = self.accept(readings)
+                self.credit(deltas)
+            if deltas:
+                bulk_changed.send(sender=ComponentInstance)
+        return self.report()
+
+    def resolve(self, parsed) -> dict[int, list[tuple[int, datetime, float]]]:
+        """Землесос → [(строка, момент, показание), …] по времени; ключи — id."""
+        numbers = {r["dredger"] for _, r in parsed if isinstance(r["dredger"], str)}
+        ids = {r["dredger"] for _, r in parsed if isinstance(r["dredger"], int)}
+        known_ids, by_number = set(), {}
+        for pk, number in Dredger.objects.filter(Q(inv_number__in=numbers) | Q(id__in=ids)) \
+                                         .values_list("id", "inv_number"):
+            known_ids.add(pk)
+            by_number[number] = pk
+
+        readings = {}
+        for line_no, r in parsed:
+            pk = by_number.get(r["dredger"]) if isinstance(r["dredger"], str) else r["dredger"]
+            if pk is None or pk not in known_ids:
+                self.error(line_no, f"Unknown dredger: {r['dredger']}")
+                continue
+            readings.setdefault(pk, []).append((line_no, r["at"], r["hours"]))
+        for rows in readings.values():
+            rows.sort(key=lambda row: row[1])
+        return readings
+
+    def accept(self, readings) -> dict[int, tuple[int, datetime]]:
+        """
+        Отбирает новые показания и сохраняет их.
+        Возвращает {землесос: [(приращение в целых часах, момент показания), …]}
+        — по одному на пару соседних показаний с ненулевым приращением.
+        """
+        moments = [at for rows in readings.values() for _, at, _ in rows]
+        stored = {(d, at): h for d, at, h in HourMeterReading.objects
+                  .filter(dredger__in=readings.keys(), read_at__gte=min(moments), read_at__lte=max(moments))
+                  .values_list("dredger_id", "read_at", "hours")}
+        latest = HourMeterReading.objects.filter(dredger=OuterRef("pk")).order_by("-read_at")
+        last = {pk: (at, hours) for pk, at, hours in Dredger.objects
+                .filter(pk__in=readings.keys())
+                .annotate(at=Subquery(latest.values("read_at")[:1]),
+                          hours=Subquery(latest.values("hours")[:1]))
+                .values_list("pk", "at", "hours")}
+
+        new, deltas = [], {}
+        for dredger_id, rows in readings.items():
+            last_at, prev = last.get(dredger_id, (None, None))
+            for line_no, at, hours in rows:
+                if (dredger_id, at) in stored:
+                    if stored[(dredger_id, at)] == hours:
+                        self.duplicates += 1
+                    else:
+                        self.error(line_no, "Conflicting reading already stored for this moment")
+                    continue
+                if last_at is not None and at < last_at:
+                    self.error(line_no, "Reading is older than the last stored reading")
+                    continue
+                if prev is not None and hours < prev:
+                    self.error(line_no, "Hour meter went backwards")
+                    continue
+                stored[(dredger_id, at)] = hours        # повтор внутри пакета — дубликат
+                new.append(HourMeterReading(dredger_id=dredger_id, read_at=at, hours=hours))
+                # первое показание землесоса — только точка отсчёта
+                if prev is not None and math.floor(hours) > math.floor(prev):
+                    deltas.setdefault(dredger_id, []).append((math.floor(hours) - math.floor(prev), at))
+                prev, last_at = hours, at
+
+        HourMeterReading.objects.bulk_create(new)
+        self.applied = len(new)
+        return deltas
+
+    def credit(self, deltas) -> None:
+        """
+        Начисляет приращение каждой пары соседних показаний агрегатам,
+        стоявшим на землесосе в момент второго из них (как
+        ComponentInstallation.objects.at()), и пишет журнал наработки.
+        Состав берётся по интервалам установки, а не по current_dredger:
+        замена может случиться внутри пакета или прийти раньше показаний.
+        Один SELECT интервалов на порцию землесосов.
+        """
+        credited = {}                       # агрегат → (часы, момент последнего начисления)
+        pks = list(deltas)
+        for i in range(0, len(pks), UPDATE_CHUNK):
+            chunk = pks[i:i + UPDATE_CHUNK]
+            moments = [at for pk in chunk for _, at in deltas[pk]]
+            intervals = defaultdict(list)
+            for comp_id, dredger_id, installed_at, removed_at in (
+                    ComponentInstallation.objects
+                    .filter(Q(removed_at__isnull=True) | Q(removed_at__gt=min(moments)),
+                            dredger__in=chunk, installed_at__lte=max(moments))
+                    .values_list("component_id", "dredger_id", "installed_at", "removed_at")):
+                intervals[dredger_id].append((comp_id, installed_at, removed_at))
+            for dredger_id in chunk:
+                for hours, at in deltas[dredger_id]:
+                    for comp_id, installed_at, removed_at in intervals[dredger_id]:
+                        if installed_at <= at and (removed_at is None or removed_at > at):
+                            total, latest = credited.get(comp_id, (0, at))
+                            credited[comp_id] = (total + hours, max(latest, at))
+
+        ledger = []
+        ids = list(credited)
+        for i in range(0, len(ids), UPDATE_CHUNK):
+            chunk = ids[i:i + UPDATE_CHUNK]
+            comps = ComponentInstance.objects.filter(id__in=chunk)
+            comps.update(total_hours=F("total_hours") + Case(
+                *[When(id=pk, then=Value(credited[pk][0])) for pk in chunk],
+                default=Value(0), output_field=IntegerField()))
+            comps.refresh_wear()
+            for comp_id, total in comps.values_list("id", "total_hours"):
+                hours, at = credited[comp_id]
+                ledger.append(ComponentHistory(component_id=comp_id, source=ComponentHistory.TELEMETRY,
+                                               hours_delta=hours, total_hours=total, created_at=at))
+        ComponentHistory.objects.bulk_create(ledger, batch_size=5000)
+        self.components = len(ledger)
+
+    def report(self) -> dict:
+        self.errors.sort(key=lambda e: e["line"])
+        return {
+            "total": self.total,
+            "applied": self.applied,
+            "duplicates": self.duplicates,
+            "failed": len(self.errors),
+            "components": self.components,
+            "errors": self.errors,
+        }
@@ -1,3 +1,676 @@
+import json
+from datetime import date, datetime
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.deviations.models import Deviation
+from apps.refdata import bom
+from apps.refdata.models import DredgerType, DredgerTypePart, SparePart
+from . import views
+from .models import (ComponentHistory, ComponentInstallation, ComponentInstance, Dredger, Repair, RepairItem,
+                     start_of_day)
+
+
+class RepairTestBase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer", is_staff=True)
+        dtype = DredgerType.objects.create(name="ЗГМ", code="ZGM")
+        cls.parts = [SparePart.objects.create(code=f"P-{i}", name=f"Узел {i}", norm_hours=1000)
+                     for i in range(12)]
+        DredgerTypePart.objects.bulk_create(
+            [DredgerTypePart(dredger_type=dtype, part=p) for p in cls.parts])
+        cls.dredger = Dredger.objects.create(inv_number="D-1", type=dtype)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # кэш состава живёт в процессе, а откат транзакции теста сигналов не шлёт
+        bom.invalidate()
+
+    def install(self, part, hours=0):
+        return ComponentInstance.objects.create(part=part, current_dredger=self.dredger, total_hours=hours)
+
+    def spare(self, part, hours=0):
+        return ComponentInstance.objects.create(part=part, total_hours=hours)
+
+
+class RepairCreateTests(RepairTestBase):
+    def post_repair(self, items):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post("/api/repairs/", {
+                "dredger_id": self.dredger.id,
+                "start_date": "2024-03-01",
+                "end_date":   "2024-03-05",
+                "items":      items,
+            }, format="json")
+        self.assertEqual(resp.status_code, 201, resp.data)
+        return resp, len(ctx.captured_queries)
+
+    def test_replacement_detaches_old_and_credits_hours(self):
+        old = self.install(self.parts[0], hours=300)
+        new = self.spare(self.parts[0], hours=50)
+        first = self.spare(self.parts[1])            # тип без установленного агрегата
+
+        resp, _ = self.post_repair([
+            {"component": new.id, "hours": 120, "note": "замена"},
+            {"component": first.id, "hours": 0},
+        ])
+
+        old.refresh_from_db()
+        new.refresh_from_db()
+        first.refresh_from_db()
+        self.assertIsNone(old.current_dredger)
+        self.assertEqual(old.total_hours, 420)
+        self.assertAlmostEqual(old.wear_pct, 42.0)
+        self.assertEqual(new.current_dredger, self.dredger)
+        self.assertEqual(new.total_hours, 50)
+        self.assertEqual(first.current_dredger, self.dredger)
+
+        repair = Repair.objects.get()
+        self.assertEqual(
+            list(repair.items.order_by("id").values_list("component", "hours", "note")),
+            [(new.id, 120, "замена"), (first.id, 0, "")],
+        )
+        self.assertEqual([i["component"]["id"] for i in resp.data["items_read"]], [new.id, first.id])
+
+    def test_same_part_twice_replaces_in_order(self):
+        old = self.install(self.parts[0], hours=100)
+        a, b = self.spare(self.parts[0]), self.spare(self.parts[0])
+        self.post_repair([{"component": a.id, "hours": 10}, {"component": b.id, "hours": 20}])
+
+        old.refresh_from_db()
+        a.refresh_from_db()
+        b.refresh_from_db()
+        # первым снимается ранее установленный агрегат, затем только что поставленный «a»
+        self.assertEqual((old.current_dredger, old.total_hours), (None, 110))
+        self.assertEqual((a.current_dredger, a.total_hours), (None, 20))
+        self.assertEqual(b.current_dredger, self.dredger)
+
+    def test_unknown_component_is_rejected(self):
+        resp = self.client.post("/api/repairs/", {
+            "dredger_id": self.dredger.id, "start_date": "2024-03-01", "end_date": "2024-03-05",
+            "items": [{"component": 999999, "hours": 1}],
+        }, format="json")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("component", resp.data["items"][0])
+        self.assertFalse(RepairItem.objects.exists())
+
+    def test_query_count_does_not_depend_on_item_count(self):
+        def items(parts):
+            for p in parts:
+                self.install(p, hours=10)
+            return [{"component": self.spare(p).id, "hours": 5} for p in parts]
+
+        _, small = self.post_repair(items(self.parts[:2]))
+        _, large = self.post_repair(items(self.parts[2:12]))
+        self.assertEqual(small, large)
+
+
+class RepairBatchTests(RepairTestBase):
+    def entry(self, items, start="2024-03-01", end="2024-03-05"):
+        return {"dredger_id": self.dredger.id, "start_date": start, "end_date": end, "items": items}
+
+    def post_batch(self, entries, query=""):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(f"/api/repairs/batch/{query}", entries, format="json")
+        return resp, len(ctx.captured_queries)
+
+    def test_batch_applies_entries_in_order(self):
+        old = self.install(self.parts[0], hours=100)
+        a, b = self.spare(self.parts[0]), self.spare(self.parts[0])
+        resp, _ = self.post_batch([
+            self.entry([{"component": a.id, "hours": 10}]),
+            self.entry([{"component": b.id, "hours": 20}], start="2024-03-06", end="2024-03-07"),
+        ])
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertEqual(resp.data["created"], 2)
+
+        old.refresh_from_db()
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((old.current_dredger, old.total_hours), (None, 110))
+        self.assertEqual((a.current_dredger, a.total_hours), (None, 20))
+        self.assertEqual(b.current_dredger, self.dredger)
+        self.assertEqual(Repair.objects.count(), 2)
+        self.assertEqual(RepairItem.objects.count(), 2)
+
+    def test_invalid_entries_are_reported(self):
+        ok = self.spare(self.parts[0])
+        resp, _ = self.post_batch([
+            self.entry([{"component": ok.id, "hours": 1}]),
+            self.entry([{"component": 999999, "hours": 1}]),
+            self.entry([], start="2024-03-05", end="2024-03-01"),
+        ])
+        self.assertEqual(resp.status_code, 207)
+        self.assertEqual([r["status"] for r in resp.data["results"]], ["created", "error", "error"])
+        self.assertIn("items", resp.data["results"][1]["errors"])
+        self.assertIn("end_date", resp.data["results"][2]["errors"])
+        self.assertEqual(Repair.objects.count(), 1)
+
+    def test_atomic_batch_saves_nothing_on_error(self):
+        ok = self.spare(self.parts[0])
+        resp, _ = self.post_batch([
+            self.entry([{"component": ok.id, "hours": 1}]),
+            self.entry([{"component": 999999, "hours": 1}]),
+        ], query="?atomic=1")
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual([r["status"] for r in resp.data["results"]], ["skipped", "error"])
+        self.assertFalse(Repair.objects.exists())
+
+    def test_failed_chunk_is_reported_per_entry(self):
+        entries = [self.entry([{"component": self.spare(p).id, "hours": 1}]) for p in self.parts[:3]]
+        create_repairs, calls = views.create_repairs, []
+
+        def failing_second_chunk(data, user):
+            calls.append(data)
+            if len(calls) == 2:
+                raise RuntimeError("disk full")
+            return create_repairs(data, user)
+
+        with mock.patch.object(views.RepairViewSet, "batch_chunk_size", 1), \
+                mock.patch.object(views, "create_repairs", failing_second_chunk), \
+                self.assertLogs("apps.repairs.views", "ERROR"):
+            resp, _ = self.post_batch(entries)
+            self.assertEqual(resp.status_code, 207)
+            self.assertEqual([r["status"] for r in resp.data["results"]], ["created", "error", "created"])
+            self.assertEqual(Repair.objects.count(), 2)
+
+            calls.clear()
+            resp, _ = self.post_batch(entries, query="?atomic=1")
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(len(calls), 2)                # сбой порции, а не ошибка проверки
+            self.assertEqual([r["status"] for r in resp.data["results"]], ["skipped", "error", "skipped"])
+            self.assertEqual(Repair.objects.count(), 2)
+
+    def test_batch_query_count_does_not_depend_on_size(self):
+        def entries(parts):
+            return [self.entry([{"component": self.spare(p).id, "hours": 5}]) for p in parts]
+
+        small_resp, small = self.post_batch(entries(self.parts[:2]))
+        large_resp, large = self.post_batch(entries(self.parts[2:12]))
+        self.assertEqual((small_resp.status_code, large_resp.status_code), (201, 201))
+        self.assertEqual(small, large)
+
+
+class RepairListTests(RepairTestBase):
+    def add_repairs(self, count):
+        for n in range(count):
+            repair = Repair.objects.create(dredger=self.dredger, start_date="2024-01-01",
+                                           end_date="2024-01-02", created_by=self.user, updated_by=self.user)
+            for part in self.parts[:3]:
+                RepairItem.objects.create(repair=repair, component=self.spare(part), hours=n)
+
+    def get_list(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get("/api/repairs/", params)
+        self.assertEqual(resp.status_code, 200)
+        return resp, len(ctx.captured_queries)
+
+    def test_list_is_compact(self):
+        self.add_repairs(1)
+        resp, _ = self.get_list()
+        row = resp.data["results"][0]
+        self.assertNotIn("items_read", row)
+        self.assertEqual(row["component"], "Узел 0, Узел 1, Узел 2")
+        self.assertEqual((row["items_count"], row["status"]), (3, "completed"))
+        self.assertEqual(row["dredger"]["type_name"], "ЗГМ")
+
+        resp, _ = self.get_list(expand="items")
+        self.assertEqual(len(resp.data["results"][0]["items_read"]), 3)
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        self.add_repairs(2)
+        _, small = self.get_list()
+        _, small_expanded = self.get_list(expand="items")
+        self.add_repairs(20)
+        _, large = self.get_list()
+        _, large_expanded = self.get_list(expand="items")
+        self.assertEqual(small, large)
+        self.assertEqual(small_expanded, large_expanded)
+
+
+class ComponentLedgerTests(RepairTestBase):
+    def test_repair_and_manual_edit_are_recorded(self):
+        old = self.install(self.parts[0], hours=300)
+        new = self.spare(self.parts[0])
+        self.client.post("/api/repairs/batch/", [{
+            "dredger_id": self.dredger.id, "start_date": "2024-03-01", "end_date": "2024-03-05",
+            "items": [{"component": new.id, "hours": 120}],
+        }], format="json")
+        resp = self.client.patch(f"/api/components/{old.id}/", {"total_hours": 500}, format="json")
+        self.assertEqual(resp.status_code, 200, resp.data)
+
+        self.assertEqual(
+            list(old.history.order_by("id").values_list("source", "hours_delta", "total_hours")),
+            [(ComponentHistory.INITIAL, 300, 300), (ComponentHistory.REPAIR, 120, 420),
+             (ComponentHistory.MANUAL, 80, 500)],
+        )
+        entry = old.history.get(source=ComponentHistory.REPAIR)
+        self.assertEqual(entry.repair, Repair.objects.get())
+        with self.assertRaises(ValueError):
+            entry.save()
+
+    def test_backdated_repair_is_recorded_at_repair_date(self):
+        old = self.install(self.parts[0])
+        new = self.spare(self.parts[0])
+        self.client.post("/api/repairs/batch/", [{
+            "dredger_id": self.dredger.id, "start_date": "2024-03-01", "end_date": "2024-03-05",
+            "items": [{"component": new.id, "hours": 120}],
+        }], format="json")
+        entry = old.history.get(source=ComponentHistory.REPAIR)
+        self.assertEqual(entry.created_at, start_of_day(date(2024, 3, 1)))
+        self.assertEqual(ComponentHistory.objects.hours_at(old.id, date(2024, 3, 1)), 120)
+        self.assertEqual(ComponentHistory.objects.hours_at(old.id, date(2024, 2, 29)), 0)
+
+        # удаление ремонта не стирает историю наработки
+        Repair.objects.get().delete()
+        entry.refresh_from_db()
+        self.assertIsNone(entry.repair)
+
+    def test_backdated_entry_keeps_running_totals_in_date_order(self):
+        comp = self.spare(self.parts[0])
+
+        def at(day):
+            return timezone.make_aware(datetime(2024, 3, day))
+
+        # ремонт за 5 марта внесён после показаний за 6 марта: total_hours — в порядке вставки
+        ComponentHistory.objects.bulk_create([
+            ComponentHistory(component=comp, source=ComponentHistory.INITIAL, hours_delta=100,
+                             total_hours=100, created_at=at(1)),
+            ComponentHistory(component=comp, source=ComponentHistory.TELEMETRY, hours_delta=10,
+                             total_hours=110, created_at=at(6)),
+            ComponentHistory(component=comp, source=ComponentHistory.REPAIR, hours_delta=50,
+                             total_hours=160, created_at=at(5)),
+        ])
+        resp = self.client.get(f"/api/components/{comp.id}/history/")
+        self.assertEqual([(r["source"], r["total_hours"]) for r in resp.data["results"]],
+                         [("telemetry", 160), ("repair", 150), ("initial", 100)])
+        self.assertEqual(ComponentHistory.objects.hours_at(comp.id, at(5)), 150)
+
+    def test_ledger_backfill_keeps_repair_history(self):
+        ledger = import_module("apps.repairs.migrations.0005_componenthistory_ledger")
+        comp, short, plain = ComponentInstance.objects.bulk_create([
+            ComponentInstance(part=self.parts[0], total_hours=300),
+            ComponentInstance(part=self.parts[1], total_hours=40),
+            ComponentInstance(part=self.parts[2], total_hours=7),
+        ])
+        early, late = (Repair.objects.create(dredger=self.dredger, start_date=day, end_date=day,
+                                             created_by=self.user, updated_by=self.user)
+                       for day in (date(2024, 3, 1), date(2024, 4, 1)))
+        RepairItem.objects.bulk_create([
+            RepairItem(repair=late, component=comp, hours=70), RepairItem(repair=early, component=comp, hours=50),
+            RepairItem(repair=early, component=short, hours=60),
+        ])
+        ComponentHistory.objects.all().delete()
+
+        ledger.open_ledger(django_apps, None)
+
+        def rows(c):
+            return list(c.history.order_by("created_at", "id")
+                        .values_list("source", "repair_id", "hours_delta", "total_hours"))
+
+        self.assertEqual(rows(comp), [("initial", None, 180, 180), ("repair", early.id, 50, 230),
+                                      ("repair", late.id, 70, 300)])
+        self.assertEqual(comp.history.get(repair=early).created_at, start_of_day(date(2024, 3, 1)))
+        self.assertEqual(rows(short), [("repair", early.id, 60, 60), ("initial", None, -20, 40)])
+        self.assertEqual(rows(plain), [("initial", None, 7, 7)])
+
+    def test_history_and_hours_at_date(self):
+        comp = self.spare(self.parts[0])
+        ComponentHistory.objects.bulk_create([
+            ComponentHistory(component=comp, hours_delta=100, total_hours=total,
+                             created_at=timezone.make_aware(datetime(2024, month, 1)))
+            for month, total in ((1, 100), (2, 200), (3, 300))
+        ])
+        resp = self.client.get(f"/api/components/{comp.id}/history/",
+                               {"date_after": "2024-01-15", "date_before": "2024-03-01"})
+        self.assertEqual([r["total_hours"] for r in resp.data["results"]], [300, 200])
+
+        self.assertEqual(ComponentHistory.objects.hours_at(comp.id, date(2024, 2, 15)), 200)
+        self.assertEqual(ComponentHistory.objects.hours_at(comp.id, date(2023, 12, 31)), 0)
+        resp = self.client.get(f"/api/components/{comp.id}/hours/", {"at": "2024-03-01"})
+        self.assertEqual(resp.data["total_hours"], 300)
+
+
+class AvailableComponentsTests(RepairTestBase):
+    def test_filters_orders_limits_and_groups(self):
+        pump, motor = self.parts[0], self.parts[1]
+        worn = self.spare(pump, hours=1000)            # норма выработана
+        self.install(pump, hours=10)                   # установлен
+        a, b, c = self.spare(pump, 500), self.spare(pump, 100), self.spare(pump, 300)
+        m = self.spare(motor, 0)
+
+        url = "/api/available-components/"
+        resp = self.client.get(url, {"part_ids": f"{pump.id},{motor.id}"})
+        self.assertEqual([r["id"] for r in resp.data], [b.id, c.id, a.id, m.id])
+        self.assertNotIn(worn.id, [r["id"] for r in resp.data])
+
+        resp = self.client.get(url, {"part_ids": f"{pump.id},{motor.id}", "limit": 2, "group": "part"})
+        self.assertEqual({k: [r["id"] for r in v] for k, v in resp.data.items()},
+                         {pump.id: [b.id, c.id], motor.id: [m.id]})
+        self.assertEqual(self.client.get(url, {"part_ids": "x"}).status_code, 400)
+
+
+class DredgerBOMTests(RepairTestBase):
+    def template(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(f"/api/dredgers/{self.dredger.id}/template/")
+        self.assertEqual(resp.status_code, 200)
+        return resp.data, len(ctx.captured_queries)
+
+    def test_template_reads_bom_once_and_refreshes_on_change(self):
+        self.install(self.parts[0], hours=10)
+        data, cold = self.template()
+        self.assertEqual(len(data), 12)
+        data, warm = self.template()
+        self.assertEqual(warm, cold - 1)           # остаётся только запрос агрегатов
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DredgerTypePart.objects.filter(part=self.parts[11]).delete()
+        self.assertEqual(len(self.template()[0]), 11)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.parts[0].norm_hours = 2000
+            self.parts[0].save()
+        row = next(r for r in self.template()[0] if r["part_id"] == self.parts[0].id)
+        self.assertEqual(row["norm_hours"], 2000)
+
+    def test_load_racing_invalidate_is_not_cached(self):
+        load = bom.load
+
+        def racing_load(type_ids):
+            loaded = load(type_ids)
+            bom.invalidate()                       # справочник изменили, пока шёл запрос
+            return loaded
+
+        with mock.patch.object(bom, "load", racing_load):
+            self.assertEqual(len(bom.get_bom(self.dredger.type_id).parts), 12)
+        with self.assertNumQueries(1):             # устаревший состав не сохранён
+            bom.get_bom(self.dredger.type_id)
+        with self.assertNumQueries(0):
+            bom.get_bom(self.dredger.type_id)
+
+    def test_add_component_checks_compatibility_by_bom(self):
+        foreign = SparePart.objects.create(code="X", name="Чужой", norm_hours=100)
+        url = f"/api/dredgers/{self.dredger.id}/add_component/"
+        resp = self.client.post(url, {"component_id": self.spare(foreign).id}, format="json")
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.post(url, {"component_id": self.spare(self.parts[3]).id}, format="json")
+        self.assertEqual(resp.status_code, 200, resp.data)
+
+    def test_fleet_compliance(self):
+        other_type = DredgerType.objects.create(name="Другой", code="OTH")
+        DredgerTypePart.objects.create(dredger_type=other_type, part=self.parts[0])
+        for part in self.parts:
+            self.install(part)
+        dup = self.install(self.parts[1])
+        d2 = Dredger.objects.create(inv_number="D-2", type=other_type)
+        wrong = ComponentInstance.objects.create(part=self.parts[5], current_dredger=d2)
+        Dredger.objects.create(inv_number="D-3", type=other_type)
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get("/api/dredgers/compliance/")
+        self.assertEqual(len(ctx.captured_queries), 3)
+        by_no = {r["inv_number"]: r for r in resp.data}
+        self.assertEqual(by_no["D-1"]["duplicates"][0]["component_ids"][-1], dup.id)
+        self.assertEqual(by_no["D-1"]["missing"], [])
+        self.assertEqual([m["part_id"] for m in by_no["D-2"]["missing"]], [self.parts[0].id])
+        self.assertEqual([c["component_id"] for c in by_no["D-2"]["incompatible"]], [wrong.id])
+        self.assertFalse(by_no["D-3"]["compliant"])
+
+        dup.current_dredger = None
+        dup.save()
+        resp = self.client.get("/api/dredgers/compliance/", {"issues": 1})
+        self.assertEqual([r["inv_number"] for r in resp.data], ["D-2", "D-3"])
+
+
+class DredgerSwapTests(RepairTestBase):
+    def swap(self, **body):
+        return self.client.post(f"/api/dredgers/{self.dredger.id}/swap/", body, format="json")
+
+    def test_swap_installs_and_removes_and_returns_template(self):
+        old = self.install(self.parts[0], hours=300)
+        new, extra = self.spare(self.parts[0]), self.spare(self.parts[1])
+        resp = self.swap(install=[new.id, extra.id], remove=[old.id])
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertEqual(set(self.dredger.components.values_list("id", flat=True)), {new.id, extra.id})
+        row = next(r for r in resp.data["template"] if r["part_id"] == self.parts[0].id)
+        self.assertEqual(row["component_id"], new.id)
+        self.assertEqual(set(ComponentInstallation.objects.filter(removed_at__isnull=True)
+                             .values_list("component_id", flat=True)), {new.id, extra.id})
+        self.assertEqual(ComponentInstallation.objects.get(component=old).hours_removed, 300)
+
+    def test_conflicts_are_reported_per_component_and_nothing_changes(self):
+        other = Dredger.objects.create(inv_number="D-2", type=self.dredger.type)
+        busy = ComponentInstance.objects.create(part=self.parts[0], current_dredger=other)
+        foreign = self.spare(SparePart.objects.create(code="X", name="Чужой", norm_hours=10))
+        ok = self.spare(self.parts[2])
+        resp = self.swap(install=[busy.id, foreign.id, ok.id])
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual({c["component_id"] for c in resp.data["conflicts"]}, {busy.id, foreign.id})
+        self.assertFalse(self.dredger.components.exists())
+
+    def test_concurrent_install_is_detected_by_conditional_update(self):
+        other = Dredger.objects.create(inv_number="D-2", type=self.dredger.type)
+        first, raced = self.spare(self.parts[0]), self.spare(self.parts[1])
+        real_get_bom = views.get_bom
+
+        def install_elsewhere(type_id):
+            # другой пользователь успел между проверкой и записью
+            ComponentInstance.objects.filter(id=raced.id).update(current_dredger=other)
+            return real_get_bom(type_id)
+
+        with mock.patch.object(views, "get_bom", install_elsewhere):
+            resp = self.swap(install=[first.id, raced.id])
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.data["conflicts"], [{"component_id": raced.id,
+                                                   "error": "Component was installed concurrently"}])
+        first.refresh_from_db()
+        self.assertIsNone(first.current_dredger_id)
+
+
+class InstallationIntervalTests(RepairTestBase):
+    def components_as_of(self, day):
+        resp = self.client.get(f"/api/dredgers/{self.dredger.id}/components/", {"as_of": day})
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return {r["component_id"]: r for r in resp.data}
+
+    def test_repairs_and_manual_moves_write_intervals(self):
+        pump = self.parts[0]
+        with mock.patch("django.utils.timezone.now",
+                        return_value=timezone.make_aware(datetime(2024, 1, 1, 12))):
+            old = self.install(pump, hours=100)
+        new = self.spare(pump, hours=5)
+        self.client.post("/api/repairs/", {
+            "dredger_id": self.dredger.id, "start_date": "2024-03-01", "end_date": "2024-03-05",
+            "items": [{"component": new.id, "hours": 40}],
+        }, format="json")
+
+        self.assertEqual(set(self.components_as_of("2024-02-29")), {old.id})
+        march = self.components_as_of("2024-03-01")
+        self.assertEqual(set(march), {new.id})
+        self.assertEqual(march[new.id]["hours_installed"], 5)
+        closed = ComponentInstallation.objects.get(component=old)
+        self.assertEqual(closed.hours_removed, 140)
+        self.assertFalse(self.components_as_of("2023-12-31"))
+
+        resp = self.client.post(f"/api/dredgers/{self.dredger.id}/remove_component/",
+                                {"component_id": new.id}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(set(self.components_as_of(str(date.today()))), set())
+        self.assertEqual(ComponentInstallation.objects.filter(removed_at__isnull=True).count(), 0)
+
+    def test_deviation_detail_as_of(self):
+        comp = self.install(self.parts[0])
+        dev = Deviation.objects.create(created_by=self.user, updated_by=self.user,
+            dredger=self.dredger, date=date.today(), type=Deviation.MECH, location=Deviation.PNS,
+            last_ppr_date=date.today(), hours_at_deviation=1, description="течь",
+            shift_leader="a", mechanic="b", electrician="c")
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(f"/api/deviations/{dev.id}/", {"as_of": ""})
+        self.assertEqual([c["component_id"] for c in resp.data["components"]], [comp.id])
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+        resp = self.client.get(f"/api/deviations/{dev.id}/", {"as_of": "2000-01-01"})
+        self.assertEqual(resp.data["components"], [])
+        self.assertNotIn("components", self.client.get(f"/api/deviations/{dev.id}/").data)
+
+
+class TelemetryHoursTests(RepairTestBase):
+    def post(self, *readings, raw=""):
+        body = "\n".join([json.dumps(r) for r in readings] + ([raw] if raw else []))
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post("/api/telemetry/hours/", body, content_type="application/x-ndjson")
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return resp.data, len(ctx.captured_queries)
+
+    def backdate(self, day=date(2024, 1, 1)):
+        """Установленные агрегаты — «стоят с day» (save() пишет интервал текущим моментом)."""
+        ComponentInstallation.objects.update(installed_at=start_of_day(day))
+
+    def test_readings_credit_installed_components_idempotently(self):
+        pump = self.install(self.parts[0], hours=100)
+        motor = self.install(self.parts[1], hours=900)
+        spare = self.spare(self.parts[2], hours=5)
+        self.backdate()
+        shift = [{"dredger": "D-1", "at": f"2024-03-01T{h:02}:00:00", "hours": 5000 + h * 1.5}
+                 for h in range(8, 16)]
+        report, _ = self.post(*shift)
+        # первое показание — точка отсчёта: 5012 → 5022.5 = 10 целых часов
+        self.assertEqual((report["applied"], report["components"], report["failed"]), (8, 2, 0))
+        pump.refresh_from_db(); motor.refresh_from_db(); spare.refresh_from_db()
+        self.assertEqual((pump.total_hours, motor.total_hours, spare.total_hours), (110, 910, 5))
+        self.assertAlmostEqual(motor.wear_pct, 91.0)
+        entry = ComponentHistory.objects.get(component=pump, source=ComponentHistory.TELEMETRY)
+        self.assertEqual((entry.hours_delta, entry.total_hours, timezone.localtime(entry.created_at).hour),
+                         (10, 110, 15))
+
+        # повтор того же файла + одно новое показание
+        report, _ = self.post(*shift, {"dredger_id": self.dredger.id, "at": "2024-03-01T20:00:00",
+                                       "hours": 5030})
+        self.assertEqual((report["applied"], report["duplicates"]), (1, 8))
+        pump.refresh_from_db()
+        self.assertEqual(pump.total_hours, 118)
+
+    def test_bad_lines_are_reported_and_query_count_is_fixed(self):
+        Dredger.objects.bulk_create([Dredger(inv_number=f"F-{i}", type=self.dredger.type) for i in range(30)])
+        for d in Dredger.objects.filter(inv_number__startswith="F-"):
+            ComponentInstance.objects.create(part=self.parts[0], current_dredger=d)
+        self.install(self.parts[0])
+        self.backdate()
+        report, few = self.post({"dredger": "F-0", "at": "2024-03-01T08:00", "hours": 1},
+                                {"dredger": "F-0", "at": "2024-03-01T09:00", "hours": 3})
+        fleet = [{"dredger": f"F-{i}", "at": f"2024-03-02T{h:02}:00", "hours": 10 + h}
+                 for i in range(30) for h in range(10)]
+        report, many = self.post(
+            *fleet,
+            {"dredger": "F-0", "at": "2024-03-01T09:00", "hours": 4},      # другое значение
+            {"dredger": "F-1", "at": "2024-03-02T12:00", "hours": 1},      # счётчик назад
+            {"dredger": "NOPE", "at": "2024-03-02T12:00", "hours": 1},
+            {"dredger": "F-2", "at": "вчера", "hours": 1},
+            raw="{oops")
+        self.assertEqual(report["applied"], 300)
+        self.assertEqual(report["failed"], 5)
+        self.assertEqual(report["components"], 30)
+        # от размера пакета зависит только число порций bulk_create (лимит параметров SQLite)
+        self.assertLessEqual(many, few + 1)
+        self.assertEqual(ComponentInstance.objects.get(current_dredger__inv_number="F-5").total_hours, 9)
+
+    def replace(self, new, day, hours=0):
+        resp = self.client.post("/api/repairs/", {
+            "dredger_id": self.dredger.id, "start_date": day, "end_date": day,
+            "items": [{"component": new.id, "hours": hours}],
+        }, format="json")
+        self.assertEqual(resp.status_code, 201, resp.data)
+
+    def test_swap_inside_batch_splits_hours(self):
+        old = self.install(self.parts[0], hours=100)
+        self.backdate()
+        new = self.spare(self.parts[0])
+        self.replace(new, "2024-03-05")                      # снят 2024-03-05 00:00
+        report, _ = self.post({"dredger": "D-1", "at": "2024-03-04T20:00", "hours": 10},
+                              {"dredger": "D-1", "at": "2024-03-04T22:00", "hours": 15},
+                              {"dredger": "D-1", "at": "2024-03-05T08:00", "hours": 22})
+        self.assertEqual(report["components"], 2)
+        old.refresh_from_db(); new.refresh_from_db()
+        self.assertEqual((old.total_hours, new.total_hours), (105, 7))
+
+    def test_repair_hours_are_not_added_on_top_of_telemetry(self):
+        old = self.install(self.parts[0], hours=100)
+        self.backdate()
+        self.post({"dredger": "D-1", "at": "2024-03-01T08:00", "hours": 10},
+                  {"dredger": "D-1", "at": "2024-03-01T20:00", "hours": 22})
+        self.replace(self.spare(self.parts[0]), "2024-03-05", hours=50)
+        old.refresh_from_db()
+        self.assertEqual(old.total_hours, 112)
+        self.assertEqual(RepairItem.objects.get().hours, 50)
+        self.assertFalse(old.history.filter(source=ComponentHistory.REPAIR).exists())
+
+    def test_late_readings_credit_components_installed_at_that_time(self):
+        old = self.install(self.parts[0], hours=100)
+        self.backdate()
+        new = self.spare(self.parts[0])
+        # 2024-03-05 ремонт заменил агрегат, показания за 2024-03-01 пришли позже
+        self.client.post("/api/repairs/", {
+            "dredger_id": self.dredger.id, "start_date": "2024-03-05", "end_date": "2024-03-05",
+            "items": [{"component": new.id, "hours": 0}],
+        }, format="json")
+        report, _ = self.post({"dredger": "D-1", "at": "2024-03-01T08:00", "hours": 10},
+                              {"dredger": "D-1", "at": "2024-03-01T20:00", "hours": 22})
+        self.assertEqual(report["components"], 1)
+        old.refresh_from_db(); new.refresh_from_db()
+        self.assertEqual((old.total_hours, new.total_hours), (112, 0))
+        self.assertIsNone(old.current_dredger)
+
+        report, _ = self.post({"dredger": "D-1", "at": "2024-03-06T08:00", "hours": 30})
+        old.refresh_from_db(); new.refresh_from_db()
+        self.assertEqual((old.total_hours, new.total_hours), (112, 8))
+
+
+class ComponentWearTests(RepairTestBase):
+    def test_norm_change_recomputes_wear(self):
+        pump, motor = self.parts[:2]
+        worn = [self.install(pump, 250), self.spare(pump, 900)]
+        other = self.install(motor, 500)
+        self.assertEqual([c.wear_pct for c in worn], [25.0, 90.0])
+
+        pump.norm_hours = 500
+        with self.assertNumQueries(2):                 # UPDATE запчасти + один UPDATE агрегатов
+            pump.save()
+        self.assertEqual(list(ComponentInstance.objects.filter(part=pump).order_by("id")
+                              .values_list("wear_pct", flat=True)), [50.0, 180.0])
+        other.refresh_from_db()
+        self.assertEqual(other.wear_pct, 50.0)            # чужая запчасть не тронута
+
+        # норма 0 — износ не определён
+        pump.norm_hours = 0
+        pump.save()
+        self.assertFalse(ComponentInstance.objects.filter(part=pump, wear_pct__isnull=False).exists())
+        self.assertIsNone(self.install(pump, 100).wear_pct)
+
+    def test_refresh_wear_after_bulk_update(self):
+        comp = self.install(self.parts[0], 100)
+        ComponentInstance.objects.filter(pk=comp.pk).update(total_hours=300)
+        ComponentInstance.objects.filter(pk=comp.pk).refresh_wear()
+        comp.refresh_from_db()
+        self.assertEqual(comp.wear_pct, 30.0)
+
+    def test_filter_and_order_by_wear(self):
+        for hours in (100, 700, 400, 950):
+            self.install(self.parts[0], hours)
+
+        def listing(**params):
+            resp = self.client.get("/api/components/", params)
+            self.assertEqual(resp.status_code, 200)
+            return [c["total_hours"] for c in resp.data["results"]]
 
-# Create your tests here.
+        self.assertEqual(listing(ordering="-wear_pct"), [950, 700, 400, 100])
+        self.assertEqual(listing(wear_pct__gte=40, wear_pct__lte=90, ordering="wear_pct"), [400, 700])
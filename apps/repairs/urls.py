@@ -5,7 +5,8 @@ from .views import (
     DredgerViewSet,
     ComponentInstanceViewSet,
     RepairViewSet,
-    AvailableComponentsView
+    AvailableComponentsView,
+    TelemetryHoursView,
 )
 
 router = DefaultRouter()
@@ -16,4 +17,5 @@ router.register("repairs", RepairViewSet)
 urlpatterns = [
     path("", include(router.urls)),
     path("available-components/", AvailableComponentsView.as_view(), name="available-components"),
+    path("telemetry/hours/", TelemetryHoursView.as_view(), name="telemetry-hours"),
 ]
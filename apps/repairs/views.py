@@ -1,21 +1,35 @@
+import logging
 from collections import Counter
-from django_filters.rest_framework import FilterSet, DateFilter, CharFilter
+from contextlib import nullcontext
+from datetime import date
+from django_filters.rest_framework import FilterSet, DateFilter, CharFilter, NumberFilter
 from rest_framework.views import APIView
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import BaseParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from apps.core.pagination import JournalPagination
+from apps.core.signals import bulk_changed
 from apps.core.permissions import (
     IsEngineerOrAdmin, ReadOnlyOrOperatorEngineer, ReadOnlyOrEngineerAdmin
 )
-from apps.repairs.models import RepairItem
-from apps.refdata.models import DredgerTypePart, SparePart
+from apps.repairs.models import RepairItem, ComponentHistory, ComponentInstallation
+from apps.refdata.bom import get_bom, get_boms
 from .models import Dredger, ComponentInstance, Repair
+from .search import repair_index
+from .telemetry import HoursIngest, read_lines
 from .serializers import (
     DredgerSerializer, ComponentInstanceSerializer, ComponentInstanceWriteSerializer,
-    RepairSerializer,
+    RepairSerializer, RepairListSerializer, validate_repair_batch, create_repairs,
+    installed_as_of,
 )
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import F, Prefetch, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
 
 # Фильтр для ремонта: интерпретируем start_date/end_date как границы интервала
 class RepairFilter(FilterSet):
@@ -39,40 +53,118 @@ class RepairFilter(FilterSet):
         fields = ["dredger", "start_date", "end_date", "status"]
 
 
+# Фильтр позиций ремонта: даты — по ремонту, к которому относится позиция
+class RepairItemFilter(FilterSet):
+    start_date = DateFilter(field_name="repair__start_date", lookup_expr="gte")
+    end_date = DateFilter(field_name="repair__end_date", lookup_expr="lte")
+    dredger = NumberFilter(field_name="repair__dredger")
+    part = NumberFilter(field_name="component__part")
+
+    class Meta:
+        model = RepairItem
+        fields = ["dredger", "part", "component", "start_date", "end_date"]
+
+
+class ComponentHistoryFilter(FilterSet):
+    date_after = DateFilter(field_name="created_at", lookup_expr="date__gte")
+    date_before = DateFilter(field_name="created_at", lookup_expr="date__lte")
+    part = NumberFilter(field_name="component__part")
+
+    class Meta:
+        model = ComponentHistory
+        fields = ["component", "part", "repair", "date_after", "date_before"]
+
+
 class AvailableComponentsView(APIView):
-    """API для получения доступных компонентов для замены"""
+    """
+    API для получения доступных компонентов для замены:
+    не установлены и наработка меньше нормы.
+
+        ?part_ids=1,2,3   — типы запчастей (обязательно)
+        ?limit=N          — не больше N агрегатов на запчасть
+        ?group=part       — ответ {part_id: [...]} вместо плоского списка
+
+    Внутри запчасти — по убыванию остатка ресурса. Фильтр по норме и лимит
+    (ROW_NUMBER() OVER (PARTITION BY part_id)) выполняются в БД по частичному
+    индексу (part_id, total_hours) WHERE current_dredger IS NULL.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        part_ids = request.query_params.get('part_ids', '').split(',')
-        if not part_ids or not part_ids[0]:
+        try:
+            part_ids = [int(p) for p in request.query_params.get('part_ids', '').split(',') if p.strip()]
+            limit = int(request.query_params.get('limit', 0))
+        except ValueError:
+            return Response({"error": "part_ids and limit must be integers"}, status=400)
+        if not part_ids:
             return Response([])
 
-        # Получаем компоненты, которые:
-        # 1. Соответствуют запрошенным типам запчастей
-        # 2. Не установлены на землесосы (current_dredger is null)
-        # 3. Имеют наработку меньше нормы
-        components = ComponentInstance.objects.filter(
-            part_id__in=part_ids,
-            current_dredger__isnull=True
-        ).select_related('part')
-
-        # Фильтруем по наработке
-        available = []
-        for comp in components:
-            if comp.total_hours < comp.part.norm_hours:
-                available.append({
-                    'id': comp.id,
-                    'part_id': comp.part_id,
-                    'part_name': comp.part.name,
-                    'serial_number': comp.serial_number,
-                    'total_hours': comp.total_hours,
-                    'norm_hours': comp.part.norm_hours
-                })
+        components = (ComponentInstance.objects
+                      .filter(part_id__in=part_ids,
+                              current_dredger__isnull=True,
+                              total_hours__lt=F('part__norm_hours')))
+        if limit > 0:
+            components = (components
+                          .annotate(rank=Window(RowNumber(), partition_by=F('part_id'),
+                                                order_by=[F('total_hours').asc(), F('id').asc()]))
+                          .filter(rank__lte=limit))
+        rows = components.order_by('part_id', 'total_hours', 'id').values(
+            'id', 'part_id', 'part__name', 'serial_number', 'total_hours', 'part__norm_hours')
 
+        available = [{
+            'id': r['id'],
+            'part_id': r['part_id'],
+            'part_name': r['part__name'],
+            'serial_number': r['serial_number'],
+            'total_hours': r['total_hours'],
+            'norm_hours': r['part__norm_hours'],
+        } for r in rows]
+        if request.query_params.get('group') == 'part':
+            grouped = {pid: [] for pid in part_ids}
+            for comp in available:
+                grouped[comp['part_id']].append(comp)
+            return Response(grouped)
         return Response(available)
 
 
+class NDJSONParser(BaseParser):
+    """Тело запроса как есть — строки разбирает HoursIngest."""
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream
+
+
+class TelemetryHoursView(APIView):
+    """
+    POST /telemetry/hours/   тело — NDJSON (application/x-ndjson)
+                             или multipart с файлом в поле file
+    Показания счётчиков моточасов → наработка установленных агрегатов,
+    см. apps/repairs/telemetry.py.
+    Ответ: {"total", "applied", "duplicates", "failed", "components", "errors": [{"line", "error"}]}
+    (первые max_errors ошибок).
+    """
+    permission_classes = [IsEngineerOrAdmin]
+    parser_classes = [NDJSONParser, MultiPartParser]
+    max_errors = 1000
+
+    def post(self, request):
+        if request.content_type.startswith("multipart/"):
+            upload = request.FILES.get("file")
+            if upload is None:
+                return Response({"error": "file is required"}, status=400)
+            stream = upload
+        else:
+            stream = request.data
+        try:
+            report = HoursIngest().run(read_lines(stream))
+        except UnicodeDecodeError:
+            return Response({"error": "Body must be UTF-8 NDJSON"}, status=400)
+        report["errors_truncated"] = len(report["errors"]) > self.max_errors
+        report["errors"] = report["errors"][:self.max_errors]
+        return Response(report)
+
+
 # — Dredgers —
 class DredgerViewSet(viewsets.ModelViewSet):
     queryset = Dredger.objects.select_related("type")
@@ -82,33 +174,177 @@ class DredgerViewSet(viewsets.ModelViewSet):
     filterset_fields = ("type",)
     ordering_fields = ("inv_number",)
 
+    @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    def compliance(self, request):
+        """
+        Сверка комплектации всего парка с составом типов:
+            missing      — запчасти из состава типа, которых на землесосе нет;
+            duplicates   — запчасти, установленные больше одного раза;
+            incompatible — агрегаты, чьей запчасти нет в составе типа.
+        ?issues=1 — только землесосы с нарушениями. Фильтры — как у списка.
+        Три запроса на весь парк (землесосы, составы типов, установленные
+        агрегаты), дальше — операции над множествами в памяти.
+        """
+        dredgers = list(self.filter_queryset(self.get_queryset())
+                        .order_by("inv_number")
+                        .values_list("id", "inv_number", "type_id", "type__name"))
+        boms = get_boms(type_id for _, _, type_id, _ in dredgers)
+
+        installed = {}                      # землесос → {запчасть: [агрегаты]}
+        part_names = {}
+        rows = (ComponentInstance.objects
+                .filter(current_dredger__in=[d[0] for d in dredgers])
+                .order_by("id")
+                .values_list("id", "current_dredger_id", "part_id", "part__name", "serial_number"))
+        for comp_id, dredger_id, part_id, part_name, serial in rows:
+            installed.setdefault(dredger_id, {}).setdefault(part_id, []).append((comp_id, serial))
+            part_names[part_id] = part_name
+
+        only_issues = request.query_params.get("issues") in ("1", "true")
+        data = []
+        for dredger_id, inv_number, type_id, type_name in dredgers:
+            bom = boms[type_id]
+            comps = installed.get(dredger_id, {})
+            present = comps.keys()
+            missing = [{"part_id": p["id"], "part_name": p["name"]}
+                       for p in bom.parts if p["id"] not in present]
+            duplicates = [{"part_id": part_id, "part_name": part_names[part_id],
+                           "component_ids": [c for c, _ in found]}
+                          for part_id, found in comps.items() if len(found) > 1]
+            incompatible = [{"component_id": comp_id, "serial_number": serial,
+                             "part_id": part_id, "part_name": part_names[part_id]}
+                            for part_id in present - bom.part_ids
+                            for comp_id, serial in comps[part_id]]
+            compliant = not (missing or duplicates or incompatible)
+            if only_issues and compliant:
+                continue
+            data.append({
+                "dredger_id": dredger_id,
+                "inv_number": inv_number,
+                "type_id": type_id,
+                "type_name": type_name,
+                "compliant": compliant,
+                "missing": missing,
+                "duplicates": duplicates,
+                "incompatible": sorted(incompatible, key=lambda c: c["component_id"]),
+            })
+        return Response(data)
+
     @action(detail=True, methods=["get"], permission_classes=[IsAuthenticated])
     def template(self, request, pk=None):
-        dredger = self.get_object()
-        # Список необходимых запчастей по типу землесоса
-        parts = (SparePart.objects
-                 .filter(id__in=DredgerTypePart.objects.filter(dredger_type=dredger.type)
-                         .values_list("part_id", flat=True))
-                 .order_by("name"))
+        return Response(self.template_data(self.get_object()))
+
+    @staticmethod
+    def template_data(dredger):
+        # Список необходимых запчастей по типу землесоса — из кэша состава
+        parts = get_bom(dredger.type_id).parts
         # Загружаем все текущие компоненты землесоса одним запросом
         comps = {comp.part_id: comp for comp in dredger.components.all()}
         data = []
         for part in parts:
-            comp = comps.get(part.id)
+            comp = comps.get(part["id"])
             data.append({
-                "part_id": part.id,
-                "part_name": part.name,
-                "code": part.code,
-                "manufacturer": part.manufacturer,
-                "norm_hours": part.norm_hours,
+                "part_id": part["id"],
+                "part_name": part["name"],
+                "code": part["code"],
+                "manufacturer": part["manufacturer"],
+                "norm_hours": part["norm_hours"],
                 "component_id": comp.id if comp else None,
                 "current_hours": comp.total_hours if comp else 0,
                 "serial_number": comp.serial_number if comp else "",
             })
-        return Response(data)
+        return data
+
+    @action(detail=True, methods=["post"], permission_classes=[IsEngineerOrAdmin])
+    def swap(self, request, pk=None):
+        """
+        Установить и снять несколько агрегатов за один запрос:
+            {"install": [id, …], "remove": [id, …]}
+
+        Агрегаты и совместимость проверяются одним запросом (состав типа —
+        из кэша). Интервалы установки закрываются и открываются пакетно. Изменения применяются в одной транзакции условными
+        UPDATE … WHERE current_dredger IS NULL (для снятия — WHERE
+        current_dredger = этот землесос), поэтому агрегат, который
+        параллельно успели поставить на другую машину, не будет
+        «установлен» второй раз. При любом конфликте не применяется ничего:
+        ответ 409 с причиной по каждому агрегату. Ответ содержит
+        обновлённый шаблон землесоса (как /template/).
+        """
+        dredger = self.get_object()
+        try:
+            install = [int(c) for c in request.data.get("install", [])]
+            remove = [int(c) for c in request.data.get("remove", [])]
+        except (TypeError, ValueError):
+            return Response({"error": "install and remove must be lists of component ids"}, status=400)
+        if not install and not remove:
+            return Response({"error": "install or remove is required"}, status=400)
+        if len({*install, *remove}) != len(install) + len(remove):
+            return Response({"error": "Each component may be listed only once"}, status=400)
+
+        comps = {c["id"]: c for c in ComponentInstance.objects
+                 .filter(id__in=[*install, *remove])
+                 .values("id", "part_id", "total_hours", "current_dredger_id", "current_dredger__inv_number")}
+        part_ids = get_bom(dredger.type_id).part_ids
+        errors = {}
+        for comp_id in install:
+            comp = comps.get(comp_id)
+            if comp is None:
+                errors[comp_id] = "Component not found"
+            elif comp["part_id"] not in part_ids:
+                errors[comp_id] = "This component type is not compatible with this dredger type"
+            elif comp["current_dredger_id"] is not None:
+                errors[comp_id] = f"Component is already installed on {comp['current_dredger__inv_number']}"
+        for comp_id in remove:
+            comp = comps.get(comp_id)
+            if comp is None:
+                errors[comp_id] = "Component not found"
+            elif comp["current_dredger_id"] != dredger.id:
+                errors[comp_id] = "This component is not installed on this dredger"
+        if errors:
+            return self.swap_conflict(dredger, errors, status=400)
+
+        with transaction.atomic():
+            # условие в WHERE, а не в Python: между чтением выше и записью
+            # агрегат мог изменить другой пользователь
+            for comp_id in remove:
+                if not ComponentInstance.objects.filter(
+                        id=comp_id, current_dredger=dredger).update(current_dredger=None):
+                    errors[comp_id] = "Component was removed concurrently"
+            for comp_id in install:
+                if not ComponentInstance.objects.filter(
+                        id=comp_id, current_dredger__isnull=True).update(current_dredger=dredger):
+                    errors[comp_id] = "Component was installed concurrently"
+            if errors:
+                transaction.set_rollback(True)
+            else:
+                now = timezone.now()
+                ComponentInstallation.objects.move(
+                    [(c, None, now, comps[c]["total_hours"], None) for c in remove]
+                    + [(c, dredger.id, now, comps[c]["total_hours"], None) for c in install])
+        if errors:
+            return self.swap_conflict(dredger, errors, status=409)
+
+        # update() не вызывает post_save
+        bulk_changed.send(sender=ComponentInstance)
+        return Response({"installed": install, "removed": remove,
+                         "template": self.template_data(dredger)})
+
+    def swap_conflict(self, dredger, errors, status):
+        return Response({
+            "error": "Components were not changed",
+            "conflicts": [{"component_id": c, "error": e} for c, e in errors.items()],
+            "template": self.template_data(dredger),
+        }, status=status)
 
     @action(detail=True, methods=["get"], permission_classes=[IsAuthenticated])
     def components(self, request, pk=None):
+        """?as_of=YYYY-MM-DD — комплектация на конец этого дня по интервалам установки."""
+        if "as_of" in request.query_params:
+            try:
+                moment = date.fromisoformat(request.query_params["as_of"])
+            except ValueError:
+                return Response({"error": "as_of must be YYYY-MM-DD"}, status=400)
+            return Response(installed_as_of(self.get_object().id, moment))
         comps = self.get_object().components.select_related("part")
         return Response(ComponentInstanceSerializer(comps, many=True).data)
 
@@ -134,10 +370,7 @@ class DredgerViewSet(viewsets.ModelViewSet):
             )
             
         # Проверяем, соответствует ли тип агрегата типу землесоса
-        if not DredgerTypePart.objects.filter(
-            dredger_type=dredger.type,
-            part=component.part
-        ).exists():
+        if component.part_id not in get_bom(dredger.type_id).part_ids:
             return Response(
                 {"error": "This component type is not compatible with this dredger type"},
                 status=400
@@ -181,9 +414,14 @@ class DredgerViewSet(viewsets.ModelViewSet):
 class ComponentInstanceViewSet(viewsets.ModelViewSet):
     queryset = ComponentInstance.objects.select_related("part", "current_dredger")
     permission_classes = [IsEngineerOrAdmin]
-    filterset_fields = ("part", "current_dredger")
+    filterset_fields = {
+        "part": ["exact"],
+        "current_dredger": ["exact", "isnull"],
+        "wear_pct": ["gte", "lte"],
+    }
     search_fields = ("serial_number", "part__name")
-    ordering_fields = ("total_hours",)
+    ordering_fields = ("total_hours", "wear_pct")
+    keyset_fields = ("created_at", "id")       # курсор журнала наработки (history)
 
     def get_serializer_class(self):
         # Используем упрощённый сериализатор для записи, и подробный с вложенным part для чтения
@@ -193,34 +431,144 @@ class ComponentInstanceViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=["get"], permission_classes=[IsAuthenticated])
     def history(self, request, pk=None):
+        """
+        Журнал наработки агрегата (ComponentHistory), новые записи первыми;
+        total_hours — итог по приращениям в порядке дат (with_running_total).
+        ?date_after / ?date_before — период; пагинация ?page=N или по курсору
+        (created_at, id) с ?mode=cursor.
+        """
         comp = self.get_object()
-        qs = (comp.repairitem_set
-              .select_related("repair", "repair__dredger")
-              .order_by("repair__start_date"))
+        qs = (ComponentHistory.objects
+              .filter(component=comp)
+              .with_running_total()
+              .select_related("repair__dredger"))
+        qs = ComponentHistoryFilter(request.query_params, queryset=qs, request=request).qs
+        paginator = JournalPagination()
+        page = paginator.paginate_queryset(qs, request, view=self)
         history = [{
-            "repair_id": i.repair_id,
-            "dredger":   i.repair.dredger.inv_number,
-            "start_date": i.repair.start_date,
-            "end_date":   i.repair.end_date,
-            "hours":     i.hours,
-            "note":      i.note,
-        } for i in qs]
-        return Response(history)
+            "id":          h.id,
+            "created_at":  h.created_at,
+            "source":      h.source,
+            "hours":       h.hours_delta,
+            "total_hours": h.running_total,
+            "repair_id":   h.repair_id,
+            "dredger":     h.repair.dredger.inv_number if h.repair else None,
+            "start_date":  h.repair.start_date if h.repair else None,
+            "end_date":    h.repair.end_date if h.repair else None,
+        } for h in page]
+        return paginator.get_paginated_response(history)
+
+    @action(detail=True, methods=["get"], permission_classes=[IsAuthenticated])
+    def hours(self, request, pk=None):
+        """Наработка на дату: ?at=YYYY-MM-DD (по умолчанию — текущая)."""
+        comp = self.get_object()
+        at = request.query_params.get("at")
+        if not at:
+            return Response({"component": comp.id, "at": None, "total_hours": comp.total_hours})
+        try:
+            moment = date.fromisoformat(at)
+        except ValueError:
+            return Response({"error": "at must be YYYY-MM-DD"}, status=400)
+        return Response({"component": comp.id, "at": moment,
+                         "total_hours": ComponentHistory.objects.hours_at(comp.id, moment)})
 
 
 # — Repairs —
 class RepairViewSet(viewsets.ModelViewSet):
+    """
+    list     — компактное представление (RepairListSerializer);
+               ?expand=items — полное, с вложенными агрегатами.
+               Пагинация ?page=N или по курсору (start_date, id) с ?mode=cursor — см. JournalPagination.
+    retrieve — всегда полное.
+    Позиции вместе с агрегатами и запчастями грузятся одним prefetch-запросом,
+    поэтому число запросов не зависит от размера страницы.
+    """
     queryset = (Repair.objects
-                .select_related("dredger")
-                .prefetch_related("items"))
+                .select_related("dredger__type")
+                .prefetch_related(Prefetch(
+                    "items",
+                    queryset=RepairItem.objects.select_related("component__part").order_by("id"),
+                )))
     serializer_class = RepairSerializer
     permission_classes = [ReadOnlyOrOperatorEngineer]
+    pagination_class = JournalPagination
+    keyset_fields = ("start_date", "id")
     filterset_class = RepairFilter
+    # ?search= — полнотекстовый индекс, по релевантности; search_fields — запасной LIKE
+    search_index = repair_index
     search_fields = ("notes",)
     ordering_fields = ("start_date", "-start_date")
 
+    batch_max_size = 1000        # записей в одном запросе
+    batch_chunk_size = 50        # ремонтов в одной транзакции
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            expand = self.request.query_params.get("expand", "")
+            if "items" not in expand.split(","):
+                return RepairListSerializer
+        return RepairSerializer
+
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
     def perform_update(self, serializer):
         serializer.save(updated_by=self.request.user)
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """
+        Пакетный ввод ремонтов: список в формате create (или {"repairs": [...]}).
+
+        Все записи проверяются вместе; корректные применяются в порядке списка
+        порциями по batch_chunk_size ремонтов — одна транзакция на порцию,
+        чтобы длинный пакет не держал блокировку записи целиком. Сбой порции
+        откатывает только её, её записи получают status="error".
+        ?atomic=1 — при любой ошибке (проверки или сбое порции) не сохранять
+        ничего: порции идут в одной общей транзакции.
+        Ответ: {"created", "failed", "results": [{"index", "status", "id" | "errors"}]};
+        201 — сохранено всё, 207 — часть, 400 — ничего.
+        """
+        entries = request.data.get("repairs") if isinstance(request.data, dict) else request.data
+        if not isinstance(entries, list) or not entries:
+            return Response({"error": "A non-empty list of repairs is required"}, status=400)
+        if len(entries) > self.batch_max_size:
+            return Response({"error": f"At most {self.batch_max_size} repairs per batch"}, status=400)
+
+        atomic = request.query_params.get("atomic") in ("1", "true")
+        valid, errors = validate_repair_batch(entries, self.get_serializer_context())
+        if errors and atomic:
+            valid = []
+
+        created = {}
+        with transaction.atomic() if atomic else nullcontext():
+            for start in range(0, len(valid), self.batch_chunk_size):
+                chunk = valid[start:start + self.batch_chunk_size]
+                try:
+                    with transaction.atomic():
+                        repairs = create_repairs([data for _, data in chunk], request.user)
+                except Exception:
+                    logger.exception("Repair batch chunk at entry %s failed", chunk[0][0])
+                    errors.update((index, {"non_field_errors": ["Failed to save this part of the batch"]})
+                                  for index, _ in chunk)
+                    if atomic:
+                        transaction.set_rollback(True)
+                        created = {}
+                        break
+                    continue
+                created.update((index, repair.id) for (index, _), repair in zip(chunk, repairs))
+
+        results = []
+        for index in range(len(entries)):
+            if index in created:
+                results.append({"index": index, "status": "created", "id": created[index]})
+            elif index in errors:
+                results.append({"index": index, "status": "error", "errors": errors[index]})
+            else:                                  # atomic: корректная, но не сохранена
+                results.append({"index": index, "status": "skipped"})
+        if not created:
+            status = 400
+        else:
+            status = 201 if len(created) == len(entries) else 207
+        return Response({"created": len(created), "failed": len(entries) - len(created),
+                         "results": results}, status=status)
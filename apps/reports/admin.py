@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import ReportJob
 
-# Register your models here.
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ("report_type", "status", "created_by", "created_at", "finished_at")
+    list_filter = ("report_type", "status")
+    readonly_fields = ("cache_key", "started_at", "finished_at", "created_at")
@@ -0,0 +1,54 @@
+"""
+apps/reports/cache.py · кэш сводки дашборда
+
+Ключ записи включает поколение данных (apps/core/cache.py); его сдвигают
+сигналы источников дашборда (signals.py).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core import cache as generations
+
+PREFIX = "dashboard"
+GENERATION_KEY = f"{PREFIX}:generation"
+HITS_KEY = f"{PREFIX}:hits"
+MISSES_KEY = f"{PREFIX}:misses"
+
+
+def _timeout() -> int:
+    return getattr(settings, "DASHBOARD_CACHE_TIMEOUT", 5 * 60)
+
+
+def generation() -> int:
+    return generations.generation(GENERATION_KEY)
+
+
+def invalidate() -> None:
+    """Сдвигает поколение — все ранее сохранённые сводки становятся недостижимы."""
+    generations.bump(GENERATION_KEY)
+
+
+def get_or_compute(params, compute):
+    """
+    Возвращает (данные, попадание_в_кэш). Поколение читается до расчёта:
+    если во время расчёта прошла запись, результат сохранится под старым
+    поколением и никогда не будет отдан.
+    """
+    key = ":".join([PREFIX, str(generation()), *map(str, params)])
+    data = cache.get(key)
+    if data is not None:
+        generations.incr(HITS_KEY, 1)
+        return data, True
+    generations.incr(MISSES_KEY, 1)
+    data = compute()
+    cache.set(key, data, _timeout())
+    return data, False
+
+
+def stats() -> dict:
+    return {
+        "backend":    type(cache).__name__,
+        "generation": cache.get(GENERATION_KEY),
+        "hits":       cache.get(HITS_KEY, 0),
+        "misses":     cache.get(MISSES_KEY, 0),
+    }
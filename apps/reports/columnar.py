@@ -0,0 +1,191 @@
+"""
+apps/reports/columnar.py · выгрузки для аналитики (CSV / Parquet / Arrow)
+
+    • CSV     – потоковый, строки читаются серверным итератором порциями;
+    • Arrow   – IPC-поток, каждая порция уходит клиенту как RecordBatch;
+    • Parquet – файл собирается по столбцовым порциям во временный файл
+                (футер Parquet пишется в конце, поэтому отдаётся целиком).
+
+pyarrow — необязательная зависимость: без неё доступен только CSV.
+"""
+import csv
+import tempfile
+from collections import OrderedDict
+from typing import Iterable, Iterator, Sequence
+
+from django.db import models
+from django.http import FileResponse, StreamingHttpResponse
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:                                # pragma: no cover
+    HAS_PYARROW = False
+
+CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
+PARQUET_CONTENT_TYPE = "application/vnd.apache.parquet"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+CHUNK_SIZE = 2000          # строк за одно обращение к курсору
+BATCH_SIZE = 50_000        # строк в одном RecordBatch / row group
+
+
+class _LineBuffer:
+    """Приёмник для csv.writer: копит строки до очередного drain()."""
+
+    def __init__(self):
+        self._parts: list[str] = []
+
+    def write(self, line: str) -> None:
+        self._parts.append(line)
+
+    def drain(self) -> bytes:
+        data = "".join(self._parts).encode()
+        self._parts.clear()
+        return data
+
+
+def iter_csv(rows: Iterable[Sequence], headers: Sequence[str],
+             chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    buf = _LineBuffer()
+    writer = csv.writer(buf)
+    writer.writerow(headers)
+    yield buf.drain()
+    for num, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if num % chunk_size == 0:
+            yield buf.drain()
+    yield buf.drain()
+
+
+def queryset_to_csv(qs, columns: OrderedDict[str, str], file_name: str) -> StreamingHttpResponse:
+    """
+    qs        – QuerySet
+    columns   – OrderedDict { "field": "имя столбца" }
+    file_name – имя скачиваемого файла
+    """
+    rows = qs.values_list(*columns.keys()).iterator(chunk_size=CHUNK_SIZE)
+    resp = StreamingHttpResponse(iter_csv(rows, list(columns.values())),
+                                 content_type=CSV_CONTENT_TYPE)
+    resp["Content-Disposition"] = f'attachment; filename="{file_name}"'
+    return resp
+
+
+# ───────────────────────── Arrow / Parquet ─────────────────────────
+def _arrow_type(model, lookup: str):
+    """Тип столбца Arrow по полю модели (поддерживаются пути через '__')."""
+    import pyarrow as pa
+
+    field = None
+    for part in lookup.split("__"):
+        field = model._meta.get_field(part)
+        if field.is_relation and field.related_model is not None:
+            model = field.related_model
+    if field.is_relation:                          # FK → первичный ключ
+        field = field.target_field
+
+    if isinstance(field, models.BooleanField):
+        return pa.bool_()
+    if isinstance(field, (models.AutoField, models.IntegerField)):
+        return pa.int64()
+    if isinstance(field, (models.FloatField, models.DecimalField)):
+        return pa.float64()
+    if isinstance(field, models.DateTimeField):
+        return pa.timestamp("us", tz="UTC")
+    if isinstance(field, models.DateField):
+        return pa.date32()
+    return pa.string()
+
+
+def arrow_schema(qs, columns: OrderedDict[str, str]):
+    import pyarrow as pa
+
+    return pa.schema([
+        pa.field(name, _arrow_type(qs.model, lookup))
+        for lookup, name in columns.items()
+    ])
+
+
+def iter_record_batches(qs, columns: OrderedDict[str, str], batch_size: int = BATCH_SIZE):
+    """Читает QuerySet порциями и превращает каждую в столбцовый RecordBatch."""
+    import pyarrow as pa
+
+    schema = arrow_schema(qs, columns)
+    rows = qs.values_list(*columns.keys()).iterator(chunk_size=CHUNK_SIZE)
+
+    def to_batch(chunk):
+        cols = list(zip(*chunk))
+        return pa.RecordBatch.from_arrays(
+            [pa.array(col, type=f.type) for col, f in zip(cols, schema)],
+            schema=schema,
+        )
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= batch_size:
+            yield to_batch(chunk)
+            chunk = []
+    if chunk:
+        yield to_batch(chunk)
+
+
+class _StreamSink:
+    """Файлоподобный приёмник для pyarrow: копит байты до drain()."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _iter_arrow_stream(qs, columns):
+    import pyarrow as pa
+
+    sink = _StreamSink()
+    with pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), arrow_schema(qs, columns)) as writer:
+        yield sink.drain()
+        for batch in iter_record_batches(qs, columns):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def queryset_to_arrow(qs, columns: OrderedDict[str, str], file_name: str) -> StreamingHttpResponse:
+    resp = StreamingHttpResponse(_iter_arrow_stream(qs, columns), content_type=ARROW_CONTENT_TYPE)
+    resp["Content-Disposition"] = f'attachment; filename="{file_name}"'
+    return resp
+
+
+def queryset_to_parquet(qs, columns: OrderedDict[str, str], file_name: str) -> FileResponse:
+    import pyarrow.parquet as pq
+
+    fh = tempfile.TemporaryFile()
+    with pq.ParquetWriter(fh, arrow_schema(qs, columns), compression="zstd") as writer:
+        for batch in iter_record_batches(qs, columns):
+            writer.write_batch(batch)
+    fh.seek(0)
+    return FileResponse(fh, as_attachment=True, filename=file_name,
+                        content_type=PARQUET_CONTENT_TYPE)
+
+
+# формат → (функция выгрузки, нужен ли pyarrow)
+WRITERS = {
+    "csv":     (queryset_to_csv, False),
+    "parquet": (queryset_to_parquet, True),
+    "arrow":   (queryset_to_arrow, True),
+}
@@ -1,24 +1,207 @@
-import io
-import pandas as pd
-from django.http import HttpResponse
+"""
+apps/reports/excel.py · потоковый экспорт QuerySet → .xlsx
 
+Книга собирается «на лету»: строки читаются из БД серверным итератором
+порциями по CHUNK_SIZE, каждая порция сразу превращается в XML листа и
+сжимается в zip-поток, а готовые байты уходят клиенту через
+StreamingHttpResponse. В памяти одновременно живёт только одна порция,
+поэтому расход памяти не зависит от количества строк.
+"""
+import math
+import zipfile
+from collections import OrderedDict
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Iterable, Iterator, Sequence
+from xml.sax.saxutils import escape
 
-def queryset_to_excel(qs, columns, file_name):
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CHUNK_SIZE = 2000                      # строк за одно обращение к курсору
+
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+# стили: 0 – обычный, 1 – дата, 2 – дата+время, 3 – заголовок (жирный)
+_STYLE_DATE, _STYLE_DATETIME, _STYLE_HEADER = 1, 2, 3
+
+# ───────────────────────── служебные части книги ─────────────────────────
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm"/></numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+def _workbook_xml(sheet_name: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_name, {chr(34): "&quot;"})}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+# ───────────────────────── ячейки ─────────────────────────
+# управляющие символы, недопустимые в XML 1.0 (кроме \t \n \r)
+_ILLEGAL_XML = dict.fromkeys(c for c in range(32) if c not in (9, 10, 13))
+
+
+def _column_letter(idx: int) -> str:
+    """0 → A, 25 → Z, 26 → AA …"""
+    letters = ""
+    idx += 1
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _cell(ref: str, value, style: int = 0) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, Decimal)) or (isinstance(value, float) and math.isfinite(value)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value)
+        delta = value - _EXCEL_EPOCH
+        return f'<c r="{ref}" s="{_STYLE_DATETIME}"><v>{delta.days + delta.seconds / 86400}</v></c>'
+    if isinstance(value, date):
+        serial = (value - _EXCEL_EPOCH.date()).days
+        return f'<c r="{ref}" s="{_STYLE_DATE}"><v>{serial}</v></c>'
+    if isinstance(value, time):
+        value = value.isoformat()
+    text = escape(str(value).translate(_ILLEGAL_XML))
+    style_attr = f' s="{style}"' if style else ""
+    return f'<c r="{ref}" t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row(num: int, letters: Sequence[str], values: Iterable, style: int = 0) -> str:
+    cells = "".join(_cell(f"{col}{num}", val, style) for col, val in zip(letters, values))
+    return f'<row r="{num}">{cells}</row>'
+
+
+# ───────────────────────── zip-поток ─────────────────────────
+class _ChunkBuffer:
+    """
+    «Неперематываемый» файл для zipfile: всё, что пишет архиватор,
+    копится здесь до очередного drain(). Отсутствие tell()/seek()
+    переводит ZipFile в потоковый режим (data descriptor после данных).
+    """
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def iter_xlsx(rows: Iterable[Sequence], headers: Sequence[str],
+              sheet_name: str = "Sheet1", chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Генератор байтов .xlsx-файла с одним листом.
+
+    rows    – итерируемые кортежи значений (в порядке headers)
+    headers – заголовки столбцов (первая строка листа)
+    """
+    buf = _ChunkBuffer()
+    letters = [_column_letter(i) for i in range(len(headers))]
+
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _ROOT_RELS)
+        zf.writestr("xl/workbook.xml", _workbook_xml(sheet_name))
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        zf.writestr("xl/styles.xml", _STYLES)
+
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData>'
+            )
+            sheet.write(_row(1, letters, headers, _STYLE_HEADER).encode())
+            yield buf.drain()              # первые байты уходят сразу
+
+            batch: list[str] = []
+            for num, values in enumerate(rows, start=2):
+                batch.append(_row(num, letters, values))
+                if len(batch) >= chunk_size:
+                    sheet.write("".join(batch).encode())
+                    batch.clear()
+                    data = buf.drain()
+                    if data:
+                        yield data
+            if batch:
+                sheet.write("".join(batch).encode())
+            sheet.write(b"</sheetData></worksheet>")
+
+    yield buf.drain()
+
+
+# ───────────────────────── QuerySet → StreamingHttpResponse ─────────────────────────
+def queryset_to_excel(qs, columns: OrderedDict[str, str], file_name: str,
+                      chunk_size: int = CHUNK_SIZE) -> StreamingHttpResponse:
     """
     qs        – QuerySet
     columns   – OrderedDict { "field": "Заголовок столбца" }
     file_name – имя скачиваемого файла
     """
-    df = pd.DataFrame(list(qs.values(*columns.keys())))
-    df.rename(columns=columns, inplace=True)
-
-    buf = io.BytesIO()
-    df.to_excel(buf, index=False)
-    buf.seek(0)
-
-    resp = HttpResponse(
-        buf,
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    rows = qs.values_list(*columns.keys()).iterator(chunk_size=chunk_size)
+    resp = StreamingHttpResponse(
+        iter_xlsx(rows, list(columns.values()), chunk_size=chunk_size),
+        content_type=XLSX_CONTENT_TYPE,
     )
     resp["Content-Disposition"] = f'attachment; filename="{file_name}"'
     return resp
@@ -0,0 +1,219 @@
+"""
+apps/reports/forecast.py · прогноз выработки ресурса агрегатов
+
+Для каждого установленного агрегата оценивается темп наработки (ч/сутки)
+и дата, когда total_hours достигнет SparePart.norm_hours.
+
+    1. Два запроса: установленные агрегаты и их журнал наработки
+       (ComponentHistory) — без циклов по объектам ORM.
+    2. Темп — наклон МНК total_hours(t) по точкам журнала плюс текущая
+       точка (сейчас, total_hours). Суммы по группам считаются через
+       np.bincount, т.е. одной векторной операцией на весь парк.
+    3. Агрегатам без истории подставляется темп по журналу ремонтов
+       (rate_source="repairs"): RepairItem.hours — наработка снятого
+       агрегата, делённая на срок с предыдущей замены той же запчасти на
+       том же землесосе; берётся медиана по паре (землесос, запчасть).
+       Третий запрос, тоже без циклов по объектам.
+    4. Если и ремонтов нет — медианный темп по той же запчасти
+       (rate_source="part").
+
+Прогноз дальше date.max (почти нулевой темп) — days_left/forecast_date = null.
+"""
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from django.db import connection
+from django.db.models import F, FloatField, Func
+from django.utils import timezone
+
+from apps.repairs.models import ComponentHistory, ComponentInstance, RepairItem
+
+SECONDS_PER_DAY = 86400.0
+JULIAN_UNIX_EPOCH = 2440587.5          # julianday('1970-01-01')
+
+
+def _slopes(groups: np.ndarray, x: np.ndarray, y: np.ndarray, n_groups: int) -> np.ndarray:
+    """Наклон МНК y(x) для каждой группы (NaN — меньше двух различных x)."""
+    n = np.bincount(groups, minlength=n_groups).astype(float)
+    sx = np.bincount(groups, x, n_groups)
+    sy = np.bincount(groups, y, n_groups)
+    # центрируем x по группе, чтобы не терять точность на больших timestamp
+    mean_x = np.divide(sx, n, out=np.zeros(n_groups), where=n > 0)
+    xc = x - mean_x[groups]
+    sxx = np.bincount(groups, xc * xc, n_groups)
+    sxy = np.bincount(groups, xc * y, n_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = sxy / sxx
+    slope[(n < 2) | (sxx <= 0)] = np.nan
+    return slope
+
+
+def _group_median(groups: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """Медиана values по группам (NaN игнорируются)."""
+    result = np.full(n_groups, np.nan)
+    ok = ~np.isnan(values)
+    if not ok.any():
+        return result
+    g, v = groups[ok], values[ok]
+    order = np.lexsort((v, g))
+    g, v = g[order], v[order]
+    starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+    counts = np.diff(np.r_[starts, len(g)])
+    lo = v[starts + (counts - 1) // 2]
+    hi = v[starts + counts // 2]
+    result[g[starts]] = (lo + hi) / 2
+    return result
+
+
+def _group_cumsum(groups: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Нарастающая сумма values внутри каждой группы (groups отсортированы)."""
+    total = np.cumsum(values)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    offset = total[starts] - values[starts]
+    return total - np.repeat(offset, np.diff(np.r_[starts, len(groups)]))
+
+
+def _julian_days(queryset, field: str, alias: str = "t"):
+    """values(alias) — момент field в сутках от эпохи (на SQLite считает БД)."""
+    return queryset.annotate(**{alias: Func(F(field), function="julianday",
+                                            output_field=FloatField()) - JULIAN_UNIX_EPOCH})
+
+
+def _repair_rates(dredger_id: np.ndarray, part_id: np.ndarray) -> np.ndarray:
+    """
+    Темп (ч/сутки) по журналу ремонтов для пар (землесос, запчасть) агрегатов:
+    медиана RepairItem.hours / сутки с предыдущей замены этой запчасти на этом
+    землесосе. NaN — пара менялась меньше двух раз.
+    """
+    items = RepairItem.objects.filter(repair__dredger__in=set(dredger_id.tolist()),
+                                      component__part__in=set(part_id.tolist()))
+    if connection.vendor == "sqlite":
+        rows = list(_julian_days(items, "repair__start_date", "day")
+                    .values_list("repair__dredger_id", "component__part_id", "day", "hours"))
+    else:
+        rows = [(d, p, day.toordinal(), h) for d, p, day, h in
+                items.values_list("repair__dredger_id", "component__part_id", "repair__start_date", "hours")]
+    result = np.full(len(dredger_id), np.nan)
+    if len(rows) < 2:
+        return result
+    r_dredger, r_part, r_day, r_hours = (np.array(col, dtype=float) for col in zip(*rows))
+    dredger_id, part_id = dredger_id.astype(float), part_id.astype(float)
+    order = np.lexsort((r_day, r_part, r_dredger))
+    r_dredger, r_part, r_day, r_hours = r_dredger[order], r_part[order], r_day[order], r_hours[order]
+
+    # соседние замены одной пары: наработка снятого агрегата за срок его установки
+    same = (r_dredger[1:] == r_dredger[:-1]) & (r_part[1:] == r_part[:-1])
+    days = r_day[1:] - r_day[:-1]
+    ok = same & (days > 0) & (r_hours[1:] > 0)
+    if not ok.any():
+        return result
+    # общие коды пар для агрегатов и замен, медиана по коду
+    n = len(dredger_id)
+    _, codes = np.unique(np.concatenate([np.column_stack([dredger_id, part_id]),
+                                         np.column_stack([r_dredger[1:][ok], r_part[1:][ok]])]),
+                         axis=0, return_inverse=True)
+    codes = codes.reshape(-1)
+    pair_rate = _group_median(codes[n:], r_hours[1:][ok] / days[ok], codes.max() + 1)
+    return pair_rate[codes[:n]]
+
+
+def wear_forecast(dredger_ids=None, part_ids=None, now: datetime | None = None) -> list[dict]:
+    now = now or timezone.now()
+    today = timezone.localdate(now) if timezone.is_aware(now) else now.date()
+
+    comps = (ComponentInstance.objects
+             .filter(current_dredger__isnull=False, part__norm_hours__gt=0))
+    if dredger_ids:
+        comps = comps.filter(current_dredger__in=dredger_ids)
+    if part_ids:
+        comps = comps.filter(part__in=part_ids)
+
+    rows = list(comps.order_by("id").values_list(
+        "id", "part_id", "part__name", "part__norm_hours",
+        "current_dredger_id", "current_dredger__inv_number",
+        "serial_number", "total_hours",
+    ))
+    if not rows:
+        return []
+    ids, part_id, part_name, norm, dredger_id, dredger_no, serial, total = zip(*rows)
+    ids = np.array(ids, dtype=np.int64)
+    part_id = np.array(part_id, dtype=np.int64)
+    dredger_arr = np.array(dredger_id, dtype=np.int64)
+    norm = np.array(norm, dtype=float)
+    total = np.array(total, dtype=float)
+    n_comps = len(ids)
+
+    # журнал наработки одним запросом
+    ledger = ComponentHistory.objects.filter(component__in=comps)
+    if connection.vendor == "sqlite":
+        # время сразу в сутках от эпохи — без построчной конвертации datetime в Python
+        ledger = list(_julian_days(ledger, "created_at").values_list("component_id", "t", "id", "hours_delta"))
+    else:
+        ledger = [(c, t.timestamp() / SECONDS_PER_DAY, pk, h) for c, t, pk, h in
+                  ledger.values_list("component_id", "created_at", "id", "hours_delta")]
+    if ledger:
+        l_comp, l_time, l_id, l_delta = zip(*ledger)
+        l_group = np.searchsorted(ids, np.array(l_comp, dtype=np.int64))
+        l_x = np.array(l_time, dtype=float)
+        # итог — по приращениям в порядке (агрегат, время, id), а не total_hours
+        # в порядке вставки: ремонт задним числом ложится между показаниями
+        order = np.lexsort((np.array(l_id, dtype=np.int64), l_x, l_group))
+        l_group, l_x = l_group[order], l_x[order]
+        l_y = _group_cumsum(l_group, np.array(l_delta, dtype=float)[order])
+    else:
+        l_group, l_x, l_y = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+
+    # + текущая точка каждого агрегата
+    groups = np.concatenate([l_group, np.arange(n_comps)])
+    x = np.concatenate([l_x, np.full(n_comps, now.timestamp() / SECONDS_PER_DAY)])
+    y = np.concatenate([l_y, total])
+
+    rate = _slopes(groups, x, y, n_comps)
+    rate[rate <= 0] = np.nan
+    source = np.where(np.isnan(rate), None, "own").astype(object)
+
+    # нет своей истории → темп по ремонтам той же пары (землесос, запчасть)
+    if np.isnan(rate).any():
+        repair_rate = _repair_rates(dredger_arr, part_id)
+        fallback = np.isnan(rate) & ~np.isnan(repair_rate)
+        rate[fallback] = repair_rate[fallback]
+        source[fallback] = "repairs"
+
+    # и их нет → медиана по запчасти
+    parts, part_idx = np.unique(part_id, return_inverse=True)
+    part_rate = _group_median(part_idx, rate, len(parts))[part_idx]
+    fallback = np.isnan(rate) & ~np.isnan(part_rate)
+    rate[fallback] = part_rate[fallback]
+    source[fallback] = "part"
+
+    remaining = np.maximum(norm - total, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_left = np.where(remaining == 0, 0.0, np.ceil(remaining / rate))
+    # дата дальше date.max не представима — прогноз «не определён»
+    days_left[days_left > (date.max - today).days] = np.nan
+    wear = total * 100.0 / norm
+
+    rate_out = np.round(rate, 2).tolist()
+    days_out = days_left.tolist()
+    wear_out = np.round(wear, 1).tolist()
+    result = []
+    for i, comp_id in enumerate(ids.tolist()):
+        days = days_out[i]
+        known = days == days                        # не NaN
+        result.append({
+            "component_id":  comp_id,
+            "serial_number": serial[i],
+            "part_id":       int(part_id[i]),
+            "part":          part_name[i],
+            "dredger_id":    dredger_id[i],
+            "dredger":       dredger_no[i],
+            "total_hours":   int(total[i]),
+            "norm_hours":    int(norm[i]),
+            "wear_pct":      wear_out[i],
+            "rate_per_day":  rate_out[i] if source[i] else None,
+            "rate_source":   source[i],
+            "days_left":     int(days) if known else None,
+            "forecast_date": today + timedelta(days=int(days)) if known else None,
+        })
+    result.sort(key=lambda r: (r["forecast_date"] is None, r["forecast_date"] or date.max))
+    return result
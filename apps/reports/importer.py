@@ -0,0 +1,448 @@
+"""
+apps/reports/importer.py · загрузка исторических журналов из XLSX/CSV
+
+    python manage.py import_journal deviations old.xlsx --user admin
+    POST /api/reports/import/deviations/   (multipart, поле file)
+
+Схема:
+    1. Строки читаются потоком (openpyxl read_only / csv), заголовки —
+       машинные имена столбцов выгрузок /api/reports/export/… или
+       русские заголовки Excel-отчётов.
+    2. Землесосы (inv_number), запчасти (code) и агрегаты (code + серийный
+       номер) разрешаются по словарям, собранным один раз в начале.
+    3. Корректные строки копятся порциями по chunk_size и пишутся
+       bulk_create — одна транзакция на порцию; ошибки собираются
+       построчно ({"row": номер строки файла, "errors": {поле: текст}}).
+    4. bulk_create не вызывает сигналы: свёртка отклонений обновляется
+       rollup.add_deviations(), кэш дашборда — через bulk_changed.
+
+Ремонты импортируются как история: позиции привязываются к агрегатам,
+но агрегаты не переставляются и наработка им не начисляется — текущее
+состояние парка уже отражено в справочнике агрегатов.
+"""
+import csv
+import io
+import itertools
+import zipfile
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from typing import Iterator
+
+from django.db import transaction
+
+from apps.core.signals import bulk_changed
+from apps.deviations import rollup
+from apps.deviations.models import Deviation
+from apps.refdata.models import SparePart
+from apps.repairs.models import ComponentInstance, Dredger, Repair, RepairItem, wear_percent
+
+CHUNK_SIZE = 5000
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d.%m.%y", "%d/%m/%Y")
+
+
+class RowError(Exception):
+    def __init__(self, errors: dict, key=None):
+        super().__init__(errors)
+        self.errors = errors
+        self.key = key
+
+
+# ───────────────────────── чтение файла ─────────────────────────
+def read_rows(fh, file_name: str) -> Iterator[tuple[int, dict]]:
+    """(номер строки файла, {заголовок: значение}) — построчно, без загрузки файла целиком."""
+    if file_name.lower().endswith((".xlsx", ".xlsm")):
+        rows = _xlsx_rows(fh)
+    elif file_name.lower().endswith((".csv", ".txt")):
+        rows = _csv_rows(fh)
+    else:
+        raise ValueError(f"Unsupported file type: {file_name}")
+
+    header = next(rows, None)
+    if not header:
+        return
+    header = [str(h).strip().lower() if h is not None else "" for h in header]
+    for line_no, values in enumerate(rows, start=2):
+        if not any(v not in (None, "") for v in values):
+            continue                                # пустые строки пропускаем
+        yield line_no, dict(zip(header, values))
+
+
+def _xlsx_rows(fh):
+    from openpyxl import load_workbook
+
+    try:
+        wb = load_workbook(fh, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError) as exc:
+        raise ValueError(f"Invalid XLSX file: {exc}") from None
+    try:
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _csv_rows(fh):
+    text = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="")
+    first = text.readline()
+    try:
+        dialect = csv.Sniffer().sniff(first, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    try:
+        yield from csv.reader(itertools.chain([first], text), dialect)
+    finally:
+        text.detach()                               # файл закрывает владелец
+
+
+# ───────────────────────── разбор значений ─────────────────────────
+def _text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)                          # серийные номера из Excel
+    return str(value).strip()
+
+
+def _date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = _text(value)
+    try:
+        return date.fromisoformat(value)            # самый частый случай — без strptime
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError("Invalid date")
+
+
+def _int(value) -> int:
+    if isinstance(value, str):
+        value = value.strip().replace(" ", "").replace(",", ".")
+    number = float(value)
+    if number < 0 or not number.is_integer():
+        raise ValueError("Expected a non-negative integer")
+    return int(number)
+
+
+class JournalImporter(ABC):
+    """
+    Базовый импортёр: поля строки (FIELDS: имя → допустимые заголовки),
+    разбор строки clean_row(), запись порции write() и обход файла run()
+    задаются в наследниках.
+    """
+    FIELDS: dict[str, tuple[str, ...]] = {}
+    REQUIRED: tuple[str, ...] = ()
+
+    def __init__(self, user, chunk_size: int = CHUNK_SIZE, dry_run: bool = False):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.total = 0
+        self.created = 0
+        self.errors: list[dict] = []
+        self.dredgers = dict(Dredger.objects.values_list("inv_number", "id"))
+
+    def field_map(self, row: dict) -> dict:
+        """Значения строки по именам полей (заголовки — любые из FIELDS)."""
+        values = {}
+        for name, headers in self.FIELDS.items():
+            for header in headers:
+                if header in row:
+                    values[name] = row[header]
+                    break
+        return values
+
+    def parse(self, row: dict, parsers: dict) -> dict:
+        """Разбирает поля строки; все ошибки строки собираются вместе."""
+        values = self.field_map(row)
+        data, errors = {}, {}
+        for name, parse in parsers.items():
+            raw = values.get(name)
+            if raw in (None, "") or (isinstance(raw, str) and not raw.strip()):
+                if name in self.REQUIRED:
+                    errors[name] = "This field is required."
+                else:
+                    data[name] = None
+                continue
+            try:
+                data[name] = parse(raw)
+            except (TypeError, ValueError) as exc:
+                errors[name] = str(exc) or "Invalid value"
+        if errors:
+            raise RowError(errors)
+        return data
+
+    def dredger_id(self, value) -> int:
+        inv_number = _text(value)
+        try:
+            return self.dredgers[inv_number]
+        except KeyError:
+            raise ValueError(f"Unknown dredger: {inv_number}") from None
+
+    def add_error(self, line_no: int, errors: dict) -> None:
+        self.errors.append({"row": line_no, "errors": errors})
+
+    @abstractmethod
+    def clean_row(self, row: dict):
+        """Строка файла → объект(ы) для записи; ошибки — RowError."""
+
+    @abstractmethod
+    def write(self, chunk: list) -> None:
+        """Пишет порцию разобранных строк (в dry_run — ничего)."""
+
+    @abstractmethod
+    def run(self, rows) -> dict:
+        """Обходит строки файла порциями; возвращает report()."""
+
+    def report(self) -> dict:
+        return {"total": self.total, "created": self.created,
+                "failed": len({e["row"] for e in self.errors}),
+                "dry_run": self.dry_run,
+                "errors": sorted(self.errors, key=lambda e: e["row"])}
+
+
+# ───────────────────────── отклонения ─────────────────────────
+class DeviationImporter(JournalImporter):
+    FIELDS = {
+        "date":               ("date", "дата"),
+        "dredger":            ("dredger", "землесос"),
+        "type":               ("type", "вид"),
+        "location":           ("location", "участок"),
+        "last_ppr_date":      ("last_ppr_date", "дата ппр"),
+        "hours_at_deviation": ("hours_at_deviation", "наработка, ч"),
+        "description":        ("description", "описание"),
+        "shift_leader":       ("shift_leader", "начальник смены"),
+        "mechanic":           ("mechanic", "механик"),
+        "electrician":        ("electrician", "электрик"),
+    }
+    # все поля обязательны — как в модели и DeviationSerializer
+    REQUIRED = tuple(FIELDS)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # принимаем и код, и русское название вида / участка
+        self.types = {}
+        for code, label in Deviation.TYPE_CHOICES:
+            self.types[code] = self.types[label] = code
+        self.locations = {code.lower(): code for code, _ in Deviation.LOC_CHOICES}
+        self.parsers = {
+            "date":               _date,
+            "dredger":            self.dredger_id,
+            "type":               lambda v: self.choice(self.types, v),
+            "location":           lambda v: self.choice(self.locations, v),
+            "last_ppr_date":      _date,
+            "hours_at_deviation": _int,
+            "description":        _text,
+            "shift_leader":       self.name,
+            "mechanic":           self.name,
+            "electrician":        self.name,
+        }
+
+    @staticmethod
+    def choice(mapping: dict, value) -> str:
+        try:
+            return mapping[_text(value).lower()]
+        except KeyError:
+            raise ValueError(f"Unknown value: {value}") from None
+
+    @staticmethod
+    def name(value) -> str:
+        value = _text(value)
+        if len(value) > 120:
+            raise ValueError("Ensure this field has no more than 120 characters.")
+        return value
+
+    def clean_row(self, row: dict) -> Deviation:
+        data = self.parse(row, self.parsers)
+        dredger_id = data.pop("dredger")
+        return Deviation(dredger_id=dredger_id, created_by=self.user, updated_by=self.user, **data)
+
+    def write(self, chunk: list[Deviation]) -> None:
+        if self.dry_run:
+            return
+        with transaction.atomic():
+            Deviation.objects.bulk_create(chunk, batch_size=self.chunk_size)
+            rollup.add_deviations(chunk)
+        bulk_changed.send(sender=Deviation)
+
+    def run(self, rows) -> dict:
+        chunk = []
+        for line_no, row in rows:
+            self.total += 1
+            try:
+                chunk.append(self.clean_row(row))
+            except RowError as exc:
+                self.add_error(line_no, exc.errors)
+                continue
+            if len(chunk) >= self.chunk_size:
+                self.write(chunk)
+                self.created += len(chunk)
+                chunk = []
+        if chunk:
+            self.write(chunk)
+            self.created += len(chunk)
+        return self.report()
+
+
+# ───────────────────────── ремонты ─────────────────────────
+class RepairImporter(JournalImporter):
+    """
+    Одна строка — одна позиция ремонта (как в выгрузке repair_items).
+    Подряд идущие строки с одинаковыми землесосом, датами и примечанием
+    образуют один ремонт; строка без запчасти и серийного номера —
+    ремонт без позиций. Если в ремонте есть ошибочная строка,
+    отклоняется весь ремонт.
+    """
+    FIELDS = {
+        "dredger":       ("dredger", "землесос"),
+        "start_date":    ("start_date", "начало"),
+        "end_date":      ("end_date", "окончание"),
+        "notes":         ("notes", "примечание"),
+        "part_code":     ("part_code", "код запчасти"),
+        "serial_number": ("serial_number", "серийный номер"),
+        "hours":         ("hours", "наработка, ч"),
+        "note":          ("note", "комментарий"),
+    }
+    REQUIRED = ("dredger", "start_date", "end_date")
+    ITEM_PARSERS = {
+        "part_code":     _text,
+        "serial_number": _text,
+        "hours":         _int,
+        "note":          _text,
+    }
+
+    def __init__(self, *args, create_components: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.key_parsers = {
+            "dredger":    self.dredger_id,
+            "start_date": _date,
+            "end_date":   _date,
+            "notes":      _text,
+        }
+        self.create_components = create_components
+        self.parts = {code: (pk, norm) for pk, code, norm in
+                      SparePart.objects.values_list("id", "code", "norm_hours")}
+        # (запчасть, серийный номер) → id агрегата; при дублях берётся меньший id
+        self.components: dict[tuple[int, str], int | ComponentInstance] = {}
+        for pk, part_id, serial in (ComponentInstance.objects.order_by("-id")
+                                    .values_list("id", "part_id", "serial_number")):
+            self.components[(part_id, serial)] = pk
+
+    def component(self, code: str, serial: str):
+        if code not in self.parts:
+            raise RowError({"part_code": f"Unknown part: {code}"})
+        part_id, norm = self.parts[code]
+        comp = self.components.get((part_id, serial))
+        if comp is None:
+            if not self.create_components:
+                raise RowError({"serial_number": f"Unknown component: {code} / {serial}"})
+            comp = self.components[(part_id, serial)] = ComponentInstance(
+                part_id=part_id, serial_number=serial, wear_pct=wear_percent(0, norm))
+        return comp
+
+    def clean_row(self, row: dict) -> tuple[tuple, dict | None]:
+        """
+        → (ключ ремонта, данные позиции или None). Если ключ разобран, а позиция
+        нет — RowError.key указывает ремонт, который нужно отклонить целиком.
+        """
+        data = self.parse(row, self.key_parsers)
+        if data["end_date"] < data["start_date"]:
+            raise RowError({"end_date": "End date must be after start date"})
+        key = (data["dredger"], data["start_date"], data["end_date"], data["notes"] or "")
+        try:
+            item = self.parse(row, self.ITEM_PARSERS)
+            if not item["part_code"] and not item["serial_number"]:
+                return key, None
+            if not item["part_code"]:
+                raise RowError({"part_code": "This field is required."})
+            if item["hours"] is None:
+                raise RowError({"hours": "This field is required."})
+            return key, {"component": self.component(item["part_code"], item["serial_number"] or ""),
+                         "hours": item["hours"], "note": (item["note"] or "")[:255]}
+        except RowError as exc:
+            exc.key = key
+            raise
+
+    def write(self, repairs: list[tuple[tuple, list[dict]]]) -> None:
+        if self.dry_run:
+            return
+        new_comps = {id(item["component"]): item["component"]
+                     for _, items in repairs for item in items
+                     if isinstance(item["component"], ComponentInstance) and item["component"].pk is None}
+        with transaction.atomic():
+            ComponentInstance.objects.bulk_create(new_comps.values(), batch_size=self.chunk_size)
+            for comp in new_comps.values():
+                self.components[(comp.part_id, comp.serial_number)] = comp.pk
+            objs = Repair.objects.bulk_create([
+                Repair(dredger_id=dredger_id, start_date=start, end_date=end, notes=notes,
+                       created_by=self.user, updated_by=self.user)
+                for (dredger_id, start, end, notes), _ in repairs
+            ], batch_size=self.chunk_size)
+            RepairItem.objects.bulk_create([
+                RepairItem(repair=repair, hours=item["hours"], note=item["note"],
+                           component_id=getattr(item["component"], "pk", item["component"]))
+                for repair, (_, items) in zip(objs, repairs) for item in items
+            ], batch_size=self.chunk_size)
+        bulk_changed.send(sender=Repair)
+        if new_comps:
+            bulk_changed.send(sender=ComponentInstance)
+
+    def run(self, rows) -> dict:
+        pending, pending_items = [], 0
+        group_key, group_items, group_lines, group_failed = None, [], [], []
+
+        def close_group():
+            nonlocal pending_items
+            if group_key is None:
+                return
+            if group_failed:
+                for line_no in group_lines:
+                    if line_no not in group_failed:
+                        self.add_error(line_no, {"repair": f"Repair rejected: errors in rows {group_failed}"})
+                return
+            pending.append((group_key, group_items))
+            pending_items += len(group_items) + 1
+
+        def flush():
+            nonlocal pending, pending_items
+            self.write(pending)
+            self.created += len(pending)
+            pending, pending_items = [], 0
+
+        for line_no, row in rows:
+            self.total += 1
+            try:
+                key, item = self.clean_row(row)
+            except RowError as exc:
+                self.add_error(line_no, exc.errors)
+                if exc.key is None:
+                    continue                        # не понять, к какому ремонту строка
+                key, item = exc.key, None
+                failed = True
+            else:
+                failed = False
+            if key != group_key:
+                close_group()
+                if pending_items >= self.chunk_size:
+                    flush()
+                group_key, group_items, group_lines, group_failed = key, [], [], []
+            group_lines.append(line_no)
+            if failed:
+                group_failed.append(line_no)
+            elif item:
+                group_items.append(item)
+        close_group()
+        if pending:
+            flush()
+        return self.report()
+
+
+IMPORTERS = {
+    "deviations": DeviationImporter,
+    "repairs":    RepairImporter,
+}
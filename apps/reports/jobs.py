@@ -0,0 +1,197 @@
+"""
+apps/reports/jobs.py · фоновое формирование отчётов
+
+Схема работы (только SQLite и локальные процессы, без брокера):
+    1. enqueue() считает ключ кэша по типу отчёта и фильтрам. Если готовый
+       файл с таким ключом моложе REPORT_CACHE_TTL — возвращается он же;
+       если такая задача уже в очереди/в работе — возвращается она.
+    2. Команда `manage.py report_worker` опрашивает таблицу ReportJob,
+       атомарно забирает задачу (UPDATE … WHERE status='pending') и пишет
+       .xlsx в MEDIA_ROOT/reports/<ключ>.xlsx.
+    3. Задача, которая дольше REPORT_JOB_TIMEOUT остаётся в статусе running
+       (воркер упал или был убит), считается зависшей: она помечается failed
+       и больше не мешает поставить такой же отчёт заново.
+
+Задачи видны только их автору (и staff): готовый файл другого пользователя
+не отдаётся по чужой задаче — для него создаётся своя запись задачи,
+ссылающаяся на тот же файл.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .excel import iter_xlsx
+from .models import ReportJob
+
+logger = logging.getLogger(__name__)
+
+# тип отчёта → view, у которого берутся queryset, фильтры и столбцы
+REPORTS = {
+    "repairs":    "apps.reports.views.RepairsExcelView",
+    "deviations": "apps.reports.views.DeviationsExcelView",
+}
+
+REPORTS_DIR = "reports"
+
+
+def cache_ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, "REPORT_CACHE_TTL", 15 * 60))
+
+
+def job_timeout() -> timedelta:
+    return timedelta(seconds=getattr(settings, "REPORT_JOB_TIMEOUT", 30 * 60))
+
+
+def normalize_params(params: dict) -> dict:
+    """Отбрасывает пустые значения и приводит всё к строкам/спискам строк."""
+    clean = {}
+    for key, value in (params or {}).items():
+        if value in (None, "", []):
+            continue
+        if isinstance(value, (list, tuple)):
+            clean[key] = sorted(str(v) for v in value)
+        else:
+            clean[key] = str(value)
+    return clean
+
+
+def make_cache_key(report_type: str, params: dict) -> str:
+    payload = json.dumps([report_type, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def report_view(report_type: str):
+    return import_string(REPORTS[report_type])
+
+
+def expire_stale() -> int:
+    """Зависшие задачи (running дольше job_timeout()) → failed. Возвращает их число."""
+    return (ReportJob.objects
+            .filter(status=ReportJob.RUNNING, started_at__lt=timezone.now() - job_timeout())
+            .update(status=ReportJob.FAILED, error="Worker timed out", finished_at=timezone.now()))
+
+
+def fresh_job(key: str) -> ReportJob | None:
+    """Готовая задача с этим ключом, чей файл ещё не устарел и существует."""
+    fresh = (ReportJob.objects
+             .filter(cache_key=key, status=ReportJob.DONE,
+                     finished_at__gte=timezone.now() - cache_ttl())
+             .exclude(file="")
+             .order_by("-finished_at")
+             .first())
+    if fresh and os.path.exists(fresh.file.path):
+        return fresh
+    return None
+
+
+def enqueue(report_type: str, params: dict, user=None) -> ReportJob:
+    """
+    Ставит отчёт в очередь. Фильтры проверяются сразу (ValidationError → 400),
+    чтобы ошибка не всплыла позже в воркере.
+    """
+    params = normalize_params(params)
+    report_view(report_type).export_queryset(params)
+    key = make_cache_key(report_type, params)
+    author = user if user and user.is_authenticated else None
+    expire_stale()
+
+    fresh = fresh_job(key)
+    if fresh:
+        if fresh.created_by_id == (author.pk if author else None):
+            return fresh
+        # чужой готовый файл — своя запись задачи на тот же файл
+        return ReportJob.objects.create(
+            report_type=report_type, params=params, cache_key=key, created_by=author,
+            status=ReportJob.DONE, file=fresh.file.name,
+            started_at=fresh.started_at, finished_at=fresh.finished_at,
+        )
+
+    active = (ReportJob.objects
+              .filter(cache_key=key, created_by=author, status__in=[ReportJob.PENDING, ReportJob.RUNNING])
+              .order_by("created_at")
+              .first())
+    if active:
+        return active
+
+    return ReportJob.objects.create(
+        report_type=report_type,
+        params=params,
+        cache_key=key,
+        created_by=author,
+    )
+
+
+def claim_next() -> ReportJob | None:
+    """Атомарно забирает самую старую задачу из очереди (None — очередь пуста)."""
+    expire_stale()
+    candidates = (ReportJob.objects
+                  .filter(status=ReportJob.PENDING)
+                  .order_by("created_at")
+                  .values_list("id", flat=True)[:10])
+    for job_id in candidates:
+        claimed = (ReportJob.objects
+                   .filter(id=job_id, status=ReportJob.PENDING)
+                   .update(status=ReportJob.RUNNING, started_at=timezone.now()))
+        if claimed:
+            return ReportJob.objects.get(id=job_id)
+    return None
+
+
+def build_file(job: ReportJob) -> str:
+    """Пишет .xlsx отчёта в MEDIA_ROOT; возвращает имя файла для FileField."""
+    view = report_view(job.report_type)
+    qs = view.export_queryset(job.params)
+    rows = qs.values_list(*view.columns.keys()).iterator(chunk_size=2000)
+
+    name = f"{REPORTS_DIR}/{job.cache_key}.xlsx"
+    path = Path(settings.MEDIA_ROOT) / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{job.pk}.part")
+    with open(tmp, "wb") as fh:
+        for chunk in iter_xlsx(rows, list(view.columns.values())):
+            fh.write(chunk)
+    os.replace(tmp, path)
+    return name
+
+
+def run_job(job: ReportJob) -> ReportJob:
+    """
+    Формирует файл отчёта; исход записывается в саму задачу. Если такой же
+    отчёт (другого пользователя) уже готов и не устарел — берётся его файл.
+    """
+    try:
+        fresh = fresh_job(job.cache_key)
+        job.file.name = fresh.file.name if fresh else build_file(job)
+        job.status = ReportJob.DONE
+        job.error = ""
+    except Exception as exc:                       # задача не должна ронять воркер
+        logger.exception("report job %s failed", job.pk)
+        job.status = ReportJob.FAILED
+        job.error = str(exc)
+    job.finished_at = timezone.now()
+    job.save(update_fields=["file", "status", "error", "finished_at"])
+    return job
+
+
+def run_worker(poll_interval: float = 2.0, once: bool = False) -> int:
+    """Цикл воркера. once=True — обработать очередь и выйти. Возвращает число задач."""
+    done = 0
+    while True:
+        close_old_connections()
+        job = claim_next()
+        if job:
+            run_job(job)
+            done += 1
+            continue
+        if once:
+            return done
+        time.sleep(poll_interval)
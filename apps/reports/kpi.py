@@ -0,0 +1,183 @@
+"""
+apps/reports/kpi.py · показатели надёжности: MTBF, MTTR, простой
+
+    failures       — число отказов (записей журнала отклонений);
+    mtbf_hours     — средняя наработка между соседними отказами, ч
+                     (разность hours_at_deviation; отрицательные разности —
+                     сброс/ошибка счётчика — не учитываются);
+    mtbf_days      — то же в календарных сутках (разность дат);
+    repairs        — число ремонтов (по дате начала);
+    mttr_days      — средняя длительность ремонта, сут (один день — 1);
+    downtime_days  — суммарная длительность ремонтов, сут.
+
+Группировка — любые из DIMENSIONS. Интервал между отказами относится к
+группе более позднего отказа; соседние отказы ищутся в пределах одного
+землесоса, а при группировке по виду (type) / участку (location) — ещё и
+в пределах того же вида / участка. У ремонтов нет вида и участка, поэтому
+при такой группировке показатели ремонтов — null.
+
+Расчёт: по запросу на журнал с минимальным набором столбцов (даты —
+сразу номерами суток, без объектов date; тип землесоса — по словарю
+землесосов, без JOIN), дальше — векторные операции NumPy: сортировка
+последовательностей np.lexsort, разности соседних строк, коды групп
+через np.unique(axis=0), суммы по группам через np.bincount. Python-цикл —
+только по итоговым группам.
+"""
+from datetime import date
+
+import numpy as np
+from django.db import connection
+from django.db.models import F, Func, IntegerField, Value
+from django.db.models.functions import Cast, ExtractDay
+
+from apps.deviations.models import Deviation
+from apps.refdata.models import DredgerType
+from apps.repairs.models import Dredger, Repair
+from .forecast import JULIAN_UNIX_EPOCH
+
+DIMENSIONS = ("dredger", "dredger_type", "type", "location", "month")
+
+
+def _with_day(queryset, field: str, alias: str = "day"):
+    """+ alias — дата field как номер суток от 1970-01-01 (на SQLite — считает БД)."""
+    if connection.vendor == "sqlite":
+        expr = Cast(Func(F(field), function="julianday") - JULIAN_UNIX_EPOCH, IntegerField())
+    else:
+        expr = ExtractDay(F(field) - Value(date(1970, 1, 1)))
+    return queryset.annotate(**{alias: expr})
+
+
+def _months(days: np.ndarray) -> np.ndarray:
+    """Номера суток → номер месяца (месяцев от 1970-01)."""
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def _codes(values) -> tuple[np.ndarray, np.ndarray]:
+    """Категориальный столбец → (уникальные значения, коды)."""
+    uniques, codes = np.unique(np.asarray(values), return_inverse=True)
+    return uniques, codes
+
+
+def _group(columns: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """Коды групп по нескольким целочисленным столбцам: (ключи групп [n×k], индекс группы строки)."""
+    keys, inverse = np.unique(np.column_stack(columns), axis=0, return_inverse=True)
+    return keys, inverse.reshape(-1)
+
+
+def reliability_kpi(group_by=("dredger",), date_after: date | None = None,
+                    date_before: date | None = None, dredger_ids=None) -> list[dict]:
+    group_by = [dim for dim in DIMENSIONS if dim in group_by]
+    deviations = Deviation.objects.all()
+    repairs = Repair.objects.all()
+    if date_after:
+        deviations = deviations.filter(date__gte=date_after)
+        repairs = repairs.filter(start_date__gte=date_after)
+    if date_before:
+        deviations = deviations.filter(date__lte=date_before)
+        repairs = repairs.filter(start_date__lte=date_before)
+    if dredger_ids:
+        deviations = deviations.filter(dredger__in=dredger_ids)
+        repairs = repairs.filter(dredger__in=dredger_ids)
+
+    # вид и участок нужны только при группировке по ним
+    categories = [f for f in ("type", "location") if f in group_by]
+    dev_rows = list(_with_day(deviations, "date").values_list("dredger_id", "day", "hours_at_deviation",
+                                                              *categories))
+    with_repairs = not categories
+    rep_rows = list(_with_day(_with_day(repairs, "start_date", "start"), "end_date", "end")
+                    .values_list("dredger_id", "start", "end")) if with_repairs else []
+    if not dev_rows and not rep_rows:
+        return []
+    # тип землесоса — по словарю землесосов, без JOIN в запросах по журналам
+    dredger_type = dict(Dredger.objects.values_list("id", "type_id"))
+    type_of = np.vectorize(dredger_type.get, otypes=[np.int64])
+
+    labels, columns_dev, columns_rep = {}, {}, {}
+    if dev_rows:
+        d_dredger, d_day, d_hours, *d_cats = zip(*dev_rows)
+        d_dredger = np.array(d_dredger, dtype=np.int64)
+        d_day = np.array(d_day, dtype=np.int64)
+        d_hours = np.array(d_hours, dtype=np.float64)
+        cats = {}
+        for name, values in zip(categories, d_cats):
+            labels[name], cats[name] = _codes(values)
+        # последовательности отказов: землесос (+ вид / участок), внутри — по дате и наработке
+        order = np.lexsort([d_hours, d_day, *[cats[c] for c in reversed(categories)], d_dredger])
+        d_dredger, d_day, d_hours = d_dredger[order], d_day[order], d_hours[order]
+        cats = {name: codes[order] for name, codes in cats.items()}
+        columns_dev = {"dredger": d_dredger, "dredger_type": type_of(d_dredger),
+                       "month": _months(d_day), **cats}
+    if rep_rows:
+        r_dredger, r_start, r_end = (np.array(col, dtype=np.int64) for col in zip(*rep_rows))
+        columns_rep = {"dredger": r_dredger, "dredger_type": type_of(r_dredger),
+                       "month": _months(r_start)}
+
+    # одна таблица групп на оба журнала: ключи склеиваются и кодируются вместе
+    n_dev, n_rep = len(dev_rows), len(rep_rows)
+    if group_by:
+        stacked = [np.concatenate([columns_dev[d] if n_dev else np.empty(0, np.int64),
+                                   columns_rep[d] if n_rep else np.empty(0, np.int64)])
+                   for d in group_by]
+        keys, inverse = _group(stacked)
+    else:
+        keys, inverse = np.zeros((1, 0), dtype=np.int64), np.zeros(n_dev + n_rep, dtype=np.int64)
+    n_groups = len(keys)
+    dev_group, rep_group = inverse[:n_dev], inverse[n_dev:]
+
+    failures = np.bincount(dev_group, minlength=n_groups)
+    mtbf_hours = mtbf_days = np.full(n_groups, np.nan)
+    if n_dev > 1:
+        # соседние строки одной последовательности
+        same = d_dredger[1:] == d_dredger[:-1]
+        for codes in cats.values():
+            same &= codes[1:] == codes[:-1]
+        dh = d_hours[1:] - d_hours[:-1]
+        dd = (d_day[1:] - d_day[:-1]).astype(np.float64)
+        later = dev_group[1:]
+        ok_h = same & (dh >= 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mtbf_hours = (np.bincount(later[ok_h], dh[ok_h], n_groups)
+                          / np.bincount(later[ok_h], minlength=n_groups))
+            mtbf_days = (np.bincount(later[same], dd[same], n_groups)
+                         / np.bincount(later[same], minlength=n_groups))
+
+    repairs_n = np.bincount(rep_group, minlength=n_groups)
+    downtime = np.zeros(n_groups)
+    if n_rep:
+        downtime = np.bincount(rep_group, (r_end - r_start + 1).astype(np.float64), n_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mttr = downtime / repairs_n
+
+    # подписи землесосов и типов — двумя небольшими запросами по id групп
+    names = {}
+    if "dredger" in group_by:
+        ids = keys[:, group_by.index("dredger")].tolist()
+        names["dredger"] = dict(Dredger.objects.filter(id__in=ids).values_list("id", "inv_number"))
+    if "dredger_type" in group_by:
+        ids = keys[:, group_by.index("dredger_type")].tolist()
+        names["dredger_type"] = dict(DredgerType.objects.filter(id__in=ids).values_list("id", "name"))
+
+    def _num(value, digits=1):
+        return None if value != value else round(float(value), digits)       # NaN → None
+
+    result = []
+    for g, key in enumerate(keys.tolist()):
+        row = {}
+        for dim, value in zip(group_by, key):
+            if dim in ("dredger", "dredger_type"):
+                row[f"{dim}_id"] = value
+                row[dim] = names[dim].get(value)
+            elif dim == "month":
+                row["month"] = str(np.datetime64(value, "M"))
+            else:
+                row[dim] = str(labels[dim][value])
+        row.update({
+            "failures":      int(failures[g]),
+            "mtbf_hours":    _num(mtbf_hours[g]),
+            "mtbf_days":     _num(mtbf_days[g]),
+            "repairs":       int(repairs_n[g]) if with_repairs else None,
+            "mttr_days":     _num(mttr[g]) if with_repairs else None,
+            "downtime_days": int(downtime[g]) if with_repairs else None,
+        })
+        result.append(row)
+    return result
@@ -0,0 +1,59 @@
+"""
+Загрузка исторических журналов из XLSX/CSV:
+
+    python manage.py import_journal deviations journal_2019.xlsx --user admin
+    python manage.py import_journal repairs repairs.csv --user admin --create-components
+    python manage.py import_journal deviations big.csv --user admin --dry-run --errors errors.csv
+
+Формат столбцов — см. apps/reports/importer.py.
+"""
+import csv
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.reports.importer import CHUNK_SIZE, IMPORTERS, read_rows
+
+
+class Command(BaseCommand):
+    help = "Импортирует исторические ремонты или отклонения из XLSX/CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(IMPORTERS))
+        parser.add_argument("path")
+        parser.add_argument("--user", required=True, help="автор записей (username)")
+        parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="строк в одной транзакции")
+        parser.add_argument("--dry-run", action="store_true", help="только проверить файл")
+        parser.add_argument("--create-components", action="store_true",
+                            help="ремонты: создавать неизвестные агрегаты (на складе)")
+        parser.add_argument("--errors", help="CSV-файл для построчного отчёта об ошибках")
+
+    def handle(self, *args, kind, path, user, chunk, dry_run, create_components, errors, **options):
+        try:
+            author = User.objects.get(username=user)
+        except User.DoesNotExist:
+            raise CommandError(f"User not found: {user}")
+
+        kwargs = {"create_components": create_components} if kind == "repairs" else {}
+        importer = IMPORTERS[kind](author, chunk_size=chunk, dry_run=dry_run, **kwargs)
+        try:
+            with open(path, "rb") as fh:
+                report = importer.run(read_rows(fh, path))
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        if errors:
+            with open(errors, "w", newline="", encoding="utf-8") as out:
+                writer = csv.writer(out)
+                writer.writerow(["row", "field", "error"])
+                for err in report["errors"]:
+                    for field, message in err["errors"].items():
+                        writer.writerow([err["row"], field, message])
+        else:
+            for err in report["errors"][:20]:
+                self.stderr.write(f"строка {err['row']}: {err['errors']}")
+
+        verb = "Проверено" if dry_run else "Загружено"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} записей: {report['created']} из {report['total']} строк, "
+            f"строк с ошибками: {report['failed']}"))
@@ -0,0 +1,39 @@
+"""
+Воркер фоновых отчётов:
+
+    python manage.py report_worker               # один процесс, опрос очереди
+    python manage.py report_worker --workers 4   # пул из 4 процессов
+    python manage.py report_worker --once        # обработать очередь и выйти (cron)
+"""
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.reports.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Выполняет фоновые задачи формирования отчётов (ReportJob)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help="число процессов")
+        parser.add_argument("--poll", type=float, default=2.0, help="интервал опроса очереди, с")
+        parser.add_argument("--once", action="store_true", help="обработать очередь и завершиться")
+
+    def handle(self, *args, workers, poll, once, **options):
+        if workers <= 1:
+            done = run_worker(poll_interval=poll, once=once)
+            self.stdout.write(self.style.SUCCESS(f"Обработано задач: {done}"))
+            return
+
+        # соединения с БД не должны наследоваться дочерними процессами
+        connections.close_all()
+        procs = [
+            multiprocessing.Process(target=run_worker, kwargs={"poll_interval": poll, "once": once})
+            for _ in range(workers)
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
@@ -0,0 +1,31 @@
+from rest_framework import serializers
+from .jobs import REPORTS
+from .models import ReportJob
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    report_type = serializers.ChoiceField(choices=sorted(REPORTS))
+    params = serializers.DictField(required=False, default=dict)
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = (
+            "id",
+            "report_type",
+            "params",
+            "status",
+            "error",
+            "download_url",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
+        read_only_fields = ("status", "error", "created_at", "started_at", "finished_at")
+
+    def get_download_url(self, obj):
+        if obj.status != ReportJob.DONE:
+            return None
+        url = f"/api/reports/jobs/{obj.pk}/download/"
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
@@ -0,0 +1,12 @@
+"""
+Сброс кэша дашборда при любых изменениях данных, из которых он строится.
+"""
+from apps.core.cache import invalidate_on_change
+from apps.deviations.models import Deviation
+from apps.refdata.models import SparePart
+from apps.repairs.models import ComponentInstance, Dredger, Repair, RepairItem
+from . import cache as dashboard_cache
+
+DASHBOARD_SOURCES = (Deviation, Repair, RepairItem, ComponentInstance, Dredger, SparePart)
+
+invalidate_on_change(dashboard_cache.invalidate, DASHBOARD_SOURCES, "dashboard")
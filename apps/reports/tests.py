@@ -1,3 +1,653 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import load_workbook
+from rest_framework.test import APIClient
+
+from apps.deviations.models import Deviation, DeviationDailyCount
+from apps.refdata.models import DredgerType, SparePart
+from apps.repairs.models import ComponentHistory, ComponentInstance, Dredger, Repair, RepairItem
+from .columnar import HAS_PYARROW
+from .excel import iter_xlsx
+from .forecast import wear_forecast
+from .jobs import claim_next, enqueue
+from .models import ReportJob
+
+
+def add_deviation(dredger, day, user, **fields):
+    values = {"type": "mechanical", "location": "ПНС", "last_ppr_date": date(2023, 12, 1),
+              "hours_at_deviation": 100, "description": "—", "shift_leader": "—", "mechanic": "—",
+              "electrician": "—", **fields}
+    return Deviation.objects.create(dredger=dredger, date=day, created_by=user, updated_by=user, **values)
+
+
+class DashboardDataViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer", is_staff=True)
+        cls.dtype = DredgerType.objects.create(name="ЗГМ", code="ZGM")
+        cls.pump = SparePart.objects.create(code="P-1", name="Насос", norm_hours=1000)
+        cls.motor = SparePart.objects.create(code="M-1", name="Двигатель", norm_hours=2000)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_dredgers(self, count, start=0):
+        # on_commit-колбэки (сброс кэша дашборда) внутри TestCase выполняем вручную
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(start, start + count):
+                d = Dredger.objects.create(inv_number=f"D-{i:03}", type=self.dtype)
+                ComponentInstance.objects.create(part=self.pump, current_dredger=d, total_hours=100 * (i + 1))
+                ComponentInstance.objects.create(part=self.motor, current_dredger=d, total_hours=300)
+
+    def get_dashboard(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get("/api/reports/dashboard/", {
+                "date_after": date(2020, 1, 1), "date_before": date(2020, 12, 31),
+            })
+        self.assertEqual(resp.status_code, 200)
+        return resp.data, len(ctx.captured_queries)
+
+    def test_dredger_resources_use_most_worn_component(self):
+        self.add_dredgers(2)
+        # компонент без нормы не участвует в расчёте
+        ComponentInstance.objects.create(
+            part=SparePart.objects.create(code="X-0", name="Без нормы", norm_hours=0),
+            current_dredger=Dredger.objects.get(inv_number="D-000"), total_hours=5000,
+        )
+        data, _ = self.get_dashboard()
+        self.assertEqual(
+            [(r["inv_number"], r["remain_pct"]) for r in data["dredger_resources"]],
+            [("D-000", 85.0), ("D-001", 80.0)],   # 300/2000 = 15 %, 200/1000 = 20 %
+        )
+
+    def test_query_count_does_not_depend_on_fleet_size(self):
+        self.add_dredgers(2)
+        _, small = self.get_dashboard()
+        self.add_dredgers(30, start=2)
+        data, large = self.get_dashboard()
+        self.assertEqual(len(data["dredger_resources"]), 32)
+        self.assertEqual(small, large)
+
+    def test_cached_until_write(self):
+        self.add_dredgers(1)
+        first, _ = self.get_dashboard()
+        cached, queries = self.get_dashboard()
+        self.assertEqual(queries, 0)
+        self.assertEqual(cached, first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Deviation.objects.create(
+                dredger=Dredger.objects.get(), date=date(2020, 6, 1), type=Deviation.ELEC,
+                location=Deviation.PNS, last_ppr_date=date(2020, 5, 1), hours_at_deviation=10,
+                description="—", shift_leader="—", mechanic="—", electrician="—",
+                created_by=self.user, updated_by=self.user,
+            )
+        fresh, queries = self.get_dashboard()
+        self.assertGreater(queries, 0)
+        self.assertEqual(fresh["downtime"][1], {"type": "electrical", "count": 1})
+
+        stats = self.client.get("/api/reports/dashboard/cache-stats/").data
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+
+class JournalImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer", is_staff=True)
+        dtype = DredgerType.objects.create(name="ЗГМ", code="ZGM")
+        cls.dredger = Dredger.objects.create(inv_number="D-1", type=dtype)
+        cls.pump = SparePart.objects.create(code="P-1", name="Насос", norm_hours=1000)
+        cls.comp = ComponentInstance.objects.create(part=cls.pump, serial_number="SN-1")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, kind, name, content, query=""):
+        return self.client.post(f"/api/reports/import/{kind}/{query}",
+                                {"file": SimpleUploadedFile(name, content)}, format="multipart")
+
+    def test_deviations_csv_with_row_errors(self):
+        content = (
+            "Дата;Землесос;Вид;Участок;last_ppr_date;hours_at_deviation;Описание;"
+            "Начальник смены;Механик;Электрик\n"
+            "01.02.2019;D-1;механический;ПНС;2019-01-01;120;течь;Иванов;Петров;Сидоров\n"
+            "2019-02-01;D-1;electrical;ТВС;2019-01-01;130;обрыв;Иванов;Петров;Сидоров\n"
+            "2019-02-02;D-9;electrical;ТВС;2019-01-01;-5;обрыв;Иванов;Петров;Сидоров\n"
+            "\n"
+            "2019-02-01;D-1;mechanical;ПНС;2019-01-01;140;снова течь;Иванов;Петров;Сидоров\n"
+        ).encode("utf-8-sig")
+        resp = self.upload("deviations", "journal.csv", content)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertEqual((resp.data["total"], resp.data["created"], resp.data["failed"]), (4, 3, 1))
+        self.assertEqual(resp.data["errors"][0]["row"], 4)
+        self.assertEqual(set(resp.data["errors"][0]["errors"]), {"dredger", "hours_at_deviation"})
+        self.assertEqual(Deviation.objects.count(), 3)
+        # свёртка учитывает отклонения, вставленные bulk_create
+        self.assertEqual(
+            DeviationDailyCount.objects.get(day=date(2019, 2, 1), type="mechanical").count, 2)
+
+    def test_deviation_crew_is_required(self):
+        # как и в API: без смены, механика и электрика запись не создаётся
+        content = ("date,dredger,type,location,last_ppr_date,hours_at_deviation,description,"
+                   "shift_leader,mechanic,electrician\n"
+                   "2019-02-01,D-1,mechanical,ПНС,2019-01-01,1,x,Иванов,,\n").encode()
+        resp = self.upload("deviations", "journal.csv", content)
+        self.assertEqual((resp.data["created"], resp.data["failed"]), (0, 1))
+        self.assertEqual(resp.data["errors"][0]["errors"], {"mechanic": "This field is required.",
+                                                            "electrician": "This field is required."})
+        self.assertFalse(Deviation.objects.exists())
+
+    def test_dry_run_writes_nothing(self):
+        content = b"date,dredger,type,location,last_ppr_date,hours_at_deviation,description," \
+                  b"shift_leader,mechanic,electrician\n" \
+                  b"2019-02-01,D-1,mechanical,PNS,2019-01-01,1,x,A,B,C\n"
+        resp = self.upload("deviations", "journal.csv", content, "?dry_run=1")
+        self.assertEqual(resp.data["errors"][0]["errors"], {"location": "Unknown value: PNS"})
+        self.assertFalse(Deviation.objects.exists())
+
+    def test_repairs_xlsx_groups_rows_into_repairs(self):
+        from openpyxl import Workbook
+
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["dredger", "start_date", "end_date", "notes", "part_code", "serial_number", "hours"])
+        ws.append(["D-1", date(2018, 5, 1), date(2018, 5, 3), "ППР", "P-1", "SN-1", 500])
+        ws.append(["D-1", date(2018, 5, 1), date(2018, 5, 3), "ППР", "P-1", "SN-2", 0])
+        ws.append(["D-1", date(2018, 6, 1), date(2018, 6, 2), "", None, None, None])
+        ws.append(["D-1", date(2018, 7, 1), date(2018, 7, 2), "", "P-1", "SN-404", 1])
+        ws.append(["D-1", date(2018, 7, 1), date(2018, 7, 2), "", "P-1", "SN-1", 1])
+        buf = io.BytesIO()
+        wb.save(buf)
+
+        resp = self.upload("repairs", "repairs.xlsx", buf.getvalue())
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertEqual(resp.data["created"], 1)
+        # ошибка в строке 3 отклоняет весь ремонт (строки 2–3), так же и 5–6
+        self.assertEqual([e["row"] for e in resp.data["errors"]], [2, 3, 5, 6])
+        self.assertIn("Repair rejected", str(resp.data["errors"][0]["errors"]))
+        self.assertEqual(Repair.objects.count(), 1)
+
+        Repair.objects.all().delete()
+        resp = self.upload("repairs", "repairs.xlsx", buf.getvalue(), "?create_components=1")
+        self.assertEqual((resp.data["created"], resp.data["failed"]), (3, 0))
+        self.assertEqual(Repair.objects.count(), 3)
+        self.assertEqual(RepairItem.objects.filter(component=self.comp).count(), 2)
+        self.assertEqual(ComponentInstance.objects.filter(serial_number__in=["SN-2", "SN-404"],
+                                                         current_dredger=None).count(), 2)
+        # исторический импорт не переставляет агрегаты и не начисляет наработку
+        self.comp.refresh_from_db()
+        self.assertEqual((self.comp.current_dredger, self.comp.total_hours), (None, 0))
+
+
+class ReliabilityKpiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer", is_staff=True)
+        dtype = DredgerType.objects.create(name="ЗГМ", code="ZGM")
+        cls.d1 = Dredger.objects.create(inv_number="D-1", type=dtype)
+        cls.d2 = Dredger.objects.create(inv_number="D-2", type=dtype)
+        for dredger, day, hours, kind in [
+            (cls.d1, date(2024, 1, 10), 100, "mechanical"),
+            (cls.d1, date(2024, 1, 20), 300, "electrical"),
+            (cls.d1, date(2024, 2, 9), 700, "mechanical"),
+            (cls.d2, date(2024, 1, 5), 50, "mechanical"),
+        ]:
+            Deviation.objects.create(
+                dredger=dredger, date=day, type=kind, location="ПНС", last_ppr_date=date(2023, 12, 1),
+                hours_at_deviation=hours, description="—", shift_leader="—", mechanic="—",
+                electrician="—", created_by=cls.user, updated_by=cls.user,
+            )
+        Repair.objects.create(dredger=cls.d1, start_date=date(2024, 1, 21), end_date=date(2024, 1, 23),
+                              created_by=cls.user, updated_by=cls.user)
+        Repair.objects.create(dredger=cls.d1, start_date=date(2024, 2, 10), end_date=date(2024, 2, 10),
+                              created_by=cls.user, updated_by=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, **params):
+        resp = self.client.get("/api/reports/kpi/", params)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return resp
+
+    def test_mtbf_and_mttr_by_dredger(self):
+        rows = {r["dredger"]: r for r in self.get().data}
+        self.assertEqual(rows["D-1"], {
+            "dredger_id": self.d1.id, "dredger": "D-1", "failures": 3,
+            "mtbf_hours": 300.0, "mtbf_days": 15.0,       # (200 + 400) / 2, (10 + 20) / 2
+            "repairs": 2, "mttr_days": 2.0, "downtime_days": 4,
+        })
+        # один отказ — интервалов нет
+        self.assertEqual((rows["D-2"]["failures"], rows["D-2"]["mtbf_hours"], rows["D-2"]["repairs"]),
+                         (1, None, 0))
+
+    def test_group_by_type_and_month(self):
+        rows = self.get(group="type", dredger=self.d1.id).data
+        mech = next(r for r in rows if r["type"] == "mechanical")
+        # соседние отказы — в пределах вида: 100 → 700
+        self.assertEqual((mech["failures"], mech["mtbf_hours"], mech["repairs"]), (2, 600.0, None))
+
+        rows = self.get(group="month", date_after="2024-02-01").data
+        self.assertEqual(rows, [{"month": "2024-02", "failures": 1, "mtbf_hours": None, "mtbf_days": None,
+                                 "repairs": 1, "mttr_days": 1.0, "downtime_days": 1}])
+
+    def test_cached_until_journal_changes(self):
+        self.assertEqual(self.get()["X-Cache"], "MISS")
+        self.assertEqual(self.get()["X-Cache"], "HIT")
+        with self.captureOnCommitCallbacks(execute=True):
+            Repair.objects.create(dredger=self.d2, start_date=date(2024, 3, 1), end_date=date(2024, 3, 2),
+                                  created_by=self.user, updated_by=self.user)
+        resp = self.get()
+        self.assertEqual(resp["X-Cache"], "MISS")
+        self.assertEqual(next(r for r in resp.data if r["dredger"] == "D-2")["repairs"], 1)
+
+    def test_unknown_group(self):
+        resp = self.client.get("/api/reports/kpi/", {"group": "shift"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class ExcelStreamTests(TestCase):
+    def read_back(self, chunks):
+        return load_workbook(io.BytesIO(b"".join(chunks))).active
+
+    def test_multi_chunk_export_reads_back(self):
+        rows = [(i, hashlib.sha256(str(i).encode()).hexdigest()) for i in range(3000)]
+        chunks = list(iter_xlsx(iter(rows), ["ID", "Хеш"], chunk_size=200))
+        self.assertGreater(len(chunks), 3)                 # файл действительно отдаётся порциями
+        sheet = self.read_back(chunks)
+        self.assertEqual(sheet.max_row, 3001)
+        self.assertEqual([c.value for c in sheet[1]], ["ID", "Хеш"])
+        self.assertTrue(sheet["A1"].font.b)
+        self.assertEqual([c.value for c in sheet[3001]], [2999, rows[-1][1]])
+
+    def test_cell_types_and_escaping(self):
+        row = ('<a&b "c">\x01\x1f\tконец', date(2024, 1, 2), datetime(2024, 1, 1, 12, 30),
+               Decimal("1.5"), 2.25, True, None, 7)
+        sheet = self.read_back(iter_xlsx([row], list("ABCDEFGH"), sheet_name='Лист & "1"'))
+        self.assertEqual(sheet.title, 'Лист & "1"')
+        text, day, moment, dec, num, flag, empty, integer = [c.value for c in sheet[2]]
+        # управляющие символы вырезаются, разметка экранируется
+        self.assertEqual(text, '<a&b "c">\tконец')
+        self.assertEqual(day, datetime(2024, 1, 2))
+        self.assertEqual(moment, datetime(2024, 1, 1, 12, 30))
+        self.assertEqual((dec, num, flag, empty, integer), (1.5, 2.25, True, None, 7))
+
+
+class ExcelExportFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer", is_staff=True)
+        dtype = DredgerType.objects.create(name="ЗГМ", code="ZGM")
+        cls.d1 = Dredger.objects.create(inv_number="D-1", type=dtype)
+        cls.d2 = Dredger.objects.create(inv_number="D-2", type=dtype)
+        add_deviation(cls.d1, date(2024, 1, 10), cls.user, description="течь сальника насоса")
+        add_deviation(cls.d1, date(2024, 3, 5), cls.user, description="обрыв кабеля")
+        add_deviation(cls.d1, date(2024, 2, 1), cls.user, description="замена сальников")
+        add_deviation(cls.d2, date(2024, 2, 15), cls.user, description="течь сальника")
+        for dredger, start in [(cls.d1, date(2024, 1, 1)), (cls.d2, date(2024, 2, 1)), (cls.d1, date(2024, 3, 1))]:
+            Repair.objects.create(dredger=dredger, start_date=start, end_date=start,
+                                  created_by=cls.user, updated_by=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, url, **params):
+        resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200)
+        sheet = load_workbook(io.BytesIO(b"".join(resp.streaming_content))).active
+        return [row for row in sheet.iter_rows(min_row=2, values_only=True)]
+
+    def test_deviations_export_is_filtered_and_ordered(self):
+        url = "/api/reports/deviations_excel/"
+        # без параметров — все записи по возрастанию даты
+        self.assertEqual([r[1].date() for r in self.export(url)],
+                         [date(2024, 1, 10), date(2024, 2, 1), date(2024, 2, 15), date(2024, 3, 5)])
+        rows = self.export(url, dredger=self.d1.id, date_after="2024-01-15", ordering="-date")
+        self.assertEqual([(r[1].date(), r[2]) for r in rows],
+                         [(date(2024, 3, 5), "D-1"), (date(2024, 2, 1), "D-1")])
+        rows = self.export(url, search="сальники", dredger=self.d1.id, ordering="date")
+        self.assertEqual([r[5] for r in rows], ["течь сальника насоса", "замена сальников"])
+
+    def test_repairs_export_is_filtered_and_ordered(self):
+        rows = self.export("/api/reports/repairs_excel/", dredger=self.d1.id, ordering="-start_date")
+        self.assertEqual([(r[1], r[2].date()) for r in rows],
+                         [("D-1", date(2024, 3, 1)), ("D-1", date(2024, 1, 1))])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix="reports-test-"))
+class ReportJobTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.addClassCleanup(shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer")
+        cls.other = User.objects.create_user("operator")
+        dredger = Dredger.objects.create(inv_number="D-1", type=DredgerType.objects.create(name="ЗГМ", code="ZGM"))
+        add_deviation(dredger, date(2024, 1, 10), cls.user)
+        add_deviation(dredger, date(2024, 2, 10), cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, client=None, **params):
+        return (client or self.client).post("/api/reports/jobs/",
+                                            {"report_type": "deviations", "params": params}, format="json")
+
+    def work(self):
+        call_command("report_worker", "--once", stdout=io.StringIO())
+
+    def test_enqueue_dedupes_and_reuses_ready_file(self):
+        first = self.post(date_after="2024-02-01")
+        self.assertEqual((first.status_code, first.data["status"]), (202, ReportJob.PENDING))
+        self.assertEqual(self.post(date_after="2024-02-01").data["id"], first.data["id"])
+        self.assertNotEqual(self.post(date_after="2024-01-01").data["id"], first.data["id"])
+
+        self.work()
+        self.assertFalse(ReportJob.objects.exclude(status=ReportJob.DONE).exists())
+        again = self.post(date_after="2024-02-01")
+        self.assertEqual((again.status_code, again.data["id"]), (200, first.data["id"]))
+
+        resp = self.client.get(f"/api/reports/jobs/{first.data['id']}/download/")
+        self.assertEqual(resp.status_code, 200)
+        sheet = load_workbook(io.BytesIO(b"".join(resp.streaming_content))).active
+        self.assertEqual(sheet.max_row, 2)                 # заголовок + одно отклонение
+
+    def test_jobs_are_visible_to_their_author_only(self):
+        job_id = self.post().data["id"]
+        self.work()
+        other = APIClient()
+        other.force_authenticate(self.other)
+        self.assertEqual(other.get(f"/api/reports/jobs/{job_id}/").status_code, 404)
+        self.assertEqual(other.get(f"/api/reports/jobs/{job_id}/download/").status_code, 404)
+
+        # тот же отчёт другим пользователем — своя задача на готовый файл, без пересборки
+        resp = self.post(other)
+        self.assertEqual((resp.status_code, resp.data["status"]), (200, ReportJob.DONE))
+        self.assertNotEqual(resp.data["id"], job_id)
+        self.assertEqual(other.get(f"/api/reports/jobs/{resp.data['id']}/download/").status_code, 200)
+
+        staff = APIClient()
+        staff.force_authenticate(User.objects.create_user("admin", is_staff=True))
+        self.assertEqual(staff.get(f"/api/reports/jobs/{job_id}/").status_code, 200)
+
+    def test_claim_skips_job_taken_by_another_worker(self):
+        job = enqueue("deviations", {}, self.user)
+        original = ReportJob.objects.filter
+
+        def racing_filter(*args, **kwargs):
+            if kwargs.get("id") == job.pk:          # другой воркер успел между выборкой и UPDATE
+                original(id=job.pk).update(status=ReportJob.RUNNING, started_at=timezone.now())
+            return original(*args, **kwargs)
+
+        with mock.patch.object(ReportJob.objects, "filter", side_effect=racing_filter):
+            self.assertIsNone(claim_next())
+        self.assertEqual(ReportJob.objects.get(pk=job.pk).status, ReportJob.RUNNING)
+
+        second = enqueue("deviations", {"dredger": "1"}, self.user)
+        self.assertEqual(claim_next(), second)
+        self.assertIsNone(claim_next())
+
+    def test_stale_running_job_is_expired(self):
+        job = enqueue("deviations", {}, self.user)
+        ReportJob.objects.filter(pk=job.pk).update(status=ReportJob.RUNNING,
+                                                   started_at=timezone.now() - timedelta(hours=2))
+        fresh = enqueue("deviations", {}, self.user)
+        self.assertNotEqual(fresh.pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (ReportJob.FAILED, "Worker timed out"))
+
+        # зависшая задача не мешает воркеру: claim_next тоже её снимает
+        ReportJob.objects.filter(pk=fresh.pk).update(status=ReportJob.RUNNING,
+                                                     started_at=timezone.now() - timedelta(hours=2))
+        self.assertIsNone(claim_next())
+        self.assertEqual(ReportJob.objects.get(pk=fresh.pk).status, ReportJob.FAILED)
+
+    def test_failure_is_recorded(self):
+        job_id = self.post().data["id"]
+        with mock.patch("apps.reports.jobs.build_file", side_effect=OSError("disk full")), \
+                self.assertLogs("apps.reports.jobs", "ERROR"):
+            self.work()
+        resp = self.client.get(f"/api/reports/jobs/{job_id}/")
+        self.assertEqual((resp.data["status"], resp.data["error"]), (ReportJob.FAILED, "disk full"))
+        self.assertEqual(self.client.get(f"/api/reports/jobs/{job_id}/download/").status_code, 409)
+
+    def test_download_of_missing_file(self):
+        job_id = self.post().data["id"]
+        self.work()
+        os.remove(ReportJob.objects.get(pk=job_id).file.path)
+        self.assertEqual(self.client.get(f"/api/reports/jobs/{job_id}/download/").status_code, 410)
+        # устаревший файл не считается готовым — отчёт ставится заново
+        self.assertEqual(self.post().status_code, 202)
+
+
+class ColumnarExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer")
+        dtype = DredgerType.objects.create(name="ЗГМ", code="ZGM")
+        cls.d1 = Dredger.objects.create(inv_number="D-1", type=dtype)
+        cls.d2 = Dredger.objects.create(inv_number="D-2", type=dtype)
+        cls.pump = SparePart.objects.create(code="P-1", name="Насос, «главный»", norm_hours=1000)
+        cls.motor = SparePart.objects.create(code="M-1", name="Двигатель", norm_hours=2000)
+        cls.c1 = ComponentInstance.objects.create(part=cls.pump, serial_number="SN-1", current_dredger=cls.d1)
+        cls.c2 = ComponentInstance.objects.create(part=cls.motor, serial_number="SN-2", current_dredger=cls.d2)
+        for dredger, comp, start, hours in [(cls.d1, cls.c1, date(2024, 1, 1), 120),
+                                            (cls.d2, cls.c2, date(2024, 2, 1), 80)]:
+            repair = Repair.objects.create(dredger=dredger, start_date=start, end_date=start,
+                                           notes="строка 1\nстрока 2", created_by=cls.user, updated_by=cls.user)
+            RepairItem.objects.create(repair=repair, component=comp, hours=hours)
+            ComponentHistory.objects.create(component=comp, repair=repair, source=ComponentHistory.REPAIR,
+                                            hours_delta=hours, total_hours=hours,
+                                            created_at=timezone.make_aware(datetime(start.year, start.month, 1)))
+        add_deviation(cls.d1, date(2024, 1, 5), cls.user, description='течь, "сальник"')
+        add_deviation(cls.d2, date(2024, 2, 5), cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def csv_rows(self, dataset, **params):
+        resp = self.client.get(f"/api/reports/export/{dataset}.csv", params)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Disposition"], f'attachment; filename="{dataset}.csv"')
+        return list(csv.DictReader(io.StringIO(b"".join(resp.streaming_content).decode())))
+
+    def test_csv_round_trip(self):
+        repairs = self.csv_rows("repairs")
+        self.assertEqual([(r["dredger"], r["start_date"], r["notes"]) for r in repairs],
+                         [("D-1", "2024-01-01", "строка 1\nстрока 2"), ("D-2", "2024-02-01", "строка 1\nстрока 2")])
+        items = self.csv_rows("repair_items")
+        self.assertEqual([(r["serial_number"], r["part_name"], r["hours"]) for r in items],
+                         [("SN-1", "Насос, «главный»", "120"), ("SN-2", "Двигатель", "80")])
+        deviations = self.csv_rows("deviations")
+        self.assertEqual([(r["dredger"], r["description"]) for r in deviations],
+                         [("D-1", 'течь, "сальник"'), ("D-2", "—")])
+        history = self.csv_rows("component_history")
+        self.assertEqual([(r["serial_number"], r["dredger"], r["hours_delta"]) for r in history],
+                         [("SN-1", "D-1", "120"), ("SN-2", "D-2", "80")])
+
+    def test_filters_pass_through(self):
+        self.assertEqual([r["serial_number"] for r in self.csv_rows("repair_items", dredger=self.d2.id)], ["SN-2"])
+        self.assertEqual([r["serial_number"] for r in self.csv_rows("repair_items", part=self.pump.id)], ["SN-1"])
+        self.assertEqual([r["serial_number"] for r in self.csv_rows("repair_items", start_date="2024-01-15")],
+                         ["SN-2"])
+        self.assertEqual([r["part_code"] for r in self.csv_rows("component_history", component=self.c1.id)],
+                         ["P-1"])
+        self.assertEqual([r["part_code"] for r in self.csv_rows("component_history", date_after="2024-01-15")],
+                         ["M-1"])
+        self.assertEqual([r["dredger"] for r in self.csv_rows("deviations", dredger=self.d1.id)], ["D-1"])
+
+    def test_bad_format_and_filter(self):
+        self.assertEqual(self.client.get("/api/reports/export/repairs.xml").status_code, 404)
+        self.assertEqual(self.client.get("/api/reports/export/repairs.csv", {"dredger": "abc"}).status_code, 400)
+        with mock.patch("apps.reports.views.HAS_PYARROW", False):
+            resp = self.client.get("/api/reports/export/repairs.parquet")
+        self.assertEqual(resp.status_code, 501)
+        # CSV от pyarrow не зависит
+        with mock.patch("apps.reports.views.HAS_PYARROW", False):
+            self.assertEqual(self.client.get("/api/reports/export/repairs.csv").status_code, 200)
+
+    @skipUnless(HAS_PYARROW, "pyarrow не установлен")
+    def test_arrow_and_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        resp = self.client.get("/api/reports/export/repair_items.arrow", {"dredger": self.d1.id})
+        table = pa.ipc.open_stream(b"".join(resp.streaming_content)).read_all()
+        self.assertEqual(table.column("serial_number").to_pylist(), ["SN-1"])
+        self.assertEqual(table.schema.field("hours").type, pa.int64())
+        self.assertEqual(table.schema.field("start_date").type, pa.date32())
+
+        resp = self.client.get("/api/reports/export/component_history.parquet")
+        table = pq.read_table(io.BytesIO(b"".join(resp.streaming_content)))
+        self.assertEqual(table.column("total_hours").to_pylist(), [120, 80])
+        self.assertEqual(str(table.schema.field("created_at").type), "timestamp[us, tz=UTC]")
+
+
+class DeviationTimeseriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer")
+        dtype = DredgerType.objects.create(name="ЗГМ", code="ZGM")
+        cls.d1 = Dredger.objects.create(inv_number="D-1", type=dtype)
+        cls.d2 = Dredger.objects.create(inv_number="D-2", type=dtype)
+        # 2024-01-01 — понедельник
+        for dredger, day, kind in [(cls.d1, date(2024, 1, 1), "mechanical"),
+                                   (cls.d1, date(2024, 1, 1), "electrical"),
+                                   (cls.d2, date(2024, 1, 3), "mechanical"),
+                                   (cls.d1, date(2024, 1, 8), "mechanical"),
+                                   (cls.d2, date(2024, 2, 1), "electrical")]:
+            add_deviation(dredger, day, cls.user, type=kind)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def series(self, **params):
+        resp = self.client.get("/api/reports/deviations/timeseries/", params)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return [tuple(str(v) for v in row.values()) for row in resp.data]
+
+    def test_buckets(self):
+        self.assertEqual(self.series(), [("2024-01-01", "2"), ("2024-01-03", "1"),
+                                         ("2024-01-08", "1"), ("2024-02-01", "1")])
+        self.assertEqual(self.series(bucket="week"), [("2024-01-01", "3"), ("2024-01-08", "1"),
+                                                      ("2024-01-29", "1")])
+        self.assertEqual(self.series(bucket="month"), [("2024-01-01", "4"), ("2024-02-01", "1")])
+
+    def test_group_by_and_filters(self):
+        self.assertEqual(self.series(bucket="month", group_by="type"),
+                         [("2024-01-01", "electrical", "1"), ("2024-01-01", "mechanical", "3"),
+                          ("2024-02-01", "electrical", "1")])
+        self.assertEqual(self.series(bucket="month", group_by="dredger", date_before="2024-01-31"),
+                         [("2024-01-01", "D-1", "3"), ("2024-01-01", "D-2", "1")])
+        self.assertEqual(self.series(bucket="month", dredger=self.d2.id, type="electrical"),
+                         [("2024-02-01", "1")])
+
+    def test_reads_maintained_rollup(self):
+        dev = Deviation.objects.get(dredger=self.d2, date=date(2024, 2, 1))
+        dev.date = date(2024, 1, 9)
+        dev.save()
+        self.assertEqual(self.series(bucket="week"), [("2024-01-01", "3"), ("2024-01-08", "2")])
+        dev.delete()
+        self.assertEqual(self.series(bucket="month"), [("2024-01-01", "4")])
+
+    def test_bad_bucket_or_group(self):
+        resp = self.client.get("/api/reports/deviations/timeseries/", {"bucket": "year"})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get("/api/reports/deviations/timeseries/", {"group_by": "shift"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class WearForecastTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("engineer")
+        dtype = DredgerType.objects.create(name="ЗГМ", code="ZGM")
+        cls.d1 = Dredger.objects.create(inv_number="D-1", type=dtype)
+        cls.d2 = Dredger.objects.create(inv_number="D-2", type=dtype)
+        cls.pump = SparePart.objects.create(code="P-1", name="Насос", norm_hours=1000)
+        cls.motor = SparePart.objects.create(code="M-1", name="Двигатель", norm_hours=1000)
+        cls.cable = SparePart.objects.create(code="C-1", name="Кабель", norm_hours=100_000)
+        cls.now = timezone.make_aware(datetime(2024, 6, 1, 12))
+
+        # свой журнал: 300 ч десять суток назад, сейчас 500 ч → 20 ч/сут
+        cls.own = cls.component(cls.pump, cls.d1, 500, ledger=[(10, 300)])
+        # без журнала, но та же запчасть → медиана по запчасти
+        cls.by_part = cls.component(cls.pump, cls.d2, 100)
+        # без журнала; двигатель на D-2 менялся: снятый отработал 300 ч за 10 суток → 30 ч/сут
+        cls.by_repairs = cls.component(cls.motor, cls.d2, 100)
+        for start, hours in [(date(2024, 1, 1), 0), (date(2024, 1, 11), 300)]:
+            repair = Repair.objects.create(dredger=cls.d2, start_date=start, end_date=start,
+                                           created_by=cls.user, updated_by=cls.user)
+            RepairItem.objects.create(repair=repair, component=cls.component(cls.motor, None, 0), hours=hours)
+        # 1 ч за десять лет — дата за пределами календаря
+        cls.stalled = cls.component(cls.cable, cls.d1, 1, ledger=[(3650, 0)])
+
+    @classmethod
+    def component(cls, part, dredger, hours, ledger=()):
+        comp = ComponentInstance.objects.create(part=part, current_dredger=dredger)
+        for days_ago, total in ledger:
+            ComponentHistory.objects.create(component=comp, hours_delta=total, total_hours=total,
+                                            created_at=cls.now - timedelta(days=days_ago))
+        ComponentInstance.objects.filter(pk=comp.pk).update(total_hours=hours)     # без записи в журнал
+        return comp
+
+    def forecast(self, **kwargs):
+        return {r["component_id"]: r for r in wear_forecast(now=self.now, **kwargs)}
+
+    def test_rate_sources(self):
+        rows = self.forecast()
+        self.assertEqual(set(rows), {self.own.id, self.by_part.id, self.by_repairs.id, self.stalled.id})
+        expected = {
+            self.own.id:        ("own", 20.0, 25, date(2024, 6, 26)),
+            self.by_part.id:    ("part", 20.0, 45, date(2024, 7, 16)),
+            self.by_repairs.id: ("repairs", 30.0, 30, date(2024, 7, 1)),
+        }
+        for comp_id, values in expected.items():
+            row = rows[comp_id]
+            self.assertEqual((row["rate_source"], row["rate_per_day"], row["days_left"], row["forecast_date"]),
+                             values)
+
+    def test_forecast_beyond_calendar_is_null(self):
+        row = self.forecast()[self.stalled.id]
+        self.assertEqual(row["rate_source"], "own")
+        self.assertEqual((row["days_left"], row["forecast_date"]), (None, None))
+
+    def test_endpoint_filters(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        resp = client.get("/api/reports/wear-forecast/", {"dredger": self.d1.id})
+        self.assertEqual(resp.status_code, 200)
+        # null-прогнозы — в конце списка
+        self.assertEqual([r["component_id"] for r in resp.data], [self.own.id, self.stalled.id])
+        resp = client.get("/api/reports/wear-forecast/", {"part": self.motor.id})
+        self.assertEqual([r["component_id"] for r in resp.data], [self.by_repairs.id])
+        self.assertEqual(client.get("/api/reports/wear-forecast/", {"dredger": "x"}).status_code, 400)
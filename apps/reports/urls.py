@@ -1,12 +1,38 @@
-from django.urls import path
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+
 from .views import (
     RepairsExcelView,
     DeviationsExcelView,
     DashboardDataView,
+    DashboardCacheStatsView,
+    ReportJobViewSet,
+    RepairsDataView,
+    RepairItemsDataView,
+    DeviationsDataView,
+    ComponentHistoryDataView,
+    DeviationTimeseriesView,
+    WearForecastView,
+    ReliabilityKpiView,
+    JournalImportView,
 )
 
+router = DefaultRouter()
+router.register("jobs", ReportJobViewSet)
+
 urlpatterns = [
     path("repairs_excel/",    RepairsExcelView.as_view()),
     path("deviations_excel/", DeviationsExcelView.as_view()),
     path("dashboard/",        DashboardDataView.as_view()),
+    path("dashboard/cache-stats/", DashboardCacheStatsView.as_view()),
+    path("deviations/timeseries/", DeviationTimeseriesView.as_view()),
+    path("wear-forecast/",         WearForecastView.as_view()),
+    path("kpi/",                   ReliabilityKpiView.as_view()),
+    path("import/<slug:kind>/",    JournalImportView.as_view()),
+    # аналитические выгрузки: <набор>.csv | .parquet | .arrow
+    path("export/repairs.<slug:fmt>",           RepairsDataView.as_view()),
+    path("export/repair_items.<slug:fmt>",      RepairItemsDataView.as_view()),
+    path("export/deviations.<slug:fmt>",        DeviationsDataView.as_view()),
+    path("export/component_history.<slug:fmt>", ComponentHistoryDataView.as_view()),
+    path("", include(router.urls)),
 ]
@@ -1,118 +1,322 @@
-from collections import OrderedDict, Counter
+from collections import OrderedDict
 from datetime import date, timedelta
-import io
-import pandas as pd
 
 from django.db import models
-from django.http import HttpResponse
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.http import FileResponse, HttpRequest, QueryDict
+from django_filters.rest_framework import DjangoFilterBackend, FilterSet, DateFilter
 
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
+from rest_framework.generics import GenericAPIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
 
 from apps.repairs.models import (
     Repair,
     RepairItem,
     ComponentInstance,
-    Dredger,
+    ComponentHistory,
 )
-from apps.deviations.models import Deviation
+from apps.repairs.views import (
+    RepairFilter, RepairItemFilter, ComponentHistoryFilter, RepairViewSet,
+)
+from apps.deviations.models import Deviation, DeviationDailyCount
+from apps.deviations.views import DeviationFilter, DeviationViewSet
+from apps.core.permissions import IsEngineerOrAdmin
+from . import cache as dashboard_cache
+from .columnar import HAS_PYARROW, WRITERS
+from .excel import XLSX_CONTENT_TYPE, queryset_to_excel
+from .forecast import wear_forecast
+from .kpi import DIMENSIONS as KPI_DIMENSIONS, reliability_kpi
+from .importer import IMPORTERS, read_rows
+from .jobs import enqueue, report_view
+from .models import ReportJob
+from .serializers import ReportJobSerializer
 
-# ───────────────────────── helper: queryset → .xlsx ─────────────────────────
-def queryset_to_excel(qs, columns: OrderedDict[str, str], file_name: str) -> HttpResponse:
-    """Преобразует QuerySet в Excel-файл и возвращает его как attachment."""
-    df = pd.DataFrame(list(qs.values(*columns.keys())))
-    df.rename(columns=columns, inplace=True)
+class ExcelExportMixin:
+    """
+    Общая часть Excel-выгрузок: GET отдаёт файл потоком, а export_queryset()
+    строит тот же QuerySet по сохранённым параметрам — для фоновых задач.
+    """
+    columns: OrderedDict[str, str]
+    file_name: str
 
-    buf = io.BytesIO()
-    df.to_excel(buf, index=False)
-    buf.seek(0)
+    def get(self, request):
+        qs = self.filter_queryset(self.get_queryset())
+        return queryset_to_excel(qs, self.columns, self.file_name)
 
-    resp = HttpResponse(
-        buf,
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
-    resp["Content-Disposition"] = f'attachment; filename="{file_name}"'
-    return resp
+    @classmethod
+    def export_queryset(cls, params: dict):
+        http = HttpRequest()
+        http.method = "GET"
+        http.GET = QueryDict(mutable=True)
+        for key, value in params.items():
+            http.GET.setlist(key, value if isinstance(value, list) else [value])
+        view = cls()
+        view.request = Request(http)
+        view.format_kwarg = None
+        view.args, view.kwargs = (), {}
+        return view.filter_queryset(view.get_queryset())
 
 # ───────────────────────── 1. Excel-экспорт ремонтов ─────────────────────────
-class RepairsExcelView(APIView):
+class RepairsExcelView(ExcelExportMixin, GenericAPIView):
+    """
+    Принимает те же параметры, что и /api/repairs/
+    (dredger, start_date, end_date, status, search, ordering) —
+    фильтрация выполняется в БД через RepairFilter.
+    """
+    queryset = Repair.objects.select_related("dredger")
     permission_classes = [IsAuthenticated]
-
-    def get(self, request):
-        qs = Repair.objects.select_related("dredger").order_by("start_date")
-        cols = OrderedDict([
-            ("id",                   "ID"),
-            ("dredger__inv_number",  "Землесос"),
-            ("start_date",           "Начало"),
-            ("end_date",             "Окончание"),
-            ("notes",                "Примечание"),
-            ("created_by__username", "Автор"),
-        ])
-        return queryset_to_excel(qs, cols, "repairs.xlsx")
+    filterset_class = RepairFilter
+    search_index = RepairViewSet.search_index
+    search_fields = RepairViewSet.search_fields
+    ordering_fields = RepairViewSet.ordering_fields
+    ordering = ("start_date",)
+    file_name = "repairs.xlsx"
+    columns = OrderedDict([
+        ("id",                   "ID"),
+        ("dredger__inv_number",  "Землесос"),
+        ("start_date",           "Начало"),
+        ("end_date",             "Окончание"),
+        ("notes",                "Примечание"),
+        ("created_by__username", "Автор"),
+    ])
 
 # ──────────────────────── 2. Excel-экспорт отклонений ────────────────────────
-class DeviationsExcelView(APIView):
+class DeviationsExcelView(ExcelExportMixin, GenericAPIView):
+    """
+    Принимает те же параметры, что и /api/deviations/
+    (dredger, type, location, date_after, date_before, search, ordering).
+    """
+    queryset = Deviation.objects.select_related("dredger")
     permission_classes = [IsAuthenticated]
+    filterset_class = DeviationFilter
+    search_index = DeviationViewSet.search_index
+    search_fields = DeviationViewSet.search_fields
+    ordering_fields = DeviationViewSet.ordering_fields
+    ordering = ("date",)
+    file_name = "deviations.xlsx"
+    columns = OrderedDict([
+        ("id",                  "ID"),
+        ("date",                "Дата"),
+        ("dredger__inv_number", "Землесос"),
+        ("type",                "Вид"),
+        ("location",            "Участок"),
+        ("description",         "Описание"),
+        ("hours_at_deviation",  "Наработка, ч"),
+    ])
+
+# ────────────────── 2-B. Выгрузки для аналитики (CSV / Parquet / Arrow) ──────────────────
+class ColumnarExportMixin:
+    """
+    GET …/export/<набор>.<csv|parquet|arrow> — плоская таблица с машинными
+    именами столбцов. Фильтры — те же FilterSet'ы, что и у списков.
+    """
+    filter_backends = (DjangoFilterBackend,)
+    columns: OrderedDict[str, str]
+    file_stem: str
+
+    def get(self, request, fmt):
+        if fmt not in WRITERS:
+            return Response({"error": f"Unknown format: {fmt}"}, status=404)
+        writer, needs_pyarrow = WRITERS[fmt]
+        if needs_pyarrow and not HAS_PYARROW:
+            return Response({"error": f"Format {fmt} requires pyarrow"}, status=501)
+        qs = self.filter_queryset(self.get_queryset())
+        return writer(qs, self.columns, f"{self.file_stem}.{fmt}")
+
+
+class RepairsDataView(ColumnarExportMixin, GenericAPIView):
+    queryset = Repair.objects.order_by("start_date", "id")
+    permission_classes = [IsAuthenticated]
+    filterset_class = RepairFilter
+    file_stem = "repairs"
+    columns = OrderedDict([
+        ("id",                   "id"),
+        ("dredger_id",           "dredger_id"),
+        ("dredger__inv_number",  "dredger"),
+        ("dredger__type__code",  "dredger_type"),
+        ("start_date",           "start_date"),
+        ("end_date",             "end_date"),
+        ("notes",                "notes"),
+        ("created_by__username", "created_by"),
+    ])
+
+
+class RepairItemsDataView(ColumnarExportMixin, GenericAPIView):
+    queryset = RepairItem.objects.order_by("repair__start_date", "repair_id", "id")
+    permission_classes = [IsAuthenticated]
+    filterset_class = RepairItemFilter
+    file_stem = "repair_items"
+    columns = OrderedDict([
+        ("id",                          "id"),
+        ("repair_id",                   "repair_id"),
+        ("repair__dredger_id",          "dredger_id"),
+        ("repair__dredger__inv_number", "dredger"),
+        ("repair__start_date",          "start_date"),
+        ("repair__end_date",            "end_date"),
+        ("component_id",                "component_id"),
+        ("component__serial_number",    "serial_number"),
+        ("component__part_id",          "part_id"),
+        ("component__part__code",       "part_code"),
+        ("component__part__name",       "part_name"),
+        ("component__part__norm_hours", "norm_hours"),
+        ("hours",                       "hours"),
+        ("note",                        "note"),
+    ])
+
+
+class DeviationsDataView(ColumnarExportMixin, GenericAPIView):
+    queryset = Deviation.objects.order_by("date", "id")
+    permission_classes = [IsAuthenticated]
+    filterset_class = DeviationFilter
+    file_stem = "deviations"
+    columns = OrderedDict([
+        ("id",                  "id"),
+        ("date",                "date"),
+        ("dredger_id",          "dredger_id"),
+        ("dredger__inv_number", "dredger"),
+        ("type",                "type"),
+        ("location",            "location"),
+        ("last_ppr_date",       "last_ppr_date"),
+        ("hours_at_deviation",  "hours_at_deviation"),
+        ("description",         "description"),
+        ("shift_leader",        "shift_leader"),
+        ("mechanic",            "mechanic"),
+        ("electrician",         "electrician"),
+    ])
 
-    def get(self, request):
-        qs = Deviation.objects.select_related("dredger").order_by("date")
-        cols = OrderedDict([
-            ("id",                  "ID"),
-            ("date",                "Дата"),
-            ("dredger__inv_number", "Землесос"),
-            ("type",                "Вид"),
-            ("location",            "Участок"),
-            ("description",         "Описание"),
-            ("hours_at_deviation",  "Наработка, ч"),
-        ])
-        return queryset_to_excel(qs, cols, "deviations.xlsx")
+
+class ComponentHistoryDataView(ColumnarExportMixin, GenericAPIView):
+    queryset = ComponentHistory.objects.order_by("created_at", "id")
+    permission_classes = [IsAuthenticated]
+    filterset_class = ComponentHistoryFilter
+    file_stem = "component_history"
+    columns = OrderedDict([
+        ("id",                          "id"),
+        ("component_id",                "component_id"),
+        ("component__serial_number",    "serial_number"),
+        ("component__part_id",          "part_id"),
+        ("component__part__code",       "part_code"),
+        ("repair_id",                   "repair_id"),
+        ("repair__dredger__inv_number", "dredger"),
+        ("hours_delta",                 "hours_delta"),
+        ("total_hours",                 "total_hours"),
+        ("created_at",                  "created_at"),
+    ])
+
+# ─────────────────────── 2-A. Фоновые задачи отчётов ────────────────────────
+class ReportJobViewSet(mixins.CreateModelMixin,
+                       mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    """
+    POST /reports/jobs/               {"report_type": "deviations", "params": {...}}
+                                      → 202 (в очереди) или 200 (готовый файл из кэша)
+    GET  /reports/jobs/{id}/          → статус задачи
+    GET  /reports/jobs/{id}/download/ → файл .xlsx
+    Пользователю доступны только свои задачи, staff — все.
+    """
+    queryset = ReportJob.objects.all()
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = ()
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_staff or user.is_superuser:
+            return self.queryset
+        return self.queryset.filter(created_by=user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = enqueue(
+            serializer.validated_data["report_type"],
+            serializer.validated_data.get("params", {}),
+            user=request.user,
+        )
+        code = status.HTTP_200_OK if job.status == ReportJob.DONE else status.HTTP_202_ACCEPTED
+        return Response(self.get_serializer(job).data, status=code)
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != ReportJob.DONE or not job.file:
+            return Response({"error": f"Report is not ready (status: {job.status})"}, status=409)
+        try:
+            fh = job.file.open("rb")
+        except FileNotFoundError:
+            return Response({"error": "Report file has expired"}, status=410)
+        view = report_view(job.report_type)
+        return FileResponse(fh, as_attachment=True, filename=view.file_name,
+                            content_type=XLSX_CONTENT_TYPE)
 
 # ───────────────────────────── 3. Dashboard data ─────────────────────────────
 class DashboardDataView(APIView):
-    """Возвращает сводку для главного дашборда."""
+    """
+    Возвращает сводку для главного дашборда.
+    Результат кэшируется по окну дат (см. apps/reports/cache.py);
+    заголовок X-Cache показывает HIT/MISS.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
+        today = date.today()
+        date_after  = request.GET.get("date_after",  str(today.replace(day=1)))
+        date_before = request.GET.get("date_before", str(today))
+        # today входит в ключ: блоки 3-D и 3-E зависят от текущей даты
+        data, hit = dashboard_cache.get_or_compute(
+            (date_after, date_before, today),
+            lambda: self.build(date_after, date_before, today),
+        )
+        resp = Response(data)
+        resp["X-Cache"] = "HIT" if hit else "MISS"
+        return resp
+
+    @staticmethod
+    def build(date_after, date_before, today) -> dict:
         # 3-A. распределение простоев по видам (за заданный период или с начала месяца по сегодня)
-        date_after  = request.GET.get("date_after",  str(date.today().replace(day=1)))
-        date_before = request.GET.get("date_before", str(date.today()))
-        qs = Deviation.objects.filter(date__range=[date_after, date_before])
-        counts = Counter(qs.values_list("type", flat=True))
+        #      читается из дневной свёртки, а не из журнала
+        counts = dict(DeviationDailyCount.objects
+                      .filter(day__range=[date_after, date_before])
+                      .values("type")
+                      .annotate(n=models.Sum("count"))
+                      .values_list("type", "n"))
         downtime = [
             {"type": "mechanical",    "count": counts.get("mechanical",    0)},
             {"type": "electrical",    "count": counts.get("electrical",    0)},
             {"type": "technological", "count": counts.get("technological", 0)},
         ]
 
-        # 3-B. топ-5 самых изношенных агрегатов
+        # 3-B. топ-5 самых изношенных агрегатов (обход индекса по wear_pct)
         worn = (ComponentInstance.objects
                 .select_related("part", "current_dredger")
-                .exclude(part__norm_hours=0)
-                .annotate(pct=models.F("total_hours") * 100.0 / models.F("part__norm_hours"))
-                .order_by("-pct")[:5])
+                .filter(wear_pct__isnull=False)
+                .order_by("-wear_pct")[:5])
         wear_top = [{
             "dredger": w.current_dredger.inv_number if w.current_dredger else "—",
             "part":    w.part.name,
-            "pct":     round(w.pct, 1),
+            "pct":     round(w.wear_pct, 1),
         } for w in worn]
 
         # 3-C. остаточный ресурс по каждому землесосу (процент оставшегося ресурса у наиболее изношенного узла)
-        dredger_resources = []
-        for d in Dredger.objects.all():
-            comps = (ComponentInstance.objects
-                     .filter(current_dredger=d, part__norm_hours__gt=0)
-                     .annotate(pct=models.F("total_hours") * 100.0 / models.F("part__norm_hours")))
-            if comps:
-                max_pct = max(c.pct for c in comps)      # максимальный % износа
-                dredger_resources.append({
-                    "id": d.id,
-                    "inv_number": d.inv_number,
-                    "remain_pct": round(100 - max_pct, 1),
-                })
+        #      один сгруппированный запрос: MAX(wear_pct) GROUP BY current_dredger
+        resources = (ComponentInstance.objects
+                     .filter(current_dredger__isnull=False, wear_pct__isnull=False)
+                     .values("current_dredger", "current_dredger__inv_number")
+                     .annotate(max_pct=models.Max("wear_pct"))
+                     .order_by("current_dredger"))
+        dredger_resources = [{
+            "id":         r["current_dredger"],
+            "inv_number": r["current_dredger__inv_number"],
+            "remain_pct": round(100 - r["max_pct"], 1),
+        } for r in resources]
 
         # 3-D. землесосы в ремонте (состоянием на сегодня)
-        today = date.today()
         in_progress = (Repair.objects
                        .filter(start_date__lte=today, end_date__gte=today)
                        .select_related("dredger")
@@ -125,10 +329,174 @@ class DashboardDataView(APIView):
                           .select_related("dredger")
                           .values("id", "date", "type", "dredger__inv_number", "description")[:50])
 
-        return Response({
+        return {
             "downtime":            downtime,
             "wear_top":            wear_top,
             "dredger_resources":   dredger_resources,
             "repairs_in_progress": list(in_progress),
             "deviations_24h":      list(deviations_24h),
-        })
+        }
+
+
+class DashboardCacheStatsView(APIView):
+    """Счётчики попаданий/промахов кэша дашборда."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(dashboard_cache.stats())
+
+
+# ─────────────────────── 4. Динамика отклонений (из свёртки) ───────────────────────
+class DeviationRollupFilter(FilterSet):
+    date_after = DateFilter(field_name="day", lookup_expr="gte")
+    date_before = DateFilter(field_name="day", lookup_expr="lte")
+
+    class Meta:
+        model = DeviationDailyCount
+        fields = ["dredger", "type", "location", "date_after", "date_before"]
+
+
+class DeviationTimeseriesView(GenericAPIView):
+    """
+    GET /reports/deviations/timeseries/
+        bucket   = day | week | month          (по умолчанию day)
+        group_by = type | location | dredger   (необязательно)
+        + фильтры dredger, type, location, date_after, date_before
+
+    Читает дневную свёртку DeviationDailyCount: многолетний график —
+    это тысячи строк свёртки, а не весь журнал.
+    """
+    queryset = DeviationDailyCount.objects.all()
+    permission_classes = [IsAuthenticated]
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = DeviationRollupFilter
+
+    BUCKETS = {"day": None, "week": TruncWeek, "month": TruncMonth}
+    GROUPS = {"type": "type", "location": "location", "dredger": "dredger__inv_number"}
+
+    def get(self, request):
+        bucket = request.query_params.get("bucket", "day")
+        group_by = request.query_params.get("group_by") or None
+        if bucket not in self.BUCKETS:
+            return Response({"bucket": f"Expected one of: {', '.join(self.BUCKETS)}"}, status=400)
+        if group_by is not None and group_by not in self.GROUPS:
+            return Response({"group_by": f"Expected one of: {', '.join(self.GROUPS)}"}, status=400)
+
+        trunc = self.BUCKETS[bucket]
+        qs = (self.filter_queryset(self.get_queryset())
+              .annotate(period=trunc("day") if trunc else models.F("day")))
+        keys = ["period"] + ([self.GROUPS[group_by]] if group_by else [])
+        rows = qs.values(*keys).annotate(total=models.Sum("count")).order_by(*keys)
+
+        data = []
+        for r in rows:
+            item = {"period": r["period"]}
+            if group_by:
+                item[group_by] = r[self.GROUPS[group_by]]
+            item["count"] = r["total"]
+            data.append(item)
+        return Response(data)
+
+
+# ───────────────────────── 5. Прогноз выработки ресурса ─────────────────────────
+def _id_list(request, name) -> list[int]:
+    """?name=1,2&name=3 → [1, 2, 3]"""
+    raw = ",".join(request.query_params.getlist(name))
+    return [int(v) for v in raw.split(",") if v.strip()]
+
+
+class WearForecastView(APIView):
+    """
+    GET /reports/wear-forecast/?dredger=1,2&part=5&horizon_days=90&limit=100
+    Дата достижения нормы наработки для каждого установленного агрегата
+    (см. apps/reports/forecast.py). horizon_days — только те, кто выработает
+    ресурс в ближайшие N суток.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            dredgers = _id_list(request, "dredger")
+            parts = _id_list(request, "part")
+            horizon = request.query_params.get("horizon_days")
+            horizon = int(horizon) if horizon else None
+            limit = request.query_params.get("limit")
+            limit = int(limit) if limit else None
+        except ValueError:
+            return Response({"error": "dredger, part, horizon_days and limit must be integers"},
+                            status=400)
+
+        data = wear_forecast(dredger_ids=dredgers, part_ids=parts)
+        if horizon is not None:
+            data = [r for r in data if r["days_left"] is not None and r["days_left"] <= horizon]
+        if limit is not None:
+            data = data[:limit]
+        return Response(data)
+
+
+class ReliabilityKpiView(APIView):
+    """
+    GET /reports/kpi/?group=dredger,month&date_after=2020-01-01&date_before=2024-12-31&dredger=1,2
+    MTBF, MTTR и простой по группам (см. apps/reports/kpi.py).
+    group — любые из dredger, dredger_type, type, location, month
+    (по умолчанию dredger). Результат кэшируется по периоду и параметрам
+    вместе со сводкой дашборда: сбрасывается любой записью в журналы.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        group = [g for g in request.query_params.get("group", "dredger").split(",") if g]
+        unknown = set(group) - set(KPI_DIMENSIONS)
+        if unknown:
+            return Response({"error": f"Unknown group: {', '.join(sorted(unknown))}; "
+                                      f"allowed: {', '.join(KPI_DIMENSIONS)}"}, status=400)
+        try:
+            bounds = [request.query_params.get(p) for p in ("date_after", "date_before")]
+            date_after, date_before = [date.fromisoformat(b) if b else None for b in bounds]
+            dredgers = _id_list(request, "dredger")
+        except ValueError:
+            return Response({"error": "date_after/date_before must be YYYY-MM-DD, dredger — integers"},
+                            status=400)
+
+        group = [g for g in KPI_DIMENSIONS if g in group]
+        data, hit = dashboard_cache.get_or_compute(
+            ("kpi", ",".join(group), date_after, date_before, ",".join(map(str, sorted(dredgers or [])))),
+            lambda: reliability_kpi(group, date_after, date_before, dredgers),
+        )
+        resp = Response(data)
+        resp["X-Cache"] = "HIT" if hit else "MISS"
+        return resp
+
+
+# ───────────────────────── 6. Импорт исторических журналов ─────────────────────────
+class JournalImportView(APIView):
+    """
+    POST /reports/import/<deviations|repairs>/   multipart: file=<.xlsx|.csv>
+        ?dry_run=1            — только проверить
+        ?create_components=1  — ремонты: создавать неизвестные агрегаты
+    Ответ: {"total", "created", "failed", "dry_run", "errors": [{"row", "errors"}]}
+    (в ответ попадают первые max_errors ошибок; полный отчёт —
+    команда import_journal --errors).
+    """
+    permission_classes = [IsEngineerOrAdmin]
+    parser_classes = [MultiPartParser]
+    max_errors = 1000
+
+    def post(self, request, kind):
+        if kind not in IMPORTERS:
+            return Response({"error": f"Unknown journal: {kind}"}, status=404)
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"error": "file is required"}, status=400)
+
+        flags = {k: request.query_params.get(k) in ("1", "true") for k in ("dry_run", "create_components")}
+        kwargs = {"create_components": flags["create_components"]} if kind == "repairs" else {}
+        importer = IMPORTERS[kind](request.user, dry_run=flags["dry_run"], **kwargs)
+        try:
+            report = importer.run(read_rows(upload, upload.name))
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+
+        report["errors_truncated"] = len(report["errors"]) > self.max_errors
+        report["errors"] = report["errors"][:self.max_errors]
+        return Response(report)
@@ -63,6 +63,25 @@ DATABASES = {
     }
 }
 
+# ──────────────────────────── кэш ─────────────────────────────────
+# LocMemCache — у каждого процесса свой кэш. При нескольких воркерах WSGI
+# используйте общий FileBasedCache, чтобы сброс кэша дашборда был виден всем:
+#   "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+#   "LOCATION": BASE_DIR / "cache",
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "dredger-journal",
+    }
+}
+# время жизни сводки дашборда, с (сброс по записи происходит раньше)
+DASHBOARD_CACHE_TIMEOUT = 5 * 60
+# сколько секунд переиспользуется COUNT(*) журналов при пагинации
+PAGINATION_COUNT_TIMEOUT = 60
+# срок жизни состава типа землесоса в памяти процесса, с
+# (в процессе, изменившем справочник, сброс сигналом — сразу)
+BOM_CACHE_TIMEOUT = 10 * 60
+
 # ──────────────────────────── шаблоны ─────────────────────────────
 TEMPLATES = [
     {
@@ -90,7 +109,8 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_FILTER_BACKENDS": (
         "django_filters.rest_framework.DjangoFilterBackend",
-        "rest_framework.filters.SearchFilter",
+        # ?search= — FTS5 для вьюх с search_index, иначе LIKE (apps/core/search.py)
+        "apps.core.search.FullTextSearchFilter",
         "rest_framework.filters.OrderingFilter",
     ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
@@ -137,6 +157,12 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# ──────────────────────────── отчёты ──────────────────────────────
+# сколько секунд готовый файл фоновой задачи отдаётся повторно без пересборки
+REPORT_CACHE_TTL = 15 * 60
+# задача дольше стольких секунд в статусе running считается зависшей (воркер упал)
+REPORT_JOB_TIMEOUT = 30 * 60
+
 # ──────────────────────────── локаль / время ─────────────────────
 LANGUAGE_CODE = "ru"
 TIME_ZONE = "Europe/Kyiv"
@@ -2,14 +2,24 @@ import { useEffect, useState } from "react";
 import api from "../api/axios";
 
 interface Row {
-  repair_id: number;
-  dredger: string;
-  start_date: string;
-  end_date: string;
+  id: number;
+  created_at: string;
+  source: "initial" | "repair" | "manual" | "telemetry";
   hours: number;
-  note: string;
+  total_hours: number;
+  repair_id: number | null;
+  dredger: string | null;
+  start_date: string | null;
+  end_date: string | null;
 }
 
+const SOURCE: Record<Row["source"], string> = {
+  initial:   "Начальный остаток",
+  repair:    "Ремонт",
+  manual:    "Ручная правка",
+  telemetry: "Телеметрия",
+};
+
 export default function HistoryModal({
   componentId,
   onClose,
@@ -22,7 +32,7 @@ export default function HistoryModal({
   useEffect(() => {
     api
       .get(`/repairs/components/${componentId}/history/`)
-      .then((r) => setRows(r.data));
+      .then((r) => setRows(r.data.results ?? r.data));
   }, [componentId]);
 
   return (
@@ -33,23 +43,25 @@ export default function HistoryModal({
         <table className="w-full border shadow-sm mb-4">
           <thead className="bg-gray-100">
             <tr>
+              <th className="border px-2 py-1">Дата</th>
+              <th className="border px-2 py-1">Источник</th>
               <th className="border px-2 py-1">Ремонт</th>
-              <th className="border px-2 py-1">Землесос</th>
-              <th className="border px-2 py-1">Период</th>
               <th className="border px-2 py-1">Часы</th>
-              <th className="border px-2 py-1">Прим.</th>
+              <th className="border px-2 py-1">Итого</th>
             </tr>
           </thead>
           <tbody>
             {rows.map((r) => (
-              <tr key={r.repair_id} className="border-t">
-                <td className="px-2 py-1 text-center">{r.repair_id}</td>
-                <td className="px-2 py-1 text-center">{r.dredger}</td>
+              <tr key={r.id} className="border-t">
+                <td className="px-2 py-1 text-center">
+                  {new Date(r.created_at).toLocaleDateString()}
+                </td>
+                <td className="px-2 py-1 text-center">{SOURCE[r.source] ?? r.source}</td>
                 <td className="px-2 py-1 text-center">
-                  {r.start_date} — {r.end_date}
+                  {r.repair_id ? `№${r.repair_id} · ${r.dredger} (${r.start_date} — ${r.end_date})` : "—"}
                 </td>
-                <td className="px-2 py-1 text-center">{r.hours}</td>
-                <td className="px-2 py-1">{r.note}</td>
+                <td className="px-2 py-1 text-center">{r.hours > 0 ? `+${r.hours}` : r.hours}</td>
+                <td className="px-2 py-1 text-center">{r.total_hours}</td>
               </tr>
             ))}
             {rows.length === 0 && (
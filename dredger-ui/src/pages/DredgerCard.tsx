@@ -135,25 +135,25 @@ function ComponentsTab() {
       return;
     }
     try {
-      await api.post(`/dredgers/${id}/add_component/`, { component_id: selectedComponent });
-      const res = await api.get(`/dredgers/${id}/template/`);
-      setRows(res.data);
+      const res = await api.post(`/dredgers/${id}/swap/`, { install: [Number(selectedComponent)] });
+      setRows(res.data.template);
       setIsAddDialogOpen(false);
       setSelectedComponent("");
       setError("");
     } catch (err: any) {
-      setError(err.response?.data?.detail || "Ошибка при добавлении агрегата");
+      if (err.response?.data?.template) setRows(err.response.data.template);
+      setError(err.response?.data?.conflicts?.[0]?.error || "Ошибка при добавлении агрегата");
     }
   };
 
   const handleRemoveComponent = async (componentId: number) => {
     if (!window.confirm("Вы уверены, что хотите снять этот агрегат?")) return;
     try {
-      await api.post(`/dredgers/${id}/remove_component/`, { component_id: componentId });
-      const res = await api.get(`/dredgers/${id}/template/`);
-      setRows(res.data);
+      const res = await api.post(`/dredgers/${id}/swap/`, { remove: [componentId] });
+      setRows(res.data.template);
     } catch (err: any) {
-      alert(err.response?.data?.detail || "Ошибка при снятии агрегата");
+      if (err.response?.data?.template) setRows(err.response.data.template);
+      alert(err.response?.data?.conflicts?.[0]?.error || "Ошибка при снятии агрегата");
     }
   };
 
@@ -90,15 +90,8 @@ export default function RepairForm() {
       
       // Загружаем доступные компоненты для каждой запчасти
       const partIds = templateData.map((t: TemplateRow) => t.part_id);
-      api.get("/available-components/", { params: { part_ids: partIds.join(",") } })
-        .then(response => {
-          const componentsByPart = response.data.reduce((acc: any, comp: any) => {
-            if (!acc[comp.part_id]) acc[comp.part_id] = [];
-            acc[comp.part_id].push(comp);
-            return acc;
-          }, {});
-          setAvailableComponents(componentsByPart);
-        });
+      api.get("/available-components/", { params: { part_ids: partIds.join(","), group: "part" } })
+        .then(response => setAvailableComponents(response.data));
     });
   }, [dredgerId]);
 